@@ -1,577 +1,4113 @@
-###################################
-# SFCN_MangroveMarsh_Tables_Figures.py
-###################################
-# Description:  Routine to Summarize Mangrove Marsh Monitoring data including output tables and figures for annual reporting.
-
-# Code performs the following routines:
-# 1) Summaries the Event Average Distance from Ground Truth values.  This includes Averge, Standard Error, Confidence Interval for defined %, and Maximum and Minimum values
-# by event/segment replicating the 'Mangrove-Marsh Ecotone Monitoring' SOP8-1 summary table. Confidence Intervals are defined using a Student T Distribution with Student T defiend as: np.abs(t.ppf((1 - confidence) / 2, dof)).
-
-# 2) Summarize via a CrossTab/Pivot Table the Absolute Vegetation by Region, Location Name (i.e. Point on Segment), by Community Type, and by Taxon (Scale is Point - single value).
-# Routine replicates the 'Mangrove-Marsh Ecotone Monitoring' SOP8-2 summary table.
-
-# 3) Calculates the Absolute Cover By Region, By Community, By Strata - data is from table  'tbl_MarkerData'. Output replicates the 'Mangrove-Marsh Ecotone Monitoring' SOP8-3 summary Figure.
-
-# Output:
-# An excel spreadsheet with Tables SOP8-1 (i.e. Average Distance from Ground Truth Values), Tables SOP8-2 By region (three total) with the the Absolute Vegetation by Region, Location Name (i.e. Point on Segment),
-# by Community Type, and by Taxon, and a pdf file withe Figures SOP8-3 by region (three total) with the Absolute Cover By Region, By Community, By Strata.
-
-# Dependencies:
-# Python version 3.9
-# Pandas
-# Scipy
-
-# Python/Conda environment - py39
-# Created by: Kirk Sherrill - Data Manager South Florida Caribbean Network (Detail) - Inventory and Monitoring Division - National Park Service
-# Date Created: March 2023
-
-#######################################
-# Start of Parameters requiring set up.
-#######################################
-#Define Inpurt Parameters:
-
-#Mangrove Marsh Access Database and location
-inDB = r'C:\SFCN\Monitoring\Mangrove_Marsh_Ecotone\data\SFCN_Mangrove_Marsh_Ecotone_tabular_20230318.mdb'
-
-#Confidence Interval
-confidence = 0.95
-
-#Directory Information
-outputDir = r'C:\SFCN\Monitoring\Mangrove_Marsh_Ecotone\analysis\Python\2020'  #Output Directory
-workspace = r'C:\SFCN\Monitoring\Periphyton\Data\HY2021\Tp\workspace'  # Workspace Folder
-monitoringYear = 2020  #Monitoring Year of Mangrove Marsh data being processing
-
-#Get Current Date
-from datetime import date
-dateString = date.today().strftime("%Y%m%d")
-
-#Define Output Name for log file
-outName = "MangroveMarsh_AnnualTablesFigs_" + str(monitoringYear) + "_" + dateString  # Name given to the exported pre-processed
-outPDF = outputDir + "\\" + outName + ".pdf"
-
-#Workspace Location
-workspace = r'C:\SFCN\Monitoring\Mangrove_Marsh_Ecotone\analysis\Python\workspace'
-
-#Logifile name
-logFileName = workspace + "\\" + outName + "_logfile.txt"
-
-#######################################
-## Below are paths which are hard coded:
-#######################################
-#Import Required Libraries
-import pandas as pd
-import sys
-from datetime import date
-
-import os
-
-import traceback
-import numpy as np
-from scipy.stats import t
-
-import matplotlib as mp
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages #Imort PdfPages from MatplotLib
-
-import pyodbc
-pyodbc.pooling = False  #So you can close the pydobx connection
-
-##################################
-
-##################################
-# Checking for directories and create Logfile
-##################################
-if os.path.exists(workspace):
-    pass
-else:
-    os.makedirs(workspace)
-
-# Check for logfile
-if os.path.exists(logFileName):
-    pass
-else:
-    logFile = open(logFileName, "w")  # Creating index file if it doesn't exist
-    logFile.close()
-#################################################
-
-# Function to Get the Date/Time
-def timeFun():
-    from datetime import datetime
-    b = datetime.now()
-    messageTime = b.isoformat()
-    return messageTime
-
-def main():
-    try:
-
-        ########################
-        #Functions for Table 8-1
-        ########################
-        #Pull Data from Database for table 'tbl_MarkerData'
-        outVal = defineRecords_MarkerData()
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function defineRecords_MarkerData - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function defineRecords_MarkerData")
-            outDF = outVal[1]
-
-        #Summarize Data from tbl_MarkerData into format for Table 8-1 in SFCN Mangrove Marsh SOP.
-        outVal = SummarizeFigure8_1(outDF)
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function SummarizeFigure8_1 - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function SummarizeFigure8_1")
-
-        ########################
-        #Functions for Table 8-2  - Absolute Cover Species Data by Transect and Point By Region
-        ########################
-
-        #Summarize via a CrossTab/Pivot Table the Absolute Vegetation by Location Name (i.e. Point on Segment), by Community Type and Vegetation Type (Scale is Point - single value)
-        outVal = defineRecords_VegCoverByPointAbsolute()
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function defineRecords_VegCoverByPointAbsolute - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function defineRecords_VegCoverByPointAbsolute")
-
-        messageTime = timeFun()
-        scriptMsg = "Successfully Finished Processing - SFCN_MangroveMash_Tables_Figures - " + messageTime
-        print(scriptMsg)
-        logFile = open(logFileName, "a")
-        logFile.write(scriptMsg + "\n")
-        logFile.close()
-
-        ########################
-        # Functions for Figure 8-3  - Calculate the Absolute Cover By Region, By Community, By Strata - data is from table  'tbl_MarkerData'
-        ########################
-
-        #Pull Stratum Cover Data by point in 'tbl_MarkerData'
-        outVal = defineRecords_CoverByStratum()
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function defineRecords_CoverByStratum - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function defineRecords_CoverByStratum")
-            outDF = outVal[1]
-
-        #Figures for Marker Point Stratum By Region - Stacked Top Marsh, Botom Mangrove
-        outVal = figure_CoverByStratum(outDF)
-        if outVal.lower() != "success function":
-            print("WARNING - Function figure_CoverByStratum - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function figure_CoverByStratum")
-
-        messageTime = timeFun()
-        scriptMsg = "Successfully Finished Processing - SFCN_MangroveMash_Tables_Figures - " + messageTime
-        print(scriptMsg)
-        logFile = open(logFileName, "a")
-        logFile.write(scriptMsg + "\n")
-        logFile.close()
-
-
-    except:
-
-        messageTime = timeFun()
-        scriptMsg = "WARNING Script Failed - " + messageTime
-        print (scriptMsg)
-        logFile = open(logFileName, "a")
-        logFile.write(scriptMsg + "\n")
-        traceback.print_exc(file=sys.stdout)
-        logFile.close()
-
-#Function to define the Student’s t distribution
-def defineStudentT(dof):
-    try:
-
-        x = np.abs(t.ppf((1 - confidence) / 2, dof))
-
-        return x
-    except:
-        scriptMsg = "Exiting Error - defineStudentT"
-        print(scriptMsg)
-        traceback.print_exc(file=sys.stdout)
-        return "Failed"
-
-#Summarize Mangrove Marsh Ecotone Values - Average Distance, Standard Error, Lower 95% Confidence Limit, Upper 95% Confidence Limit, Max and Min Values
-#Output DataFrame with the summary values by Segment
-def SummarizeFigure8_1(inDF):
-    try:
-
-        # Define Average Distance Meters
-        out_GroupByMean = inDF.groupby(['Event_Group_ID', 'Region', 'Segment']).mean()
-        outDf_GroupByMean = out_GroupByMean.reset_index()
-        # Rename
-        outDf_GroupByMean.rename(columns={'Distance': 'AverageDist_M'}, inplace=True)
-
-        # Create output DataFrame - will be joining to this
-        outDf_8pt1 = outDf_GroupByMean[['Event_Group_ID', 'Region', 'Segment', 'AverageDist_M']]
-
-        # Define Standard Error
-        out_GroupBySE = inDF.groupby(['Event_Group_ID', 'Segment']).sem()
-        outDf_GroupBySE = out_GroupBySE.reset_index()
-        # Rename
-        outDf_GroupBySE.rename(columns={'Distance': 'StandardError'}, inplace=True)
-
-        # Define the Event_Group_ID, Event_ID, Site_ID and Visit Type fields via a join on 'Site_Name and Site ID fields
-        outDf_8pt1_j1 = pd.merge(outDf_8pt1, outDf_GroupBySE, how='inner', left_on=('Event_Group_ID', 'Segment'), right_on=('Event_Group_ID', 'Segment'), suffixes=(None, "_Right"))
-
-        # Delete fields 'Segment_Right' and Assesment
-        outDf_8pt1_j1.drop(columns=['Assessment'], inplace=True)
-
-        # Add a Count Field
-        out_GroupByCount = inDF.groupby(['Event_Group_ID', 'Segment'])['Distance'].count()
-        outDf_GroupByCount = out_GroupByCount.reset_index()
-        #Rename
-        outDf_GroupByCount.rename(columns={'Distance': 'RecCount'}, inplace=True)
-
-        # Join Count to Mean and Standard Error
-        outDf_8pt1_j2 = pd.merge(outDf_8pt1_j1, outDf_GroupByCount, how='inner', left_on=('Event_Group_ID', 'Segment'), right_on=('Event_Group_ID', 'Segment'), suffixes=(None, "_Right"))
-
-        #Create Degree of Freedom field (N-1)
-        outDf_8pt1_j2['DOF'] = outDf_8pt1_j2['RecCount'] - 1
-
-        ##################################
-        #Calculate the Confidence Interval
-        ##################################
-        outVal = calc_CI(outDf_8pt1_j2, confidence)
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function calc_CI95 - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function calc_CI95")
-            outDF2 = outVal[1]
-
-        # Calculate the Minimum Difference
-        out_GroupByMin = inDF.groupby(['Event_Group_ID', 'Segment'])['Distance'].min()
-        outDf_GroupByMin = out_GroupByMin.reset_index()
-        outDf_GroupByMin.rename(columns={'Distance': 'MinDifference'}, inplace=True)
-        # Join with working Data Frame
-        outDf_8pt1_j3= pd.merge(outDF2, outDf_GroupByMin, how='inner', left_on=('Event_Group_ID', 'Segment'), right_on=('Event_Group_ID', 'Segment'), suffixes=(None, "_Right"))
-        del outDF2
-
-        #Calculate the Maximum Difference
-        out_GroupByMax = inDF.groupby(['Event_Group_ID', 'Segment'])['Distance'].max()
-        outDf_GroupByMax = out_GroupByMax.reset_index()
-        outDf_GroupByMax.rename(columns={'Distance': 'MaxDifference'}, inplace=True)
-        # Join with working Data Frame
-        outDf_8pt1_j4 = pd.merge(outDf_8pt1_j3, outDf_GroupByMax, how='inner', left_on=('Event_Group_ID', 'Segment'), right_on=('Event_Group_ID', 'Segment'), suffixes=(None, "_Right"))
-        del outDf_8pt1_j3
-
-        #Sort by Numeric Segment Number
-        outDf_8pt1_j4['SortField'] = outDf_8pt1_j4['Segment'].str.replace('Segment_', '')
-        #Convert Sort Field to Integer
-        outDf_8pt1_j4['SortField'] = pd.to_numeric(outDf_8pt1_j4['SortField'], errors='coerce', downcast='integer')
-        #Sort on Segment Number
-        outDf_8pt1_j4.sort_values(by=['SortField'], inplace = True)
-        #Set index Field to Sort Field
-        outDf_8pt1_j4.set_index('SortField', inplace=True)
-        #Drop 'DOF' and t_crit fields
-        outDf_8pt1_j4.drop(columns=['DOF','t_crit'], inplace=True)
-
-        #Export Table to Excel
-        dateString = date.today().strftime("%Y%m%d")
-        # Define Export .csv file
-        outFull = outputDir + "\MangroveMarsh_Export_" + dateString + ".xlsx"
-
-        #Export
-        outDf_8pt1_j4.to_excel(outFull, sheet_name = 'SOP8-1', index=False)
-
-        messageTime = timeFun()
-        scriptMsg=  ("Successfully Exported Table 8-1 to: " + outFull + " - " + messageTime)
-        print(scriptMsg)
-
-        logFile = open(logFileName, "a")
-        logFile.write(scriptMsg + "\n")
-        logFile.close()
-
-        return "success function", outDf_8pt1_j4
-
-    except:
-        messageTime = timeFun()
-        print("Error on SummarizeFigure8_1 Function - " + messageTime)
-        traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'SummarizeFigure8_1'"
-
-
-#Calculate the Confidence Interval Upper 95% and Lower 95% usinga Sutdents T Distribution
-#Student T Distribution is defined as t_crit = np.abs(t.ppf((1-confidence)/2,dof))
-#CI Upper and lower is: (Mean - Standard Deviation *t_crit/np.sqrt(n))  and  (Mean + Standard Deviation *t_crit/np.sqrt(n))   where n = number of records
-def calc_CI(inDF, confidence):
-
-    try:
-        #Calculate the Student T's Distribution
-        inDF['t_crit'] = inDF.apply(lambda x: defineStudentT(x['DOF']), axis=1)
-
-        #inDF['t_crit'] = np.abs(t.ppf((1 - confidence) / 2, ['dof']))
-        #Convert CI to Str
-        confidenceStr = str(confidence)
-
-        #Calculate Lower Confidence Interval
-        inDF['LowerCI_' + str(confidenceStr)] = inDF['AverageDist_M'] - inDF['StandardError'] * inDF['t_crit'] / np.sqrt(inDF['RecCount'])
-
-        # Calculate Upper Confidence Interval
-        inDF['UpperCI_' + str(confidenceStr)] = inDF['AverageDist_M'] + inDF['StandardError'] * inDF['t_crit'] / np.sqrt(inDF['RecCount'])
-
-        return "success function", inDF
-
-    except:
-        messageTime = timeFun()
-        print("Error on calc_CI Function - " + messageTime)
-        traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'calc_CI95'"
-
-
-# Summarize via a CrossTab/Pivot Table the Absolute Cover By Region, Community, Strata and Taxon across point locations
-#Export By Region
-def defineRecords_VegCoverByPointAbsolute():
-    try:
-
-        dateString = date.today().strftime("%Y%m%d")
-        # Process By Region
-        regionlList = ['Turner River', 'Shark Slough', 'Taylor Slough']
-        for count, region in enumerate(regionlList):
-
-            inQuery = "TRANSFORM Sum(IIf([VegetationType]='Tree' And [CommunityType]='Mangrove',([MangroveSide_Cover_Overall])*([MangroveSide_Cover_Tree]/100)*([PercentCover]/100),IIf([VegetationType]='Shrub' And"\
-                " [CommunityType]='Mangrove',([MangroveSide_Cover_Overall])*([MangroveSide_Cover_Shrub]/100)*([PercentCover]/100),IIf([VegetationType]='Herb' And"\
-                " [CommunityType]='Mangrove',([MangroveSide_Cover_Overall])*([MangroveSide_Cover_Herb]/100)*([PercentCover]/100),IIf([VegetationType]='Tree' And"\
-                " [CommunityType]='Marsh',([MarshSide_Cover_Overall])*([MarshSide_Cover_Tree]/100)*([PercentCover]/100),IIf([VegetationType]='Shrub' And"\
-                " [CommunityType]='Marsh',([MarshSide_Cover_Overall])*([MarshSide_Cover_Shrub]/100)*([PercentCover]/100),IIf([VegetationType]='Herb' And"\
-                " [CommunityType]='Marsh',([MarshSide_Cover_Overall])*([MarshSide_Cover_Herb]/100)*([PercentCover]/100),-999))))))) AS AbsolutePercCover"\
-                " SELECT tbl_Locations.Region, tbl_MarkerData_Vegetation.CommunityType, tbl_MarkerData_Vegetation.VegetationType, tlu_Vegetation.ScientificName"\
-                " FROM tbl_Locations INNER JOIN (((tbl_Event_Group INNER JOIN tbl_Events ON (tbl_Event_Group.Event_Group_ID = tbl_Events.Event_Group_ID) AND"\
-                " (tbl_Event_Group.Event_Group_ID = tbl_Events.Event_Group_ID)) INNER JOIN tbl_MarkerData ON (tbl_Events.Event_ID = tbl_MarkerData.Event_ID) AND"\
-                " (tbl_Events.Event_ID = tbl_MarkerData.Event_ID)) INNER JOIN (tbl_MarkerData_Vegetation LEFT JOIN tlu_Vegetation ON tbl_MarkerData_Vegetation.SpeciesCode = tlu_Vegetation.SpeciesCode)"\
-                " ON (tbl_MarkerData.Point_ID = tbl_MarkerData_Vegetation.Point_ID) AND (tbl_MarkerData.Point_ID = tbl_MarkerData_Vegetation.Point_ID)) ON tbl_Locations.Location_ID"\
-                " = tbl_Events.Location_ID WHERE ((Not (tbl_MarkerData_Vegetation.PercentCover) Is Null) AND ((tbl_Events.Event_Type)='Marker Visit') AND ((tbl_Locations.Region)= '" + region + "'))"\
-                " GROUP BY tbl_Locations.Region, tbl_MarkerData_Vegetation.CommunityType, tbl_MarkerData_Vegetation.VegetationType, tlu_Vegetation.ScientificName"\
-                " ORDER BY tbl_MarkerData_Vegetation.CommunityType, tbl_MarkerData_Vegetation.VegetationType, tlu_Vegetation.ScientificName"\
-                " PIVOT tbl_Locations.Location_Name;"
-
-
-            outVal = connect_to_AcessDB(inQuery, inDB)
-            if outVal[0].lower() != "success function":
-                messageTime = timeFun()
-                print("WARNING - Function defineRecords_VegCoverBySegment - " + messageTime + " - Failed - Exiting Script")
-                exit()
-            else:
-
-                outDF = outVal[1]
-                messageTime = timeFun()
-                scriptMsg = "Success:  defineRecords_VegCoverBySegment" + messageTime
-                print(scriptMsg)
-
-                #Define Export .csv file
-                outFull = outputDir + "\MangroveMarsh_Export_" + dateString + ".xlsx"
-
-                #Append DataFrame to existing excel file
-                with pd.ExcelWriter(outFull, mode='a', engine="openpyxl") as writer:
-                    outDF.to_excel(writer, sheet_name='SOP8-2-AbsCov-' + region, index=False)
-
-                messageTime = timeFun()
-                scriptMsg = ("Successfully Exported Table 8-2-AbsCov - " + region + " - to: " + outFull + " - " + messageTime)
-                print(scriptMsg)
-
-                logFile = open(logFileName, "a")
-                logFile.write(scriptMsg + "\n")
-                logFile.close()
-
-        return "success function", outDF
-
-    except:
-        messageTime = timeFun()
-        print("Error on defineRecords_VegCoverByPointAbsolute Function - " + messageTime)
-        traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'defineRecords_VegCoverByPointAbsolute'"
-
-#Create  Figures - Absolute Cover By Region, By Community, By Strata
-def figure_CoverByStratum(inDF):
-    try:
-
-        #Open PDF to be copied to
-        pdf = PdfPages(outPDF)
-
-        # Process By Region
-        regionlList = ['Turner River', 'Shark Slough', 'Taylor Slough']
-        for count, region in enumerate(regionlList):
-
-            #Subset By Region
-            outDFSub = inDF[inDF['Region'] == region]
-
-            ###########################
-            #Marsh DataFrame and Figure
-            ###########################
-            #Subset to marshDF fields
-            marshDF = outDFSub.loc[:,('Location_Name', 'MarshSide_Cover_Overall', 'AbsCover_Marsh_Tree', 'AbsCover_Marsh_Shrub','AbsCover_Marsh_Herb')]
-            #Rename Fields
-            marshDF.rename(columns={"AbsCover_Marsh_Tree": "Tree", "AbsCover_Marsh_Shrub": "Shrub", "AbsCover_Marsh_Herb": "Herb"}, inplace=True)
-
-            #Set Index
-            marshDF.set_index('Location_Name', inplace=True)
-
-            #Subset to Mangrove fields
-            mangroveDF = outDFSub.loc[:, ('Location_Name', 'MangroveSide_Cover_Overall', 'AbsCover_Mangrove_Tree','AbsCover_Mangrove_Shrub', 'AbsCover_Mangrove_Herb')]
-            # Rename Fields
-            mangroveDF.rename(columns={"AbsCover_Mangrove_Tree": "Tree", "AbsCover_Mangrove_Shrub": "Shrub", "AbsCover_Mangrove_Herb": "Herb"}, inplace=True)
-
-            #Set Index
-            mangroveDF.set_index('Location_Name', inplace=True)
-
-            ####################
-            #Create the Figures:
-            ####################
-            plt.figure(figsize=(8, 6))
-            ax1 = plt.subplot(2, 1, 1)
-            marshDF.plot.bar(stacked=True, title="Marsh Side - " + region, xlabel="Marker Points", ylabel="Absolute Percent Cover (%)", color={'Shrub': 'red', 'Herb': 'turquoise', 'Tree': 'orange'}, ax=ax1)
-            lgd = plt.legend(['Tree', 'Shrub', 'Herb'], loc='center left', bbox_to_anchor=(1, 0.5))
-            plt.grid(axis='y')
-            plt.ylim(0, 100)
-            plt.tight_layout(pad=0.4)
-
-            ax2 = plt.subplot(2, 1, 2)
-            mangroveDF.plot.bar(stacked=True, title="Mangrove Side - " + region, xlabel="Marker Points", ylabel="Absolute Percent Cover (%)", color={'Shrub': 'red', 'Herb': 'turquoise', 'Tree': 'orange'}, ax=ax2)
-            lgd = plt.legend(['Tree', 'Shrub', 'Herb'], loc='center left', bbox_to_anchor=(1, 0.5))
-            plt.grid(axis='y')
-            plt.ylim(0, 100)
-            plt.tight_layout(pad=0.4)
-
-            figure = mp.pyplot.gcf()
-            pdf.savefig(figure)
-
-            messageTime = timeFun()
-            scriptMsg = "Successfully Exported Figures Region:" + region + " - " + messageTime
-            print(scriptMsg)
-            logFile = open(logFileName, "a")
-            logFile.write(scriptMsg + "\n")
-            logFile.close()
-
-        pdf.close()
-
-        messageTime = timeFun()
-        scriptMsg = "Success:  figure_CoverByStratum" + messageTime
-        print(scriptMsg)
-
-
-        return "success function"
-
-    except:
-        messageTime = timeFun()
-        print("Error on figure_CoverByStratum Function - " + messageTime)
-        traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'defineRecords_CoverByStratum'"
-
-
-#Calculate Absolute Cover By Stratum and Community type in table 'tbl_MarkerData'
-def defineRecords_CoverByStratum():
-    try:
-
-        inQuery = "SELECT tbl_Locations.Location_ID, tbl_Locations.Order_ID,  tbl_Locations.Region, tbl_Locations.Location_Name,  tbl_Events.Event_ID, tbl_Event_Group.Start_Date, tbl_MarkerData.MangroveSide_Cover_Overall,"\
-                " tbl_MarkerData.MangroveSide_Cover_Tree, tbl_MarkerData.MangroveSide_Cover_Shrub, tbl_MarkerData.MangroveSide_Cover_Herb, [MangroveSide_Cover_Overall]*([MangroveSide_Cover_Tree]/100)"\
-                " AS AbsCover_Mangrove_Tree, [MangroveSide_Cover_Overall]*([MangroveSide_Cover_Shrub]/100) AS AbsCover_Mangrove_Shrub, [MangroveSide_Cover_Overall]*([MangroveSide_Cover_Herb]/100)"\
-                " AS AbsCover_Mangrove_Herb, tbl_MarkerData.MarshSide_Cover_Overall, tbl_MarkerData.MarshSide_Cover_Tree, tbl_MarkerData.MarshSide_Cover_Shrub, tbl_MarkerData.MarshSide_Cover_Herb,"\
-                " [MarshSide_Cover_Overall]*([MarshSide_Cover_Tree]/100) AS AbsCover_Marsh_Tree, [MarshSide_Cover_Overall]*([MarshSide_Cover_Shrub]/100) AS AbsCover_Marsh_Shrub,"\
-                " [MarshSide_Cover_Overall]*([MarshSide_Cover_Herb]/100) AS AbsCover_Marsh_Herb"\
-                " FROM tbl_Locations INNER JOIN ((tbl_Event_Group INNER JOIN tbl_Events ON (tbl_Event_Group.Event_Group_ID = tbl_Events.Event_Group_ID) AND (tbl_Event_Group.Event_Group_ID"\
-                " = tbl_Events.Event_Group_ID)) INNER JOIN tbl_MarkerData ON (tbl_Events.Event_ID = tbl_MarkerData.Event_ID) AND (tbl_Events.Event_ID = tbl_MarkerData.Event_ID))"\
-                " ON tbl_Locations.Location_ID = tbl_Events.Location_ID WHERE (((tbl_Events.Event_Type)='Marker Visit')) ORDER BY tbl_Locations.Order_ID, tbl_Locations.Location_Name,"\
-                " tbl_Event_Group.Start_Date;"
-
-
-        outVal = connect_to_AcessDB(inQuery, inDB)
-        if outVal[0].lower() != "success function":
-            messageTime = timeFun()
-            print("WARNING - Function defineRecords_CoverByStratum - " + messageTime + " - Failed - Exiting Script")
-            exit()
-        else:
-
-            outDF = outVal[1]
-            messageTime = timeFun()
-            scriptMsg = "Success:  defineRecords_CoverByStratum" + messageTime
-            print(scriptMsg)
-
-            return "success function", outDF
-
-    except:
-        messageTime = timeFun()
-        print("Error on defineRecords_CoverByStratum Function - " + messageTime)
-        traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'defineRecords_CoverByStratum'"
-
-
-
-#Extract Mangrove Marsh Distance Records table 'tbl_MarkerData' where Event Type = 'Marker Visit'
-def defineRecords_MarkerData():
-    try:
-        inQuery = "SELECT tbl_Event_Group.Event_Group_ID, tbl_Event_Group.Event_Group_Name, tbl_Event_Group.Start_Date, tbl_Event_Group.End_Date, tbl_Event_Group.Assessment, tbl_Events.Event_Type,"\
-                " tbl_Events.Location_ID, tbl_Locations.Region,tbl_Locations.Segment, tbl_Locations.Location_Name, tbl_MarkerData.Distance, tbl_MarkerData.Method"\
-                " FROM tbl_Locations INNER JOIN ((tbl_Event_Group INNER JOIN tbl_Events ON (tbl_Event_Group.Event_Group_ID = tbl_Events.Event_Group_ID) AND (tbl_Event_Group.Event_Group_ID = tbl_Events.Event_Group_ID))"\
-                " INNER JOIN tbl_MarkerData ON (tbl_Events.Event_ID = tbl_MarkerData.Event_ID) AND (tbl_Events.Event_ID = tbl_MarkerData.Event_ID)) ON tbl_Locations.Location_ID = tbl_Events.Location_ID"\
-                " WHERE tbl_Events.Event_Type = 'Marker Visit' ORDER BY tbl_Locations.Segment, tbl_Locations.Location_Name, tbl_Events.Event_Type;"\
-
-        outVal = connect_to_AcessDB(inQuery, inDB)
-        if outVal[0].lower() != "success function":
-            messageTime = timeFun()
-            print("WARNING - Function defineRecords_MarkerData - " + messageTime + " - Failed - Exiting Script")
-            exit()
-        else:
-
-            outDF = outVal[1]
-            messageTime = timeFun()
-            scriptMsg = "Success:  defineRecords_MarkerData" + messageTime
-            print(scriptMsg)
-
-            return "success function", outDF
-
-    except:
-        messageTime = timeFun()
-        print("Error on defineRecords_MarkderData Function - " + messageTime)
-        traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'defineRecords'"
-
-
-#Connect to Access DB and perform defined query - return query in a dataframe
-def connect_to_AcessDB(query, inDB):
-
-    try:
-        connStr = (r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=" + inDB + ";")
-        cnxn = pyodbc.connect(connStr)
-        queryDf = pd.read_sql(query, cnxn)
-        cnxn.close()
-
-        return "success function", queryDf
-
-    except:
-        messageTime = timeFun()
-        scriptMsg = "Error function:  connect_to_AcessDB - " +  messageTime
-        print(scriptMsg)
-        logFile = open(logFileName, "a")
-        logFile.write(scriptMsg + "\n")
-
-        traceback.print_exc(file=sys.stdout)
-        logFile.close()
-        return "failed function"
-
-if __name__ == '__main__':
-
-    # Write parameters to log file ---------------------------------------------
-    ##################################
-    # Checking for working directories
-    ##################################
-
-    if os.path.exists(workspace):
-        pass
-    else:
-        os.makedirs(workspace)
-
-    #Check for logfile
-
-    if os.path.exists(logFileName):
-        pass
-    else:
-        logFile = open(logFileName, "w")    #Creating index file if it doesn't exist
-        logFile.close()
-
-    # Analyses routine ---------------------------------------------------------
-    main()
\ No newline at end of file
+###################################
+# SFCN_MangroveMarsh_Tables_Figures.py
+###################################
+# Description:  Routine to Summarize Mangrove Marsh Monitoring data including output tables and figures for annual reporting.
+
+# Code performs the following routines:
+# 1) Summaries the Event Average Distance from Ground Truth values.  This includes Averge, Standard Error, Confidence Interval for defined %, and Maximum and Minimum values
+# by event/segment replicating the 'Mangrove-Marsh Ecotone Monitoring' SOP8-1 summary table. Confidence Intervals are defined using a Student T Distribution with Student T defiend as: np.abs(t.ppf((1 - confidence) / 2, dof)).
+
+# 2) Summarize via a CrossTab/Pivot Table the Absolute Vegetation by Region, Location Name (i.e. Point on Segment), by Community Type, and by Taxon (Scale is Point - single value).
+# Routine replicates the 'Mangrove-Marsh Ecotone Monitoring' SOP8-2 summary table.
+
+# 3) Calculates the Absolute Cover By Region, By Community, By Strata - data is from table  'tbl_MarkerData'. Output replicates the 'Mangrove-Marsh Ecotone Monitoring' SOP8-3 summary Figure.
+
+# 4) Optional Trend Analysis ('trendAnalysis') - Distance and Absolute Cover trends (slope per year, Confidence Interval and change points) by Segment and Location across all Monitoring Years.
+
+# Output:
+# An excel spreadsheet with Tables SOP8-1 (i.e. Average Distance from Ground Truth Values), Tables SOP8-2 By region (three total) with the the Absolute Vegetation by Region, Location Name (i.e. Point on Segment),
+# by Community Type, and by Taxon, and a pdf file withe Figures SOP8-3 by region (three total) with the Absolute Cover By Region, By Community, By Strata.
+
+# Dependencies:
+# Python version 3.9
+# Pandas
+# Scipy
+# pyodbc - dataSourceType 'access' only
+# duckdb - dataSourceType 'duckdb' only (optional for the Parquet snapshot)
+# pyarrow - Parquet snapshot ('snapshotDir') and result cache ('cacheDir') only
+# Matplotlib
+# openpyxl or xlsxwriter - Excel export (xlsxwriter for 'streamingExcel')
+# pypdf - optional, SOP8-3 pages are rendered in worker processes when installed
+# tomli - '--config' TOML file on Python versions before 3.11 (tomllib)
+
+# Python/Conda environment - py39
+# Created by: Kirk Sherrill - Data Manager South Florida Caribbean Network (Detail) - Inventory and Monitoring Division - National Park Service
+# Date Created: March 2023
+
+#######################################
+# Start of Parameters requiring set up.
+#######################################
+#Define Inpurt Parameters:
+
+#Mangrove Marsh Access Database and location
+inDB = r'C:\SFCN\Monitoring\Mangrove_Marsh_Ecotone\data\SFCN_Mangrove_Marsh_Ecotone_tabular_20230318.mdb'
+
+#Data Source Type of 'inDB' - 'access' (.mdb/.accdb via pyodbc - Windows only), 'sqlite' or 'duckdb' (file with the same tbl_/tlu_ table schema)
+dataSourceType = 'access'
+
+#Parquet Snapshot Directory - when defined the source tables in 'inDB' are exported to Parquet (incremental refresh by Event Group) and all report stages read from the snapshot
+snapshotDir = None  #None - query 'inDB' directly
+refreshSnapshot = True  #Refresh the snapshot from 'inDB' before processing - False reports from the existing snapshot only
+
+#Confidence Interval - a single level (e.g. 0.95) or a list of levels (e.g. [0.90, 0.95, 0.99]), each exported as Lower/Upper CI fields
+confidence = 0.95
+
+#Bootstrapped Confidence Interval (percentile method) of the Average Distance - exported with the Student T Confidence Interval when True
+bootstrapCI = False
+bootstrapSamples = 2000  #Number of bootstrap resamples per Event Group/Segment
+
+#Directory Information
+outputDir = r'C:\SFCN\Monitoring\Mangrove_Marsh_Ecotone\analysis\Python\2020'  #Output Directory
+workspace = r'C:\SFCN\Monitoring\Mangrove_Marsh_Ecotone\analysis\Python\workspace'  # Workspace Folder - log file
+monitoringYear = 2020  #Monitoring Year of Mangrove Marsh data being processing - the SOP products are of the Event Groups starting in this year
+
+#Regions processed for Tables SOP8-2 and Figures SOP8-3 - output in 'tbl_Locations' Order_ID order (see 'define_PartitionIndex')
+regionList = None  #None - every Region in 'tbl_Locations', or a list of Regions e.g. ['Turner River', 'Shark Slough', 'Taylor Slough']
+
+#Batch Mode - Monitoring Years processed in one run with a workbook and pdf per year. Each (year, region) report unit runs in a worker process
+batchYears = []  #e.g. [2018, 2019, 2020] - empty list runs main() for 'monitoringYear'
+maxWorkers = None  #Worker processes for batch mode and SOP8-3 page rendering - None uses every core, 1 renders pages in this process
+
+#Run Profiling - wall time, rows in/out and peak memory (RSS/tracemalloc) per stage, exported as a JSON/CSV run report to 'outputDir'. Also set by '--profile' on the command line
+profileRun = False
+
+#Benchmark - run by the 'benchmark' command. Times the report stages on synthetic databases (see 'benchmarkDataset') at each scale, exported as csv/pdf scaling curves to 'outputDir'
+benchmarkDataset = {'regionCount': 3, 'segmentsPerRegion': 4, 'pointsPerSegment': 10, 'yearList': [monitoringYear], 'speciesCount': 60}  #1x scale - about one annual SFCN dataset
+benchmarkScales = [1, 10, 100]  #Scale multiplies the Segments per Region
+benchmarkRepeats = 3  #Timed calls per stage - best and median times are exported
+benchmarkBaseline = None  #Benchmark csv of a previous run - stages slower than 'benchmarkTolerance' x the baseline fail the benchmark (exit code 1)
+benchmarkTolerance = 1.5
+
+#Result Cache - query results and summary tables are cached as Parquet in 'cacheDir', keyed on the query/parameters and the source database fingerprint or input content
+cacheDir = None  #None - no cache, e.g. r'C:\SFCN\Monitoring\Mangrove_Marsh_Ecotone\analysis\Python\cache'
+cacheMaxMB = 512  #Least recently used entries are evicted above this size
+
+#Incremental Build - node outputs and fingerprints are kept in 'buildDir'. Only the Event Group/Segments, Regions and Years whose source rows changed are recomputed and
+#the workbook/pdf are only rewritten when one of their sheets/pages changed
+buildDir = None  #None - full rebuild every run
+
+#Streaming Ingestion - True reads the SOP8-1 and SOP8-2 queries in chunks of 'queryChunkSize' rows folded into running aggregates (bounded memory for multi-decade datasets).
+#The Marker Visit Dataset is then only pulled for the Figures (without 'pushdownAggregation') and the Trend Analysis. The Bootstrapped Confidence Interval needs the full
+#Distance records and is not available when streaming
+streamingQueries = False
+queryChunkSize = 50000
+
+#Aggregation Pushdown - True calculates the SOP8-1 Distance aggregates (GROUP BY) and the SOP8-3 stratum cover in the database query, False pulls the marker records
+#and aggregates in pandas. With 'streamingQueries' as well no marker record level query is run (without the Trend Analysis)
+pushdownAggregation = False
+
+#Excel Export - False writes the workbook with the default pandas Excel writer, True streams it row by row with xlsxwriter 'constant_memory' (bounded memory for large SOP8-2 crosstabs)
+streamingExcel = False
+
+#Overlapped Pipeline - True runs the fetch, compute, render and write stages concurrently (SOP8-3 figures are fetched and rendered while the SOP8-1/SOP8-2
+#tables are computed and written), False runs them in order. Not used with 'buildDir' - the incremental build runs in order
+overlappedPipeline = False
+pipelineQueueSize = 2  #Tables/pages held between two pipeline stages before the producing stage waits
+
+#Data Validation (QA) - rule checks over the Marker Visit Dataset before reporting (see 'qaRules'). Violations are exported to the workbook sheet 'QA-Violations'
+#and a Parquet file in 'outputDir'. Only the records pulled into the dataset are checked (no vegetation checks when SOP8-2 is streamed)
+validateData = True
+qaMaxErrors = None  #The run fails before reporting when the error violations exceed this count - None reports the violations only
+
+#Trend Analysis - True regresses the Distance and Absolute Cover by Stratum of every Marker Visit (all Monitoring Years) on the event date by Segment and by
+#Location (Marker Point). Slopes per year with Confidence Intervals ('confidence') and change point flags are exported to the workbook sheet 'Trend' and
+#a trend pdf in 'outputDir'. With 'buildDir' only the Monitoring Years whose marker records changed are summarized again. Not run in batch mode
+trendAnalysis = False
+trendMinYears = 3  #Monitoring Years with records needed to fit a trend
+trendChangePointYears = 3  #Monitoring Years needed on each side of a change point - Segments/Locations with fewer than twice this are not tested
+
+#Report Service - run by the 'serve' command. The Marker Visit Dataset is held in memory and single products are served over a local HTTP API,
+#e.g. http://127.0.0.1:8765/sop8-2?region=Shark%20Slough&format=csv (see 'serviceProducts') or with the 'query' command
+serviceHost = '127.0.0.1'
+servicePort = 8765
+serviceSocket = None  #Unix socket path - the service listens on the socket instead of 'serviceHost'/'servicePort' (not available on Windows)
+serviceCacheSize = 64  #Rendered products held in memory - the least recently used are dropped
+serviceCheckSeconds = 5  #Minimum seconds between checks of the Data Source fingerprint - the dataset is pulled again when the source changed
+
+#Log File in 'workspace' - 'json' writes a JSON record per line (time, level, message, stage, region, year, duration, process) to '<outName>_logfile.jsonl',
+#'text' the messages only to '<outName>_logfile.txt'. Records are queued and written by one writer thread (worker processes included), the buffer is
+#written every 'logFlushSeconds', on an error and when the run ends
+logFormat = 'json'
+logFlushSeconds = 5
+#All parameters above may be set by the command line options or a TOML config file ('--config') - see 'cli_Main'
+
+#######################################
+## Below are paths which are hard coded:
+#######################################
+#Import Required Libraries - matplotlib (figures), scipy (Student T) and the database drivers are imported by the stages that use them
+import pandas as pd
+import sys
+from datetime import date, datetime
+
+import os
+
+import traceback
+import importlib.util
+import time
+import logging
+import logging.handlers
+import json
+import threading
+import contextvars
+import asyncio
+import tracemalloc
+from contextlib import contextmanager
+from collections import OrderedDict
+import numpy as np
+
+#Get Current Date
+dateString = date.today().strftime("%Y%m%d")
+
+#Output Name (pdf and log file), pdf and log file of the run - defined from the parameters and again after the command line/config settings are applied
+def define_RunNames():
+    global outName, outPDF, logFileName
+    outName = "MangroveMarsh_AnnualTablesFigs_" + str(monitoringYear) + "_" + dateString  # Name given to the exported pre-processed
+    outPDF = os.path.join(outputDir, outName + ".pdf")
+    logFileName = os.path.join(workspace, outName + ("_logfile.jsonl" if logFormat == 'json' else "_logfile.txt"))
+
+define_RunNames()
+
+##################################
+# Checking for directories and start the Logfile - run by the entry point, importing the module has no side effects
+##################################
+def setup_Run():
+
+    if os.path.exists(workspace):
+        pass
+    else:
+        os.makedirs(workspace)
+
+    if os.path.exists(outputDir):
+        pass
+    else:
+        os.makedirs(outputDir)
+
+    # Logfile writer - the file is created by the first record
+    start_Logging()
+#################################################
+
+# Function to Get the Date/Time
+def timeFun():
+    return datetime.now().isoformat()
+
+##################################
+# Logging
+##################################
+#Messages are logged by 'log_Message' as records on the log queue (QueueHandler). One writer thread (QueueListener) formats the records and holds them in a buffer
+#written to 'logFileName' every 'logFlushSeconds', on an error record and when logging stops - the file is opened once per run. Worker processes put their
+#records on the same queue ('start_WorkerLogging'), so lines from several processes are never interleaved
+
+logger = logging.getLogger('SFCN_MangroveMarsh')
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+#Queue, writer thread, file handler and flush timer of the run - None until 'start_Logging'. 'fields' are added to every record of this process ('set_LogFields')
+logState = {'queue': None, 'listener': None, 'handler': None, 'stopFlush': None, 'fields': {}}
+
+#Record fields written to the JSON log when set
+logFields = ['stage', 'region', 'year', 'duration', 'rowsIn', 'rowsOut', 'traceback']
+
+#Log record format - a JSON object per line ('logFormat' json) or the message and traceback only (text)
+class LogFormatter(logging.Formatter):
+
+    def format(self, record):
+        if logFormat != 'json':
+            return record.getMessage() + ("\n" + record.traceback.rstrip() if getattr(record, 'traceback', None) else "")
+
+        logRecord = {'time': datetime.fromtimestamp(record.created).isoformat(), 'level': record.levelname, 'message': record.getMessage(), 'process': record.processName}
+        logRecord.update({field: getattr(record, field) for field in logFields if getattr(record, field, None) is not None})
+        return json.dumps(logRecord, default=str)
+
+#Log file handler of the writer thread - formatted records are held in a buffer and written in one call by 'flush'
+class BufferedLogHandler(logging.FileHandler):
+
+    def __init__(self, fileName):
+        super().__init__(fileName, mode='a', encoding='utf-8', delay=True)
+        self.buffer = []
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record))
+            if record.levelno >= logging.ERROR:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer:
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write("\n".join(self.buffer) + "\n")
+                self.stream.flush()
+                self.buffer = []
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+#Start the log writer thread for 'logFileName' - the queue is a multiprocessing queue so worker processes can log to it. Logging stops at exit
+def start_Logging():
+
+    import multiprocessing
+    import atexit
+
+    stop_Logging()
+    logQueue = multiprocessing.Queue()
+    logHandler = BufferedLogHandler(logFileName)
+    logHandler.setFormatter(LogFormatter())
+    listener = logging.handlers.QueueListener(logQueue, logHandler)
+    listener.start()
+    logger.handlers = [logging.handlers.QueueHandler(logQueue)]
+
+    #Buffer written every 'logFlushSeconds'
+    stopFlush = threading.Event()
+    def flush_Log():
+        while not stopFlush.wait(logFlushSeconds):
+            logHandler.flush()
+    threading.Thread(target=flush_Log, name='logFlush', daemon=True).start()
+
+    if logState['queue'] is None:
+        atexit.register(stop_Logging)
+    logState.update({'queue': logQueue, 'listener': listener, 'handler': logHandler, 'stopFlush': stopFlush})
+
+#Stop the log writer thread - the queued records are written and the log file closed
+def stop_Logging():
+
+    if logState['listener'] is None:
+        return
+
+    logger.handlers = []
+    logState['stopFlush'].set()
+    logState['listener'].stop()
+    logState['handler'].close()
+    logState['queue'].close()
+    logState['queue'].join_thread()
+    logState.update({'listener': None, 'handler': None, 'stopFlush': None})
+
+#Log records of a worker process to the log queue of the run ('logQueue' of 'start_Logging')
+def start_WorkerLogging(logQueue):
+
+    logger.handlers = [logging.handlers.QueueHandler(logQueue)]
+
+#Set the record fields added to every record of this process - the Monitoring Year and Region being reported. A None value clears the field
+def set_LogFields(**fields):
+
+    for field, value in fields.items():
+        if value is None:
+            logState['fields'].pop(field, None)
+        else:
+            logState['fields'][field] = value
+
+#Log a message - 'fields' are the record fields (stage, region, year, duration, rowsIn, rowsOut), unset fields take the values of 'set_LogFields'.
+#'withTraceback' adds the traceback of the exception being handled
+def log_Message(scriptMsg, level=logging.INFO, withTraceback=False, **fields):
+
+    recordFields = dict(logState['fields'])
+    recordFields.update({field: value for field, value in fields.items() if value is not None})
+    if withTraceback:
+        recordFields['traceback'] = traceback.format_exc()
+    logger.log(level, scriptMsg, extra=recordFields)
+
+##################################
+# Run Profiling
+##################################
+#Stage records of this run - wall time, rows in/out and memory for each profiled stage
+stageRecords = []
+
+#Peak Resident Set Size (MB) of this process - None when neither 'resource' (Unix) nor 'psutil' is available
+def define_PeakRSS():
+    try:
+        import resource
+        peakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peakRSS / 1048576 if sys.platform == 'darwin' else peakRSS / 1024, 2)
+    except ImportError:
+        try:
+            import psutil
+            memoryInfo = psutil.Process().memory_info()
+            return round(getattr(memoryInfo, 'peak_wset', memoryInfo.rss) / 1048576, 2)
+        except ImportError:
+            return None
+
+#Profiled stages running now (records by id) and the enclosing stages (ids) of the current thread/asyncio task - the tracemalloc peak is process wide, so a stage entering
+#first adds the peak so far to every running stage before it resets the peak
+profileState = {'lock': threading.Lock(), 'active': {}}
+enclosingStages = contextvars.ContextVar('enclosingStages', default=())
+
+#Profile a stage when 'profileRun' is set - the yielded record takes the row counts ('rowsIn'/'rowsOut') and is added to 'stageRecords' with the
+#wall time, tracemalloc peak (when tracing) and peak RSS once the stage exits. 'tracemallocScope' is 'stage' when only the stage (and the stages it encloses)
+#ran while it was profiled, 'process' when it overlapped another stage (overlapped pipeline) - the peak is then of all the stages running at the time
+@contextmanager
+def profile_Stage(stageName, rowsIn=None, **stageDetail):
+
+    record = {'stage': stageName, 'rowsIn': rowsIn, 'rowsOut': None}
+    record.update(stageDetail)
+    if not profileRun:
+        yield record
+        return
+
+    tracing = tracemalloc.is_tracing()
+    enclosing = enclosingStages.get()
+    with profileState['lock']:
+        overlapped = [active for activeID, active in profileState['active'].items() if activeID not in enclosing]
+        record['_overlapped'] = len(overlapped) > 0
+        for active in overlapped:
+            active['_overlapped'] = True
+        if tracing:
+            peakBytes = tracemalloc.get_traced_memory()[1]
+            for active in profileState['active'].values():
+                active['_peakBytes'] = max(active['_peakBytes'], peakBytes)
+            tracemalloc.reset_peak()
+        record['_peakBytes'] = 0
+        profileState['active'][id(record)] = record
+    stageToken = enclosingStages.set(enclosing + (id(record),))
+    startTime = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = round(time.perf_counter() - startTime, 6)
+        enclosingStages.reset(stageToken)
+        with profileState['lock']:
+            del profileState['active'][id(record)]
+            peakBytes = max(record.pop('_peakBytes'), tracemalloc.get_traced_memory()[1]) if tracing else None
+        overlapped = record.pop('_overlapped')
+        record['tracemallocPeak_MB'] = round(peakBytes / 1048576, 2) if tracing else None
+        record['tracemallocScope'] = ('process' if overlapped else 'stage') if tracing else None
+        record['peakRSS_MB'] = define_PeakRSS()
+        stageRecords.append(record)
+        log_Message("Stage: " + stageName, stage=stageName, region=record.get('region'), year=record.get('year'), duration=record['seconds'],
+                    rowsIn=record['rowsIn'], rowsOut=record['rowsOut'])
+
+#Start tracemalloc for a profiled run
+def start_Profiling():
+    if profileRun and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+#Export the Run Report - the stage records as '<outPrefix>.json' and '<outPrefix>.csv' alongside the outputs
+def export_RunReport(outPrefix):
+    try:
+        if not profileRun:
+            return "success function"
+
+        with open(outPrefix + ".json", "w") as reportOut:
+            json.dump({'run': outName, 'created': timeFun(), 'peakRSS_MB': define_PeakRSS(), 'stages': stageRecords}, reportOut, indent=2, default=str)
+        pd.DataFrame(stageRecords).to_csv(outPrefix + ".csv", index=False)
+
+        messageTime = timeFun()
+        scriptMsg = "Successfully Exported Run Report: " + outPrefix + ".json/.csv - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='export_RunReport')
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on export_RunReport Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'export_RunReport'"
+
+
+#Main Routine - 'productList' selects the report products: 'tables' (workbook - Tables SOP8-1 and SOP8-2) and/or 'figures' (pdf - Figures SOP8-3)
+def main(productList=('tables', 'figures')):
+    try:
+        set_LogFields(year=monitoringYear)
+        start_Profiling()
+
+        #Refresh the Parquet Snapshot of the source tables in 'inDB'
+        if snapshotDir is not None and refreshSnapshot:
+            outVal = refresh_Snapshot(snapshotDir)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function refresh_Snapshot - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function refresh_Snapshot")
+
+        #Open the Data Source Session - shared by all queries in this run. Report stages read from the snapshot when defined
+        if snapshotDir is not None:
+            outVal = open_DataSource(snapshotDir, 'parquet')
+        else:
+            outVal = open_DataSource(inDB, dataSourceType)
+        if outVal[0].lower() != "success function":
+            print("WARNING - Function open_DataSource - Failed - Exiting Script")
+            exit()
+        else:
+            print("Success - Function open_DataSource")
+
+        #Partition Index - Regions (Segments, Locations) of 'tbl_Locations' in Order_ID order
+        outVal = define_PartitionIndex()
+        if outVal[0].lower() != "success function":
+            print("WARNING - Function define_PartitionIndex - Failed - Exiting Script")
+            exit()
+        else:
+            print("Success - Function define_PartitionIndex")
+            regionNames = list(outVal[1])
+
+        #Report Event Groups - the products are of 'monitoringYear' only, as the Report Unit of the year in batch mode
+        outVal = define_ReportEventGroups(monitoringYear)
+        if outVal[0].lower() != "success function":
+            print("WARNING - Function define_ReportEventGroups - Failed - Exiting Script")
+            exit()
+        else:
+            print("Success - Function define_ReportEventGroups")
+
+        #Output Workbook - Tables SOP8-1 and SOP8-2, the QA Violations (Parquet) and the Trend pdf
+        outXLSX = os.path.join(outputDir, "MangroveMarsh_Export_" + dateString + ".xlsx")
+        outQAPrefix = os.path.join(outputDir, "MangroveMarsh_QA_Violations_" + str(monitoringYear) + "_" + dateString)
+        outTrendPDF = os.path.join(outputDir, "MangroveMarsh_Trends_" + dateString + ".pdf")
+
+        #Overlapped Pipeline - the report stages run concurrently, the Marker Visit Dataset and queries are fetched by the pipeline
+        if overlappedPipeline and buildDir is None:
+            with profile_Stage('run_OverlappedPipeline'):
+                outVal = asyncio.run(run_OverlappedPipeline(productList, outXLSX, outPDF, outQAPrefix, outTrendPDF, regionNames))
+            if outVal.lower() != "success function":
+                print("WARNING - Function run_OverlappedPipeline - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function run_OverlappedPipeline")
+
+            messageTime = timeFun()
+            scriptMsg = "Successfully Finished Processing - SFCN_MangroveMash_Tables_Figures - " + messageTime
+            print(scriptMsg)
+            log_Message(scriptMsg, stage='main')
+            return "success function"
+
+        #Pull the Marker Visit Dataset - Marker and Vegetation records are queried and joined once, the SOP products held in memory are derived from the dataset.
+        #Only pulled for the Trend Analysis, the in memory Tables (not streamed) and the Figures without Aggregation Pushdown. Vegetation records are only pulled for Table SOP8-2
+        markerDataset = None
+        includeVegetation = 'tables' in productList and not streamingQueries
+        if trendAnalysis or includeVegetation or ('figures' in productList and not pushdownAggregation):
+            with profile_Stage('defineRecords_MarkerVisitDataset') as stage:
+                if buildDir is not None:
+                    outVal = build_Node('Marker Visit Dataset', hash_Content('defineRecords_MarkerVisitDataset', {'markerCategoryFields': markerCategoryFields, 'includeVegetation': includeVegetation}),
+                                        defineRecords_MarkerVisitDataset, includeVegetation)
+                else:
+                    outVal = defineRecords_MarkerVisitDataset(includeVegetation)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function defineRecords_MarkerVisitDataset - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function defineRecords_MarkerVisitDataset")
+                markerDataset = outVal[1]
+                stage['rowsOut'] = len(markerDataset['markerVisits']) + len(markerDataset['vegetation'])
+
+        #Records of the Monitoring Year - the SOP products and QA Validation are of the Report Event Groups, the Trend Analysis of every year
+        reportDataset = filter_ReportDataset(markerDataset)
+
+        #QA Validation of the Marker Visit Dataset (tables not held in memory are read in chunks) - the run fails here when the errors exceed 'qaMaxErrors'
+        violationDF = None
+        if validateData:
+            outVal = run_Validation(define_ValidationDataset(reportDataset, includeVegetation), outQAPrefix)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function run_Validation - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function run_Validation")
+                violationDF = outVal[1]
+
+        #Trend Analysis - Distance and Absolute Cover trends over all Monitoring Years by Segment and Location
+        trendResult = None
+        if trendAnalysis:
+            with profile_Stage('define_Trends', rowsIn=len(markerDataset['markerVisits'])) as stage:
+                outVal = build_Trends(markerDataset['markerVisits']) if buildDir is not None else define_Trends(markerDataset['markerVisits'])
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function define_Trends - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function define_Trends")
+                trendResult = outVal[1]
+                trendFingerprint = outVal[2] if len(outVal) > 2 else None
+                stage['rowsOut'] = len(trendResult['trends'])
+
+        if 'tables' in productList:
+
+            ########################
+            #Functions for Table 8-1
+            ########################
+            #Marker Distance Records from the Marker Visit Dataset (not needed when SOP8-1 is aggregated in the database or streamed)
+            outDF = None
+            if not (pushdownAggregation or streamingQueries):
+                with profile_Stage('defineRecords_MarkerData', rowsIn=len(reportDataset['markerVisits'])) as stage:
+                    outVal = defineRecords_MarkerData(reportDataset)
+                if outVal[0].lower() != "success function":
+                    print("WARNING - Function defineRecords_MarkerData - Failed - Exiting Script")
+                    exit()
+                else:
+                    print("Success - Function defineRecords_MarkerData")
+                    outDF = outVal[1]
+                    stage['rowsOut'] = len(outDF)
+
+            #Summarize Data from tbl_MarkerData into format for Table 8-1 in SFCN Mangrove Marsh SOP.
+            with profile_Stage('SummarizeFigure8_1', rowsIn=len(outDF) if outDF is not None else None) as stage:
+                if pushdownAggregation:
+                    outVal = aggregate_Figure8_1()
+                elif streamingQueries:
+                    outVal = stream_SummarizeFigure8_1()
+                elif buildDir is not None:
+                    outVal = build_SOP8_1(outDF)
+                else:
+                    outVal = SummarizeFigure8_1(outDF)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function SummarizeFigure8_1 - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function SummarizeFigure8_1")
+                sheetDict = {'SOP8-1': outVal[1]}
+                sheetFingerprints = {'SOP8-1': outVal[2] if len(outVal) > 2 else None}
+                stage['rowsOut'] = len(outVal[1])
+
+            ########################
+            #Functions for Table 8-2  - Absolute Cover Species Data by Transect and Point By Region
+            ########################
+
+            #Summarize via a CrossTab/Pivot Table the Absolute Vegetation by Location Name (i.e. Point on Segment), by Community Type and Vegetation Type (Scale is Point - single value)
+            with profile_Stage('defineRecords_VegCoverByPointAbsolute', rowsIn=len(reportDataset['vegetation']) if reportDataset is not None else None) as stage:
+                if streamingQueries:
+                    outVal = stream_VegCoverByPointAbsolute(regionNames)
+                elif buildDir is not None:
+                    outVal = build_SOP8_2(reportDataset, regionNames)
+                else:
+                    outVal = defineRecords_VegCoverByPointAbsolute(reportDataset, regionNames)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function defineRecords_VegCoverByPointAbsolute - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function defineRecords_VegCoverByPointAbsolute")
+                sheetNames = define_RegionSheetNames(regionNames)
+                for region, outDF in outVal[1].items():
+                    sheetDict[sheetNames[region]] = outDF
+                    sheetFingerprints[sheetNames[region]] = outVal[2][region] if len(outVal) > 2 else None
+                stage['rowsOut'] = sum(len(outDF) for outDF in outVal[1].values())
+
+            #Trend sheet - after the SOP tables
+            if trendResult is not None:
+                sheetDict['Trend'] = trendResult['trends']
+                sheetFingerprints['Trend'] = trendFingerprint
+
+            #QA Violations sheet - after the SOP tables
+            if violationDF is not None and len(violationDF) > 0:
+                sheetDict['QA-Violations'] = violationDF
+                sheetFingerprints['QA-Violations'] = None
+
+            #Export Tables SOP8-1 and SOP8-2 - all sheets in one pass with a single writer
+            outVal = build_Workbook(outXLSX, sheetDict, sheetFingerprints) if buildDir is not None else export_Workbook(outXLSX, sheetDict)
+            if outVal.lower() != "success function":
+                print("WARNING - Function export_Workbook - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function export_Workbook")
+
+            messageTime = timeFun()
+            scriptMsg = "Successfully Finished Processing - SFCN_MangroveMash_Tables_Figures - " + messageTime
+            print(scriptMsg)
+            log_Message(scriptMsg, stage='main')
+
+        if 'figures' in productList:
+            ########################
+            # Functions for Figure 8-3  - Calculate the Absolute Cover By Region, By Community, By Strata - data is from table  'tbl_MarkerData'
+            ########################
+
+            #Stratum Cover Data by point from the Marker Visit Dataset (or calculated in the database query)
+            with profile_Stage('defineRecords_CoverByStratum', rowsIn=len(reportDataset['markerVisits']) if reportDataset is not None else None) as stage:
+                outVal = aggregate_CoverByStratum() if pushdownAggregation else defineRecords_CoverByStratum(reportDataset)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function defineRecords_CoverByStratum - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function defineRecords_CoverByStratum")
+                outDF = outVal[1]
+                stage['rowsOut'] = len(outDF)
+
+            #Figures for Marker Point Stratum By Region - Stacked Top Marsh, Botom Mangrove
+            outVal = build_CoverByStratumPDF(outDF, outPDF, regionNames) if buildDir is not None else figure_CoverByStratum(outDF, outPDF, regionNames)
+            if outVal.lower() != "success function":
+                print("WARNING - Function figure_CoverByStratum - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function figure_CoverByStratum")
+
+            #Trend Figures by Region
+            if trendResult is not None:
+                outVal = build_TrendPDF(trendResult, trendFingerprint, outTrendPDF, regionNames) if buildDir is not None else figure_Trends(trendResult, outTrendPDF, regionNames)
+                if outVal.lower() != "success function":
+                    print("WARNING - Function figure_Trends - Failed - Exiting Script")
+                    exit()
+                else:
+                    print("Success - Function figure_Trends")
+
+            messageTime = timeFun()
+            scriptMsg = "Successfully Finished Processing - SFCN_MangroveMash_Tables_Figures - " + messageTime
+            print(scriptMsg)
+            log_Message(scriptMsg, stage='main')
+
+        return "success function"
+
+    except:
+
+        messageTime = timeFun()
+        scriptMsg = "WARNING Script Failed - " + messageTime
+        print (scriptMsg)
+        log_Message(scriptMsg, logging.ERROR, withTraceback=True, stage='main')
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'main'"
+
+    finally:
+        #Close the Data Source Session
+        close_DataSource()
+
+        #Run Report of the profiled stages
+        export_RunReport(os.path.join(outputDir, "MangroveMarsh_RunReport_" + str(monitoringYear) + "_" + dateString))
+        define_ReportEventGroups(None)
+        set_LogFields(year=None)
+
+#Student T critical values already calculated - keyed on (confidence, dof)
+studentTCache = {}
+
+#Function to define the Student’s t distribution - 'dof' may be a single value or an array, t.ppf is only called for the (confidence, dof) pairs not yet in 'studentTCache'
+def defineStudentT(dof, confidenceLevel=None):
+    try:
+        if confidenceLevel is None:
+            confidenceLevel = confidence
+
+        dofArray = np.atleast_1d(np.asarray(dof, dtype='float64'))
+        uniqueDOF, inverse = np.unique(dofArray, return_inverse=True)
+
+        missingDOF = [value for value in uniqueDOF if (confidenceLevel, value) not in studentTCache and not np.isnan(value)]
+        if missingDOF:
+            from scipy.stats import t
+            studentTCache.update(zip([(confidenceLevel, value) for value in missingDOF], np.abs(t.ppf((1 - confidenceLevel) / 2, missingDOF))))
+
+        x = np.array([studentTCache.get((confidenceLevel, value), np.nan) for value in uniqueDOF])[inverse.reshape(-1)]
+
+        return x if np.ndim(dof) else x[0]
+    except:
+        scriptMsg = "Exiting Error - defineStudentT"
+        print(scriptMsg)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed"
+
+#Summarize Mangrove Marsh Ecotone Values - Average Distance, Standard Error, Lower 95% Confidence Limit, Upper 95% Confidence Limit, Max and Min Values
+#Output DataFrame with the summary values by Segment - exported to sheet 'SOP8-1' by 'export_Workbook'
+def SummarizeFigure8_1(inDF, groupedDF=None):
+    try:
+        cacheKey = define_CacheKey('SummarizeFigure8_1', {'confidence': confidence, 'bootstrapCI': bootstrapCI, 'bootstrapSamples': bootstrapSamples}, [inDF if groupedDF is None else groupedDF])
+        outDf_8pt1 = cache_Load(cacheKey)
+        if outDf_8pt1 is not None:
+            return "success function", outDf_8pt1
+
+        if groupedDF is None:
+            # Average Distance Meters, Standard Error, Record Count, Minimum and Maximum Difference by Event Group and Segment - single grouped pass over 'Distance'
+            outDf_8pt1 = inDF.groupby(['Event_Group_ID', 'Region', 'Segment'], observed=True, as_index=False).agg(
+                AverageDist_M=('Distance', 'mean'), StandardError=('Distance', 'sem'), RecCount=('Distance', 'count'), MinDifference=('Distance', 'min'), MaxDifference=('Distance', 'max'))
+
+            #Create Degree of Freedom field (N-1)
+            outDf_8pt1['DOF'] = outDf_8pt1['RecCount'] - 1
+        else:
+            #Grouped table with the DOF field from the running aggregates ('stream_SummarizeFigure8_1')
+            outDf_8pt1 = groupedDF.copy()
+
+        ##################################
+        #Calculate the Confidence Interval
+        ##################################
+        with profile_Stage('calc_CI', rowsIn=len(outDf_8pt1)) as stage:
+            outVal = calc_CI(outDf_8pt1, confidence)
+            stage['rowsOut'] = len(outDf_8pt1)
+        if outVal[0].lower() != "success function":
+            print("WARNING - Function calc_CI95 - Failed - Exiting Script")
+            exit()
+        else:
+            print("Success - Function calc_CI95")
+            outDf_8pt1 = outVal[1]
+
+        #Bootstrapped Confidence Interval - needs the Distance records, not available from the running aggregates
+        if bootstrapCI and inDF is not None:
+            outVal = calc_BootstrapCI(inDF, ['Event_Group_ID', 'Region', 'Segment'], confidence, bootstrapSamples)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function calc_BootstrapCI - Failed - Exiting Script")
+                exit()
+            outDf_8pt1 = pd.merge(outDf_8pt1, outVal[1].astype({'Region': outDf_8pt1['Region'].dtype, 'Segment': outDf_8pt1['Segment'].dtype}), how='left', on=['Event_Group_ID', 'Region', 'Segment'])
+
+        #Minimum and Maximum Difference after the Confidence Interval fields
+        for field in ('MinDifference', 'MaxDifference'):
+            outDf_8pt1[field] = outDf_8pt1.pop(field)
+
+        #Sort by Numeric Segment Number
+        outDf_8pt1['SortField'] = outDf_8pt1['Segment'].str.replace('Segment_', '')
+        #Convert Sort Field to Integer
+        outDf_8pt1['SortField'] = pd.to_numeric(outDf_8pt1['SortField'], errors='coerce', downcast='integer')
+        #Sort on Segment Number
+        outDf_8pt1.sort_values(by=['SortField'], kind='stable', inplace = True)
+        #Set index Field to Sort Field
+        outDf_8pt1.set_index('SortField', inplace=True)
+        #Drop 'DOF' field
+        outDf_8pt1.drop(columns=['DOF'], inplace=True)
+        cache_Store(cacheKey, outDf_8pt1)
+
+        return "success function", outDf_8pt1
+
+    except:
+        messageTime = timeFun()
+        print("Error on SummarizeFigure8_1 Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'SummarizeFigure8_1'"
+
+
+#Calculate the Confidence Interval Upper 95% and Lower 95% usinga Sutdents T Distribution
+#Student T Distribution is defined as t_crit = np.abs(t.ppf((1-confidence)/2,dof))
+#CI Upper and lower is: (Mean - Standard Deviation *t_crit/np.sqrt(n))  and  (Mean + Standard Deviation *t_crit/np.sqrt(n))   where n = number of records
+#'confidence' may be a single level or a list of levels - Lower/Upper CI fields are added for each level
+def calc_CI(inDF, confidence):
+
+    try:
+        confidenceList = confidence if isinstance(confidence, (list, tuple)) else [confidence]
+        sqrtN = np.sqrt(inDF['RecCount'].to_numpy(dtype='float64'))
+
+        for confidenceLevel in confidenceList:
+            #Calculate the Student T's Distribution - one t.ppf call per unique DOF
+            tCrit = defineStudentT(inDF['DOF'].to_numpy(), confidenceLevel)
+
+            #Convert CI to Str
+            confidenceStr = str(confidenceLevel)
+            marginCI = inDF['StandardError'].to_numpy(dtype='float64') * tCrit / sqrtN
+
+            #Calculate Lower Confidence Interval
+            inDF['LowerCI_' + confidenceStr] = inDF['AverageDist_M'] - marginCI
+
+            # Calculate Upper Confidence Interval
+            inDF['UpperCI_' + confidenceStr] = inDF['AverageDist_M'] + marginCI
+
+        return "success function", inDF
+
+    except:
+        messageTime = timeFun()
+        print("Error on calc_CI Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'calc_CI95'"
+
+
+#Bootstrapped Confidence Interval of the Average Distance by group - percentile method. Each group is resampled as one (samples x records) array
+#Output DataFrame with the group fields and BootLowerCI/BootUpperCI fields for each confidence level
+def calc_BootstrapCI(inDF, groupFields, confidence, nSamples, seed=None):
+
+    try:
+        confidenceList = confidence if isinstance(confidence, (list, tuple)) else [confidence]
+        rng = np.random.default_rng(seed)
+
+        recordList = []
+        for groupKey, distances in inDF.groupby(groupFields, observed=True)['Distance']:
+            distances = distances.dropna().to_numpy(dtype='float64')
+            record = dict(zip(groupFields, groupKey))
+
+            if len(distances) > 1:
+                resampleMeans = distances[rng.integers(0, len(distances), size=(nSamples, len(distances)))].mean(axis=1)
+            for confidenceLevel in confidenceList:
+                if len(distances) > 1:
+                    lower, upper = np.quantile(resampleMeans, [(1 - confidenceLevel) / 2, 1 - (1 - confidenceLevel) / 2])
+                else:
+                    lower, upper = np.nan, np.nan
+                record['BootLowerCI_' + str(confidenceLevel)] = lower
+                record['BootUpperCI_' + str(confidenceLevel)] = upper
+
+            recordList.append(record)
+
+        return "success function", pd.DataFrame(recordList)
+
+    except:
+        messageTime = timeFun()
+        print("Error on calc_BootstrapCI Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'calc_BootstrapCI'"
+
+
+# Summarize via a CrossTab/Pivot Table the Absolute Cover By Region, Community, Strata and Taxon across point locations
+#Output Dictionary of the Region Tables (in 'regionList' order) - exported to the SOP8-2 sheets by 'export_Workbook'
+def defineRecords_VegCoverByPointAbsolute(markerDataset, regionList):
+    try:
+        cacheKey = define_CacheKey('defineRecords_VegCoverByPointAbsolute', {'regionList': regionList}, [markerDataset['vegetation']])
+        regionTables = cache_Load(cacheKey)
+        if regionTables is not None:
+            return "success function", regionTables
+
+        #Absolute Cover Crosstab for all Regions - compact, only the Taxon/Location cells with records
+        vegCrosstab = pivot_VegCoverAbsolute(markerDataset['vegetation'])
+
+        # Process By Region
+        regionTables = {}
+        for count, region in enumerate(regionList):
+
+            #Region Table - Location Names in the Region as columns
+            regionTables[region] = regionTable_VegCoverAbsolute(vegCrosstab, region)
+
+            messageTime = timeFun()
+            scriptMsg = "Success:  defineRecords_VegCoverBySegment - " + region + " - " + messageTime
+            print(scriptMsg)
+        cache_Store(cacheKey, regionTables)
+
+        return "success function", regionTables
+
+    except:
+        messageTime = timeFun()
+        print("Error on defineRecords_VegCoverByPointAbsolute Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'defineRecords_VegCoverByPointAbsolute'"
+
+#Open the writer of workbook 'outFull' - with 'streamingExcel' an xlsxwriter workbook in 'constant_memory' mode (sheets are streamed row by row so only
+#the current row is held by the writer), otherwise the default pandas Excel writer
+def open_WorkbookWriter(outFull):
+
+    if streamingExcel:
+        import xlsxwriter
+        return xlsxwriter.Workbook(outFull, {'constant_memory': True})
+
+    return pd.ExcelWriter(outFull)
+
+#Write a Table to sheet 'sheetName' of the open workbook writer
+def write_WorkbookSheet(writer, sheetName, outDF):
+
+    with profile_Stage('export_Workbook', rowsIn=len(outDF), sheet=sheetName) as stage:
+        if streamingExcel:
+            worksheet = writer.add_worksheet(sheetName)
+            worksheet.write_row(0, 0, [str(field) for field in outDF.columns])
+            for rowIndex, row in enumerate(outDF.itertuples(index=False, name=None), start=1):
+                worksheet.write_row(rowIndex, 0, [None if pd.isna(value) else value for value in row])
+        else:
+            outDF.to_excel(writer, sheet_name=sheetName, index=False)
+        stage['rowsOut'] = len(outDF)
+
+#Close the workbook writer - the workbook file is completed
+def close_WorkbookWriter(writer):
+
+    with profile_Stage('export_Workbook - close', sheet=None):
+        writer.close()
+
+#Excel sheet name limits - at most 31 characters, none of these characters, unique in the workbook ignoring case
+sheetNameChars = 31
+sheetNameInvalid = '[]:*?/\\'
+
+#SOP8-2 sheet name of each Region in 'regionList' - 'SOP8-2-AbsCov-<Region>' with characters Excel does not allow replaced by '_'. Names over 31 characters
+#are truncated and names matching an earlier Region's (ignoring case) take a '~<n>' suffix, the Regions renamed are logged
+def define_RegionSheetNames(regionList):
+
+    sheetNames = {}
+    usedNames = set()
+    for region in regionList:
+        baseName = ''.join('_' if char in sheetNameInvalid else char for char in 'SOP8-2-AbsCov-' + str(region))
+        sheetName = baseName[:sheetNameChars]
+        count = 1
+        while sheetName.lower() in usedNames:
+            count += 1
+            sheetName = baseName[:sheetNameChars - len(str(count)) - 1] + '~' + str(count)
+        usedNames.add(sheetName.lower())
+        sheetNames[region] = sheetName
+
+        if sheetName != 'SOP8-2-AbsCov-' + str(region):
+            scriptMsg = "Region " + str(region) + " - Table SOP8-2 exported to sheet: " + sheetName
+            print(scriptMsg)
+            log_Message(scriptMsg, stage='define_RegionSheetNames', region=region)
+
+    return sheetNames
+
+#Export the Tables to the workbook 'outFull' - one sheet per entry of 'sheetDict' (sheet name: DataFrame), all written in one pass by a single writer
+def export_Workbook(outFull, sheetDict):
+    try:
+
+        writer = open_WorkbookWriter(outFull)
+        for sheetName, outDF in sheetDict.items():
+            write_WorkbookSheet(writer, sheetName, outDF)
+        close_WorkbookWriter(writer)
+
+        for sheetName in sheetDict:
+            messageTime = timeFun()
+            scriptMsg = "Successfully Exported Table " + sheetName + " - to: " + outFull + " - " + messageTime
+            print(scriptMsg)
+            log_Message(scriptMsg, stage='export_Workbook')
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on export_Workbook Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'export_Workbook'"
+
+#Stratum colours of the SOP8-3 stacked bars (stack and legend order)
+stratumColors = {'Tree': 'orange', 'Shrub': 'red', 'Herb': 'turquoise'}
+
+#Build the SOP8-3 Figure for a Region - Marsh Side (top) and Mangrove Side (bottom) stacked Absolute Cover by Stratum for each Marker Point.
+#Built on a stand alone Figure (object oriented API) so nothing is held in pyplot's global state
+def build_CoverByStratumFigure(regionDF, region):
+
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(8, 6))
+    axList = figure.subplots(2, 1)
+
+    locationNames = regionDF['Location_Name'].astype(str).to_numpy()
+    xPosition = np.arange(len(locationNames))
+
+    for ax, community, side in ((axList[0], 'Marsh', 'Marsh Side'), (axList[1], 'Mangrove', 'Mangrove Side')):
+        bottom = np.zeros(len(locationNames))
+        for stratum, color in stratumColors.items():
+            cover = np.nan_to_num(regionDF['AbsCover_' + community + '_' + stratum].to_numpy(dtype='float64'))
+            ax.bar(xPosition, cover, width=0.5, bottom=bottom, color=color, label=stratum)
+            bottom += cover
+
+        ax.set_title(side + " - " + region)
+        ax.set_xlabel("Marker Points")
+        ax.set_ylabel("Absolute Percent Cover (%)")
+        ax.set_xticks(xPosition)
+        ax.set_xticklabels(locationNames, rotation=90)
+        ax.set_xlim(-0.5, len(locationNames) - 0.5)
+        ax.set_ylim(0, 100)
+        ax.grid(axis='y')
+        ax.set_axisbelow(True)
+        ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+
+    figure.tight_layout(pad=0.4)
+
+    return figure
+
+#Render the SOP8-3 page for a Region to single page pdf bytes - run in a worker process by 'figure_CoverByStratum'
+def render_CoverByStratumPage(region, regionDF):
+
+    import io
+    startTime = time.perf_counter()
+    figure = build_CoverByStratumFigure(regionDF, region)
+    pageBuffer = io.BytesIO()
+    figure.savefig(pageBuffer, format='pdf')
+    figure.clear()
+
+    return pageBuffer.getvalue(), time.perf_counter() - startTime
+
+#Create  Figures - Absolute Cover By Region, By Community, By Strata - one page per Region in 'outPDF'.
+#Pages are rendered in worker processes and assembled in Region order when 'pypdf' is installed, otherwise rendered in this process
+def figure_CoverByStratum(inDF, outPDF, regionList):
+    try:
+
+        #Subset By Region - one grouping pass over the records
+        regionFrames = list(partition_Frame(inDF, regionList).values())
+
+        #Pages are rendered in worker processes and merged with pypdf when it is installed
+        renderParallel = len(regionList) > 1 and maxWorkers != 1 and importlib.util.find_spec('pypdf') is not None
+
+        if renderParallel:
+            import io
+            from concurrent.futures import ProcessPoolExecutor
+            from pypdf import PdfWriter
+
+            with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+                pageList = list(executor.map(render_CoverByStratumPage, regionList, regionFrames))
+
+            #Assemble the pages in Region order - worker timings are recorded as stages of this run
+            pdfWriter = PdfWriter()
+            for region, regionDF, (page, seconds) in zip(regionList, regionFrames, pageList):
+                pdfWriter.append(io.BytesIO(page))
+                if profileRun:
+                    stageRecords.append({'stage': 'render_CoverByStratumPage', 'rowsIn': len(regionDF), 'region': region,
+                                         'worker': True, 'seconds': round(seconds, 4)})
+            with open(outPDF, "wb") as pdfOut:
+                pdfWriter.write(pdfOut)
+
+        else:
+            from matplotlib.backends.backend_pdf import PdfPages
+            with PdfPages(outPDF) as pdf:
+                for region, regionDF in zip(regionList, regionFrames):
+                    with profile_Stage('render_CoverByStratumPage', rowsIn=len(regionDF), region=region):
+                        figure = build_CoverByStratumFigure(regionDF, region)
+                        pdf.savefig(figure)
+                        figure.clear()  #Release the Figure once saved
+
+        for region in regionList:
+            messageTime = timeFun()
+            scriptMsg = "Successfully Exported Figures Region:" + region + " - " + messageTime
+            print(scriptMsg)
+            log_Message(scriptMsg, stage='figure_CoverByStratum', region=region)
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  figure_CoverByStratum" + messageTime
+        print(scriptMsg)
+
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on figure_CoverByStratum Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'figure_CoverByStratum'"
+
+
+#Calculate Absolute Cover By Stratum and Community type in table 'tbl_MarkerData' - from the Marker Visit Dataset
+def defineRecords_CoverByStratum(markerDataset):
+    try:
+        cacheKey = define_CacheKey('defineRecords_CoverByStratum', {}, [markerDataset['markerVisits']])
+        outDF = cache_Load(cacheKey)
+        if outDF is not None:
+            return "success function", outDF
+
+        markerDF = markerDataset['markerVisits']
+        outDF = markerDF[['Location_ID', 'Order_ID', 'Region', 'Location_Name', 'Event_ID', 'Start_Date']].copy()
+
+        #Absolute Cover by Side and Stratum - Overall Cover * (Stratum Cover/100)
+        for side, community in (('MangroveSide', 'Mangrove'), ('MarshSide', 'Marsh')):
+            outDF[side + '_Cover_Overall'] = markerDF[side + '_Cover_Overall']
+            for stratum in ('Tree', 'Shrub', 'Herb'):
+                outDF[side + '_Cover_' + stratum] = markerDF[side + '_Cover_' + stratum]
+            for stratum in ('Tree', 'Shrub', 'Herb'):
+                outDF['AbsCover_' + community + '_' + stratum] = markerDF[side + '_Cover_Overall'] * (markerDF[side + '_Cover_' + stratum] / 100)
+
+        outDF.sort_values(by=['Order_ID', 'Location_Name', 'Start_Date'], inplace=True)
+        outDF.reset_index(drop=True, inplace=True)
+        cache_Store(cacheKey, outDF)
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  defineRecords_CoverByStratum" + messageTime
+        print(scriptMsg)
+
+        return "success function", outDF
+
+    except:
+        messageTime = timeFun()
+        print("Error on defineRecords_CoverByStratum Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'defineRecords_CoverByStratum'"
+
+
+
+#Extract Mangrove Marsh Distance Records table 'tbl_MarkerData' where Event Type = 'Marker Visit' - from the Marker Visit Dataset
+def defineRecords_MarkerData(markerDataset):
+    try:
+        cacheKey = define_CacheKey('defineRecords_MarkerData', {}, [markerDataset['markerVisits']])
+        outDF = cache_Load(cacheKey)
+        if outDF is not None:
+            return "success function", outDF
+
+        outDF = markerDataset['markerVisits'][['Event_Group_ID', 'Event_Group_Name', 'Start_Date', 'End_Date', 'Assessment', 'Event_Type', 'Location_ID', 'Region', 'Segment', 'Location_Name', 'Distance', 'Method']]
+        outDF = outDF.sort_values(by=['Segment', 'Location_Name']).reset_index(drop=True)
+        cache_Store(cacheKey, outDF)
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  defineRecords_MarkerData" + messageTime
+        print(scriptMsg)
+
+        return "success function", outDF
+
+    except:
+        messageTime = timeFun()
+        print("Error on defineRecords_MarkderData Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'defineRecords'"
+
+
+#Fields in the Marker Visit Dataset held as categoricals
+markerCategoryFields = ['Region', 'Segment', 'Location_Name', 'CommunityType', 'VegetationType']
+
+#Extract the Marker Visit Dataset - 'tbl_MarkerData' records where Event Type = 'Marker Visit' joined to Locations and Event Groups (indexed on Point_ID),
+#and the 'tbl_MarkerData_Vegetation' cover records (Percent Cover not null) joined to the marker visits. Queried once per run, all SOP products are derived from it.
+#'includeVegetation' False leaves the vegetation table empty (the SOP8-2 records are streamed)
+def defineRecords_MarkerVisitDataset(includeVegetation=True):
+    try:
+        cacheKey = define_CacheKey('defineRecords_MarkerVisitDataset', {'markerCategoryFields': markerCategoryFields, 'includeVegetation': includeVegetation})
+        markerDataset = cache_Load(cacheKey)
+        if markerDataset is not None:
+            return "success function", markerDataset
+
+        inQuery = "SELECT tbl_MarkerData.Point_ID, tbl_Event_Group.Event_Group_ID, tbl_Event_Group.Event_Group_Name, tbl_Event_Group.Start_Date, tbl_Event_Group.End_Date, tbl_Event_Group.Assessment,"\
+                " tbl_Events.Event_ID, tbl_Events.Event_Type, tbl_Events.Location_ID, tbl_Locations.Order_ID, tbl_Locations.Region, tbl_Locations.Segment, tbl_Locations.Location_Name, tbl_MarkerData.Distance, tbl_MarkerData.Method,"\
+                " tbl_MarkerData.MangroveSide_Cover_Overall, tbl_MarkerData.MangroveSide_Cover_Tree, tbl_MarkerData.MangroveSide_Cover_Shrub, tbl_MarkerData.MangroveSide_Cover_Herb,"\
+                " tbl_MarkerData.MarshSide_Cover_Overall, tbl_MarkerData.MarshSide_Cover_Tree, tbl_MarkerData.MarshSide_Cover_Shrub, tbl_MarkerData.MarshSide_Cover_Herb"\
+                " FROM " + markerVisitJoin +\
+                " WHERE tbl_Events.Event_Type = 'Marker Visit' ORDER BY tbl_Locations.Order_ID, tbl_Locations.Location_Name, tbl_Event_Group.Start_Date;"
+
+        outVal = query_DataSource(inQuery, inDB)
+        if outVal[0].lower() != "success function":
+            messageTime = timeFun()
+            print("WARNING - Function defineRecords_MarkerVisitDataset - " + messageTime + " - Failed - Exiting Script")
+            exit()
+        markerDF = outVal[1]
+
+        #Categorical Region/Segment/Location Name - compact and fast to group on
+        for field in markerCategoryFields:
+            if field in markerDF:
+                markerDF[field] = markerDF[field].astype('category')
+        markerDF.set_index('Point_ID', inplace=True)
+
+        #Monitoring Year of the Event Group
+        markerDF['Start_Date'] = pd.to_datetime(markerDF['Start_Date'])
+        markerDF['Year'] = markerDF['Start_Date'].dt.year
+
+        if includeVegetation:
+            outVal = defineRecords_MarkerVegetation(markerDF)
+            if outVal[0].lower() != "success function":
+                messageTime = timeFun()
+                print("WARNING - Function defineRecords_MarkerVisitDataset - " + messageTime + " - Failed - Exiting Script")
+                exit()
+            vegDF = outVal[1]
+        else:  #Vegetation records are streamed ('stream_VegCoverByPointAbsolute') or queried later ('defineRecords_MarkerVegetation') - empty vegetation table
+            vegDF = join_MarkerVegetation(pd.DataFrame({'Point_ID': pd.Series(dtype='int64'), 'CommunityType': pd.Series(dtype=object), 'VegetationType': pd.Series(dtype=object),
+                                                        'ScientificName': pd.Series(dtype=object), 'PercentCover': pd.Series(dtype='float64')}), markerDF)
+
+        markerDataset = {'markerVisits': markerDF, 'vegetation': vegDF}
+        cache_Store(cacheKey, markerDataset)
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  defineRecords_MarkerVisitDataset - Marker Visits: " + str(len(markerDF)) + " - Vegetation Records: " + str(len(vegDF)) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='defineRecords_MarkerVisitDataset')
+
+        return "success function", markerDataset
+
+    except:
+        messageTime = timeFun()
+        print("Error on defineRecords_MarkerVisitDataset Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'defineRecords_MarkerVisitDataset'"
+
+
+#Vegetation records at the Marker Visits with the Location and Marker Cover fields - Community/Vegetation Type as categoricals, indexed on Point_ID
+def join_MarkerVegetation(vegDF, markerDF):
+
+    for field in markerCategoryFields:
+        if field in vegDF:
+            vegDF[field] = vegDF[field].astype('category')
+
+    vegDF = vegDF.join(markerDF[['Event_Group_ID', 'Event_ID', 'Start_Date', 'Year', 'Region', 'Segment', 'Location_Name', 'Order_ID', 'MangroveSide_Cover_Overall', 'MangroveSide_Cover_Tree', 'MangroveSide_Cover_Shrub',
+                                 'MangroveSide_Cover_Herb', 'MarshSide_Cover_Overall', 'MarshSide_Cover_Tree', 'MarshSide_Cover_Shrub', 'MarshSide_Cover_Herb']], on='Point_ID', how='inner')
+    vegDF.set_index('Point_ID', inplace=True)
+
+    return vegDF
+
+#Extract the 'tbl_MarkerData_Vegetation' cover records (Percent Cover not null) joined to the Marker Visits ('markerVisits' of the Marker Visit Dataset)
+def defineRecords_MarkerVegetation(markerDF):
+    try:
+        inQuery = "SELECT tbl_MarkerData_Vegetation.Point_ID, tbl_MarkerData_Vegetation.CommunityType, tbl_MarkerData_Vegetation.VegetationType, tlu_Vegetation.ScientificName, tbl_MarkerData_Vegetation.PercentCover"\
+                " FROM tbl_MarkerData_Vegetation LEFT JOIN tlu_Vegetation ON tbl_MarkerData_Vegetation.SpeciesCode = tlu_Vegetation.SpeciesCode"\
+                " WHERE NOT (tbl_MarkerData_Vegetation.PercentCover IS NULL);"
+
+        outVal = query_DataSource(inQuery, inDB)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'defineRecords_MarkerVegetation'"
+
+        return "success function", join_MarkerVegetation(outVal[1], markerDF)
+
+    except:
+        messageTime = timeFun()
+        print("Error on defineRecords_MarkerVegetation Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'defineRecords_MarkerVegetation'"
+
+
+#Community Types (Mangrove/Marsh Side) and Vegetation Types (Stratum) of the SOP8-2 Absolute Cover - lookup position is Community index * 3 + Stratum index
+vegCommunitySides = {'Mangrove': 'MangroveSide', 'Marsh': 'MarshSide'}
+vegStrata = ['Tree', 'Shrub', 'Herb']
+
+#Absolute Cover of each vegetation record - Overall Cover * (Stratum Cover/100) * (Percent Cover/100) for the Community Type and Vegetation Type of the record.
+#Community/Vegetation Type are resolved to a column of the (records x 6) Stratum Cover array by lookup, unmatched records are -999 (as the SOP8-2 IIf fallthrough)
+def calc_VegCoverAbsolute(vegDF):
+
+    communityIndex = pd.Index(list(vegCommunitySides)).get_indexer(vegDF['CommunityType'])
+    stratumIndex = pd.Index(vegStrata).get_indexer(vegDF['VegetationType'])
+    lookupIndex = np.where((communityIndex >= 0) & (stratumIndex >= 0), communityIndex * len(vegStrata) + stratumIndex, -1)
+
+    overallCover = vegDF[[side + '_Cover_Overall' for side in vegCommunitySides.values()]].to_numpy(dtype='float64')
+    stratumCover = vegDF[[side + '_Cover_' + stratum for side in vegCommunitySides.values() for stratum in vegStrata]].to_numpy(dtype='float64')
+
+    rows = np.arange(len(vegDF))
+    safeIndex = np.maximum(lookupIndex, 0)
+    absCover = overallCover[rows, safeIndex // len(vegStrata)] * (stratumCover[rows, safeIndex] / 100) * (vegDF['PercentCover'].to_numpy(dtype='float64') / 100)
+
+    return np.where(lookupIndex >= 0, absCover, -999)
+
+#Crosstab the Absolute Cover for all Regions in one pass - Taxon rows (Region, Community Type, Vegetation Type, Scientific Name) by Location Name columns.
+#Returns the compact crosstab of 'crosstab_VegCoverAbsolute'
+def pivot_VegCoverAbsolute(vegDF):
+
+    keyFields = ['Region', 'CommunityType', 'VegetationType', 'ScientificName']
+    absCoverDF = vegDF[keyFields + ['Location_Name']].copy()
+    absCoverDF['AbsolutePercCover'] = calc_VegCoverAbsolute(vegDF)
+
+    longSeries = absCoverDF.groupby(keyFields + ['Location_Name'], observed=True, dropna=False)['AbsolutePercCover'].sum(min_count=1)
+
+    return crosstab_VegCoverAbsolute(sort_VegCoverAbsolute(longSeries))
+
+#Long Absolute Cover totals in SOP8-2 order - ORDER BY Community Type, Vegetation Type, Scientific Name with Nulls first as in Access. A null key of a 'dropna=False'
+#groupby is a level value of the index (not a missing code), so 'sort_index' would leave it last - the totals are sorted on the key values instead
+def sort_VegCoverAbsolute(longSeries):
+
+    keyDF = longSeries.index.to_frame(index=False)
+    return longSeries.iloc[keyDF.sort_values(by=list(keyDF.columns), na_position='first').index]
+
+#Compact Absolute Cover crosstab from the sorted long totals - only the Taxon/Location cells with a record are held (compressed by Location):
+#'taxa' - Taxon axis (Region, Community Type, Vegetation Type, Scientific Name categoricals), row position is the taxon code in SOP8-2 order
+#'locations' - Location axis (Region, Location Name categoricals) sorted by Region and Location Name, row position is the location code
+#'taxonCodes'/'values' - taxon code and Absolute Cover of each cell, ordered by location code. The cells of location n are [locationOffsets[n], locationOffsets[n + 1])
+#The Locations of a Region are consecutive codes, so a Region table or a Marker Point lookup is one slice of the cell arrays
+def crosstab_VegCoverAbsolute(longSeries):
+
+    keyFields = ['Region', 'CommunityType', 'VegetationType', 'ScientificName']
+    longDF = longSeries.reset_index()
+    longDF['Region'] = longDF['Region'].astype(str)
+    longDF['Location_Name'] = longDF['Location_Name'].astype(str)
+
+    #Taxon axis in first appearance (sorted) order
+    taxonCodes = longDF.groupby(keyFields, sort=False, dropna=False, observed=True).ngroup().to_numpy(dtype='int32')
+    taxaDF = longDF[keyFields].drop_duplicates().reset_index(drop=True)
+
+    #Location axis by Region and Location Name
+    locationDF = longDF[['Region', 'Location_Name']].drop_duplicates().sort_values(by=['Region', 'Location_Name']).reset_index(drop=True)
+    locationCodes = pd.MultiIndex.from_frame(locationDF).get_indexer(pd.MultiIndex.from_frame(longDF[['Region', 'Location_Name']]))
+
+    cellOrder = np.argsort(locationCodes, kind='stable')
+    locationOffsets = np.searchsorted(locationCodes[cellOrder], np.arange(len(locationDF) + 1))
+
+    return {'taxa': taxaDF.astype('category'), 'locations': locationDF.astype('category'), 'taxonCodes': taxonCodes[cellOrder],
+            'values': longDF['AbsolutePercCover'].to_numpy(dtype='float64')[cellOrder], 'locationOffsets': locationOffsets,
+            'regionLocations': locationDF.groupby('Region', sort=False).indices}
+
+#Location codes of a Region in the compact crosstab - a consecutive range, looked up in the 'regionLocations' index of the crosstab
+def regionLocations_VegCoverAbsolute(vegCrosstab, region):
+
+    return vegCrosstab['regionLocations'].get(region, np.array([], dtype='int64'))
+
+#Dense SOP8-2 table for a Region from the compact crosstab - the TRANSFORM/PIVOT layout with the Location Names of the Region as columns
+def regionTable_VegCoverAbsolute(vegCrosstab, region):
+
+    locationCodes = regionLocations_VegCoverAbsolute(vegCrosstab, region)
+    if len(locationCodes) == 0:
+        return pd.DataFrame(columns=['Region', 'CommunityType', 'VegetationType', 'ScientificName'])
+
+    locationOffsets = vegCrosstab['locationOffsets'][locationCodes[0]:locationCodes[-1] + 2]
+    cellSlice = slice(locationOffsets[0], locationOffsets[-1])
+    cellTaxa = vegCrosstab['taxonCodes'][cellSlice]
+    cellLocations = np.repeat(np.arange(len(locationCodes)), np.diff(locationOffsets))
+
+    #Taxon rows of the Region in SOP8-2 order
+    regionTaxa, cellRows = np.unique(cellTaxa, return_inverse=True)
+    coverArray = np.full((len(regionTaxa), len(locationCodes)), np.nan)
+    coverArray[cellRows, cellLocations] = vegCrosstab['values'][cellSlice]
+
+    regionDF = vegCrosstab['taxa'].iloc[regionTaxa].reset_index(drop=True)
+    regionDF = regionDF.astype({'Region': str, 'CommunityType': str, 'VegetationType': str, 'ScientificName': object})
+    locationNames = vegCrosstab['locations']['Location_Name'].iloc[locationCodes].astype(str).tolist()
+
+    return pd.concat([regionDF, pd.DataFrame(coverArray, columns=locationNames)], axis=1)
+
+#Absolute Cover at a Marker Point (Region and Location Name) - Series of the cover by taxon (Community Type, Vegetation Type, Scientific Name)
+def pointCover_VegCoverAbsolute(vegCrosstab, region, locationName):
+
+    locationCodes = regionLocations_VegCoverAbsolute(vegCrosstab, region)
+    locationCodes = locationCodes[(vegCrosstab['locations']['Location_Name'].iloc[locationCodes] == locationName).to_numpy()]
+    if len(locationCodes) == 0:
+        return pd.Series(dtype='float64')
+
+    cellSlice = slice(vegCrosstab['locationOffsets'][locationCodes[0]], vegCrosstab['locationOffsets'][locationCodes[0] + 1])
+    taxonIndex = pd.MultiIndex.from_frame(vegCrosstab['taxa'].iloc[vegCrosstab['taxonCodes'][cellSlice]][['CommunityType', 'VegetationType', 'ScientificName']])
+
+    return pd.Series(vegCrosstab['values'][cellSlice], index=taxonIndex, name=locationName)
+
+
+#Data Source Openers by 'dataSourceType' - each returns an open DB-API connection to a database with the Mangrove Marsh tables
+def open_AccessDB(inDB):
+    import pyodbc
+    connStr = (r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=" + inDB + ";")
+    return pyodbc.connect(connStr)
+
+#SQLite connections may be used from the overlapped pipeline fetch thread - only one thread queries the session at a time
+def open_SQLiteDB(inDB):
+    import sqlite3
+    return sqlite3.connect(inDB, check_same_thread=False)
+
+def open_DuckDB(inDB):
+    import duckdb
+    return duckdb.connect(inDB, read_only=True)
+
+dataSourceOpeners = {'access': open_AccessDB, 'sqlite': open_SQLiteDB, 'duckdb': open_DuckDB}
+
+#Data Source Session - one connection is opened per run and shared by all queries
+dataSession = {'connection': None, 'sourceType': None, 'inDB': None, 'fingerprint': None}
+
+#Open the Data Source Session for 'inDB' - an already open session on the same database is reused
+def open_DataSource(inDB, sourceType):
+
+    try:
+        sourceType = sourceType.lower()
+        if dataSession['connection'] is not None:
+            if dataSession['inDB'] == inDB and dataSession['sourceType'] == sourceType:
+                return "success function", dataSession['connection']
+            close_DataSource()
+
+        if sourceType not in dataSourceOpeners:
+            raise ValueError("Unsupported dataSourceType: " + sourceType + " - Supported: " + ", ".join(dataSourceOpeners))
+
+        cnxn = dataSourceOpeners[sourceType](inDB)
+        dataSession.update({'connection': cnxn, 'sourceType': sourceType, 'inDB': inDB, 'fingerprint': None})
+
+        return "success function", cnxn
+
+    except:
+        messageTime = timeFun()
+        scriptMsg = "Error function:  open_DataSource - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, logging.ERROR, withTraceback=True, stage='open_DataSource')
+        traceback.print_exc(file=sys.stdout)
+        return "failed function"
+
+#Close the Data Source Session
+def close_DataSource():
+
+    if dataSession['connection'] is not None:
+        try:
+            dataSession['connection'].close()
+        except:
+            traceback.print_exc(file=sys.stdout)
+        dataSession.update({'connection': None, 'sourceType': None, 'inDB': None, 'fingerprint': None})
+
+
+#Perform defined query on the Data Source Session - return query in a dataframe
+def query_DataSource(query, inDB):
+
+    try:
+        #Use the open session - otherwise open 'inDB'
+        if dataSession['connection'] is None:
+            outVal = open_DataSource(inDB, dataSourceType)
+            if outVal[0].lower() != "success function":
+                return "failed function"
+        cnxn = dataSession['connection']
+
+        cacheKey = define_CacheKey('query_DataSource', {'query': query})
+        queryDf = cache_Load(cacheKey)
+        if queryDf is not None:
+            return "success function", queryDf
+
+        with profile_Stage('query_DataSource', sourceType=dataSession['sourceType'], query=query[:120]) as stage:
+            if hasattr(cnxn, 'df'):  #DuckDB connection - fetch the result straight to a DataFrame
+                queryDf = cnxn.execute(query).df()
+            else:
+                queryDf = pd.read_sql(query, cnxn)
+            stage['rowsOut'] = len(queryDf)
+        cache_Store(cacheKey, queryDf)
+
+        return "success function", queryDf
+
+    except:
+        messageTime = timeFun()
+        scriptMsg = "Error function:  query_DataSource - " +  messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, logging.ERROR, withTraceback=True, stage='query_DataSource')
+        traceback.print_exc(file=sys.stdout)
+        return "failed function"
+
+#Perform defined query on the Data Source Session and yield the result in DataFrames of up to 'chunkSize' rows (DB-API fetchmany) - the full result is never held.
+#Fields are named from the cursor description - alias joined fields ('AS') so every driver returns the plain field name
+def query_DataSourceChunks(query, inDB, chunkSize):
+
+    if dataSession['connection'] is None:
+        outVal = open_DataSource(inDB, dataSourceType)
+        if outVal[0].lower() != "success function":
+            raise RuntimeError("Failed to open the Data Source: " + str(inDB))
+
+    cursor = dataSession['connection'].cursor()
+    try:
+        cursor.execute(query)
+        fieldList = [field[0] for field in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunkSize)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records([tuple(row) for row in rows], columns=fieldList)
+    finally:
+        cursor.close()
+
+#######################################
+# Partition Index
+#######################################
+#Region -> Segment -> Location Names of 'tbl_Locations' in Order_ID order, built once per run. Every report stage iterates the Regions in index order and
+#subsets its records with 'partition_Frame' (one grouping pass), so a Region added to 'tbl_Locations' is reported without code changes
+partitionIndex = {}
+
+#Build the Partition Index from 'tbl_Locations' - limited to the Regions in 'regionList' when defined (Order_ID order is kept)
+def define_PartitionIndex():
+    try:
+        inQuery = "SELECT tbl_Locations.Region AS Region, tbl_Locations.Segment AS Segment, tbl_Locations.Location_Name AS Location_Name FROM tbl_Locations"\
+                  " WHERE NOT (tbl_Locations.Region IS NULL) ORDER BY tbl_Locations.Order_ID, tbl_Locations.Location_Name;"
+
+        outVal = query_DataSource(inQuery, inDB)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'define_PartitionIndex'"
+
+        regionIndex = {}
+        for region, segment, locationName in outVal[1].itertuples(index=False, name=None):
+            regionIndex.setdefault(region, {}).setdefault(segment, []).append(locationName)
+
+        if regionList is not None:
+            missingRegions = [region for region in regionList if region not in regionIndex]
+            if missingRegions:
+                messageTime = timeFun()
+                scriptMsg = "WARNING - Regions not in tbl_Locations: " + ", ".join(missingRegions) + " - " + messageTime
+                print(scriptMsg)
+                log_Message(scriptMsg, stage='define_PartitionIndex')
+            regionIndex = {region: segmentIndex for region, segmentIndex in regionIndex.items() if region in regionList}
+
+        partitionIndex.clear()
+        partitionIndex.update(regionIndex)
+
+        return "success function", partitionIndex
+
+    except:
+        messageTime = timeFun()
+        print("Error on define_PartitionIndex Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'define_PartitionIndex'"
+
+#Event Groups of the Monitoring Year reported by a single run ('main') - the Event Groups whose Start_Date is in 'monitoringYear', as the Report Units of
+#batch mode. None reports every Event Group (batch mode partitions by year itself, the Report Service and the Trend Analysis use every year)
+reportEventGroups = None
+
+#Set the Report Event Groups to the Event Groups of Monitoring Year 'year' (None - every Event Group)
+def define_ReportEventGroups(year):
+    global reportEventGroups
+    try:
+        if year is None:
+            reportEventGroups = None
+            return "success function", None
+
+        outVal = query_DataSource("SELECT tbl_Event_Group.Event_Group_ID AS Event_Group_ID, tbl_Event_Group.Start_Date AS Start_Date FROM tbl_Event_Group;", inDB)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'define_ReportEventGroups'"
+        groupDF = outVal[1]
+        reportEventGroups = sorted(int(groupID) for groupID in groupDF.loc[pd.to_datetime(groupDF['Start_Date']).dt.year == year, 'Event_Group_ID'])
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  define_ReportEventGroups - Monitoring Year: " + str(year) + " - Event Groups: " + str(len(reportEventGroups)) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='define_ReportEventGroups')
+
+        return "success function", reportEventGroups
+
+    except:
+        messageTime = timeFun()
+        print("Error on define_ReportEventGroups Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'define_ReportEventGroups'"
+
+#SQL condition limiting a query on tbl_Events to the Report Event Groups - appended to the WHERE clause, blank when every Event Group is reported
+def report_GroupFilter():
+
+    if reportEventGroups is None:
+        return ""
+    if not reportEventGroups:
+        return " AND 1 = 0"
+    return " AND tbl_Events.Event_Group_ID IN (" + ", ".join(str(groupID) for groupID in reportEventGroups) + ")"
+
+#Records of the Marker Visit Dataset in the Report Event Groups - the dataset itself when every Event Group is reported
+def filter_ReportDataset(markerDataset):
+
+    if reportEventGroups is None or markerDataset is None:
+        return markerDataset
+    return {name: inDF[inDF['Event_Group_ID'].isin(reportEventGroups).to_numpy()] for name, inDF in markerDataset.items()}
+
+#Subset 'inDF' for each key in 'keyList' (a Region, or a tuple when 'fields' is a list) from one grouping pass - keys without records get an empty subset
+def partition_Frame(inDF, keyList, fields='Region'):
+
+    groupRows = inDF.groupby(fields, observed=True, sort=False).indices
+    noRows = np.array([], dtype='int64')
+
+    return {key: inDF.iloc[groupRows.get(key, noRows)] for key in keyList}
+
+
+#######################################
+# Data Validation (QA)
+#######################################
+#QA Rules over the Marker Visit Dataset - (rule, table, severity, field, check). 'check' returns a boolean array over the table rows (True - violation) and
+#'field' is the value reported for the violation. Severity 'error' counts towards 'qaMaxErrors'
+def define_QARules():
+
+    ruleList = [('Distance is null', 'markerVisits', 'error', 'Distance', lambda inDF: inDF['Distance'].isna().to_numpy())]
+    for side in ('MangroveSide', 'MarshSide'):
+        strataFields = [side + '_Cover_Tree', side + '_Cover_Shrub', side + '_Cover_Herb']
+        ruleList.append((side + ' Overall Cover outside 0-100', 'markerVisits', 'error', side + '_Cover_Overall',
+                         lambda inDF, field=side + '_Cover_Overall': ((inDF[field] < 0) | (inDF[field] > 100)).to_numpy()))
+        for field in strataFields:
+            ruleList.append((side + ' ' + field.split('_')[-1] + ' Cover outside 0-100', 'markerVisits', 'error', field,
+                             lambda inDF, field=field: ((inDF[field] < 0) | (inDF[field] > 100)).to_numpy()))
+        ruleList.append((side + ' Cover is null', 'markerVisits', 'warning', side + '_Cover_Overall',
+                         lambda inDF, fields=[side + '_Cover_Overall'] + strataFields: inDF[fields].isna().any(axis=1).to_numpy()))
+        ruleList.append((side + ' Stratum Covers are 0 with Overall Cover above 0', 'markerVisits', 'warning', side + '_Cover_Overall',
+                         lambda inDF, side=side, fields=strataFields: ((inDF[side + '_Cover_Overall'] > 0) & (inDF[fields].sum(axis=1) == 0)).to_numpy()))
+        ruleList.append((side + ' Stratum Covers above 0 with Overall Cover 0', 'markerVisits', 'warning', side + '_Cover_Overall',
+                         lambda inDF, side=side, fields=strataFields: ((inDF[side + '_Cover_Overall'] == 0) & (inDF[fields].sum(axis=1) > 0)).to_numpy()))
+
+    ruleList.extend([('Percent Cover outside 0-100', 'vegetation', 'error', 'PercentCover', lambda inDF: ((inDF['PercentCover'] < 0) | (inDF['PercentCover'] > 100)).to_numpy()),
+                     ('Absolute Cover -999 - Community/Vegetation Type not matched', 'vegetation', 'error', 'CommunityType', lambda inDF: calc_VegCoverAbsolute(inDF) == -999),
+                     ('Scientific Name is null - Species Code not in tlu_Vegetation', 'vegetation', 'warning', 'ScientificName', lambda inDF: inDF['ScientificName'].isna().to_numpy())])
+
+    return ruleList
+
+qaRules = define_QARules()
+
+#Row key fields of a violation - Point_ID (table index) and the record fields present in the table
+qaKeyFields = ['Event_Group_ID', 'Year', 'Region', 'Location_Name', 'CommunityType', 'VegetationType', 'ScientificName']
+
+#Check the QA Rules over each table of the Marker Visit Dataset - the rule checks of a table are stacked into one (rows x rules) array and the violations
+#are read off its non zero cells. A table is a DataFrame or an iterable of chunk DataFrames (see 'stream_ValidationRecords').
+#Output DataFrame of the violations (rule, severity, table, row keys, field and value) in table/row order and the count of records checked
+def validate_MarkerVisitDataset(markerDataset):
+    try:
+        violationFrames = []
+        recordCount = 0
+        for tableName, tableFrames in markerDataset.items():
+            tableRules = [rule for rule in qaRules if rule[1] == tableName]
+            for inDF in ([tableFrames] if isinstance(tableFrames, pd.DataFrame) else tableFrames):
+                recordCount += len(inDF)
+                if len(inDF) == 0 or not tableRules:
+                    continue
+                outDF = validate_Table(inDF, tableName, tableRules)
+                if outDF is not None:
+                    violationFrames.append(outDF)
+
+        violationColumns = ['Rule', 'Severity', 'Table', 'Point_ID'] + qaKeyFields + ['Field', 'Value']
+        if not violationFrames:
+            return "success function", pd.DataFrame(columns=violationColumns), recordCount
+
+        violationDF = pd.concat(violationFrames, ignore_index=True).reindex(columns=violationColumns)
+        for field in ('Rule', 'Severity', 'Table', 'Region', 'Location_Name', 'CommunityType', 'VegetationType', 'Field'):
+            violationDF[field] = violationDF[field].astype(str).where(violationDF[field].notna()).astype('category')
+
+        return "success function", violationDF, recordCount
+
+    except:
+        messageTime = timeFun()
+        print("Error on validate_MarkerVisitDataset Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'validate_MarkerVisitDataset'"
+
+#Violations of the QA Rules 'tableRules' in the records 'inDF' of table 'tableName' - None when there are none
+def validate_Table(inDF, tableName, tableRules):
+
+    ruleArray = np.column_stack([np.asarray(rule[4](inDF), dtype=bool) for rule in tableRules])
+    rowPositions, rulePositions = np.nonzero(ruleArray)
+    if len(rowPositions) == 0:
+        return None
+
+    violationDF = inDF.iloc[rowPositions][[field for field in qaKeyFields if field in inDF]].reset_index()
+    valueArray = np.empty(len(rowPositions), dtype=object)
+    for ruleNumber, rule in enumerate(tableRules):
+        ruleRows = rulePositions == ruleNumber
+        valueArray[ruleRows] = inDF[rule[3]].to_numpy()[rowPositions[ruleRows]]
+
+    violationDF.insert(0, 'Rule', [tableRules[ruleNumber][0] for ruleNumber in rulePositions])
+    violationDF.insert(1, 'Severity', [tableRules[ruleNumber][2] for ruleNumber in rulePositions])
+    violationDF.insert(2, 'Table', tableName)
+    violationDF['Field'] = [tableRules[ruleNumber][3] for ruleNumber in rulePositions]
+    violationDF['Value'] = [None if pd.isna(value) else str(value) for value in valueArray]
+
+    return violationDF
+
+#QA Stage - validate the Marker Visit Dataset, log the violation counts by rule and export the violations to '<outPrefix>.parquet'.
+#Fails when the error violations exceed 'qaMaxErrors'
+def run_Validation(markerDataset, outPrefix):
+
+    with profile_Stage('validate_MarkerVisitDataset') as stage:
+        outVal = validate_MarkerVisitDataset(markerDataset)
+        if outVal[0].lower() == "success function":
+            stage['rowsIn'] = outVal[2]
+            stage['rowsOut'] = len(outVal[1])
+    if outVal[0].lower() != "success function":
+        return "Failed function - 'run_Validation'"
+    violationDF = outVal[1]
+
+    errorCount = int((violationDF['Severity'] == 'error').sum())
+    messageTime = timeFun()
+    scriptMsg = "QA Validation - Errors: " + str(errorCount) + " - Warnings: " + str(len(violationDF) - errorCount) + " - " + messageTime
+    for rule, ruleCount in violationDF.groupby('Rule', observed=True).size().items():
+        scriptMsg = scriptMsg + "\n    " + rule + ": " + str(ruleCount)
+    print(scriptMsg)
+    log_Message(scriptMsg, stage='run_Validation')
+
+    if len(violationDF) > 0:
+        try:
+            violationDF.to_parquet(outPrefix + ".parquet", index=False)
+        except ImportError:
+            print("QA Violations Parquet not exported - pyarrow is not installed")
+
+    if qaMaxErrors is not None and errorCount > qaMaxErrors:
+        scriptMsg = "WARNING - QA Validation - " + str(errorCount) + " errors exceed 'qaMaxErrors' (" + str(qaMaxErrors) + ") - see " + outPrefix + ".parquet"
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='run_Validation')
+        return "Failed function - 'run_Validation' - QA errors exceed 'qaMaxErrors'"
+
+    return "success function", violationDF
+
+
+#######################################
+# Trend Analysis
+#######################################
+#Long term ecotone trends - the Distance and Absolute Cover by Stratum of each Marker Visit are regressed on the event date (decimal year) by Segment and by Location
+#across every Monitoring Year. Records are reduced to the sums N, x, y, x², xy and y² of each (Level, Region, Segment, Location, Response) group and Monitoring Year
+#in one grouping pass - the least squares fits of every group and every change point split are then calculated from the sums as arrays. The sums of a Monitoring Year
+#only depend on that year's records, so an added year only sums the new records (see 'build_Trends')
+
+#Trend Responses - Distance and the Absolute Cover (Overall Cover * (Stratum Cover/100)) by Community and Stratum
+trendResponses = ['Distance'] + ['AbsCover_' + community + '_' + stratum for community in vegCommunitySides for stratum in vegStrata]
+
+#Group fields of a trend, the sums of a (group, Monitoring Year) and the Marker Visit fields used
+trendGroupFields = ['Level', 'Region', 'Segment', 'Location_Name', 'Response']
+trendSumFields = ['N', 'SumX', 'SumY', 'SumXX', 'SumXY', 'SumYY']
+trendInputFields = ['Year', 'Start_Date', 'Region', 'Segment', 'Location_Name', 'Distance'] + [side + '_Cover_' + cover for side in vegCommunitySides.values() for cover in ['Overall'] + vegStrata]
+
+#Sums of the Trend Responses by Monitoring Year for each Location and each Segment ('Location_Name' is blank) - Output DataFrame with the group fields, Year
+#and the sums in Monitoring Year order. Null responses are left out of the sums
+def trend_YearSums(markerDF):
+    try:
+        recordDF = markerDF[trendInputFields].reset_index(drop=True)
+
+        #Event date as a decimal year
+        startDate = recordDF['Start_Date']
+        xArray = (startDate.dt.year + (startDate.dt.dayofyear - 1) / np.where(startDate.dt.is_leap_year, 366.0, 365.0)).to_numpy(dtype='float64')
+
+        #(records x responses) array - Distance then the Absolute Cover by Community/Stratum in 'trendResponses' order
+        responseList = [recordDF['Distance'].to_numpy(dtype='float64')]
+        for side in vegCommunitySides.values():
+            overallCover = recordDF[side + '_Cover_Overall'].to_numpy(dtype='float64')
+            responseList.extend(overallCover * (recordDF[side + '_Cover_' + stratum].to_numpy(dtype='float64') / 100) for stratum in vegStrata)
+        yArray = np.column_stack(responseList)
+
+        #(records x responses x sums) array - invalid cells add nothing
+        validArray = ~np.isnan(yArray) & ~np.isnan(xArray)[:, None]
+        yValid = np.where(validArray, yArray, 0.0)
+        xValid = np.where(validArray, xArray[:, None], 0.0)
+        sumArray = np.stack([validArray.astype('float64'), xValid, yValid, xValid * xValid, xValid * yValid, yValid * yValid], axis=2)
+
+        #One grouping pass over the (Year, Location) groups in record order - (groups x responses * sums)
+        keyFields = ['Year', 'Region', 'Segment', 'Location_Name']
+        groupCodes, groupKeys = pd.MultiIndex.from_frame(recordDF[keyFields]).factorize()
+        keepRows = groupCodes >= 0
+        groupSums = pd.DataFrame(sumArray[keepRows].reshape(int(keepRows.sum()), len(trendResponses) * len(trendSumFields))).groupby(groupCodes[keepRows]).sum().to_numpy()
+
+        responseCount = len(trendResponses)
+        locationDF = pd.DataFrame(np.repeat(groupKeys.to_frame(index=False).to_numpy(dtype=object), responseCount, axis=0), columns=keyFields)
+        locationDF['Response'] = np.tile(trendResponses, len(groupKeys))
+        locationDF = pd.concat([locationDF, pd.DataFrame(groupSums.reshape(-1, len(trendSumFields)), columns=trendSumFields)], axis=1)
+        locationDF['Level'] = 'Location'
+
+        #Segment sums are the sums of its Locations
+        segmentDF = locationDF.groupby(['Year', 'Region', 'Segment', 'Response'], sort=False)[trendSumFields].sum().reset_index()
+        segmentDF['Level'] = 'Segment'
+        segmentDF['Location_Name'] = ''
+
+        yearSumDF = pd.concat([segmentDF, locationDF], ignore_index=True)[trendGroupFields + ['Year'] + trendSumFields]
+        yearSumDF = yearSumDF[yearSumDF['N'] > 0].astype({'Region': str, 'Segment': str, 'Location_Name': str, 'Year': 'int64', 'N': 'int64'})
+        yearSumDF = yearSumDF.sort_values(by='Year', kind='stable').reset_index(drop=True)
+
+        return "success function", yearSumDF
+
+    except:
+        messageTime = timeFun()
+        print("Error on trend_YearSums Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'trend_YearSums'"
+
+#Least squares lines of the rows of a (groups x sums) array - slope, centred sums of squares/products (Sxx, Sxy, Syy) and the error sum of squares.
+#Groups without spread in x (Sxx of 0) get a null slope and the Syy error sum of squares
+def calc_LineFit(sumArray):
+
+    n, sumX, sumY, sumXX, sumXY, sumYY = (sumArray[:, column] for column in range(len(trendSumFields)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sxx = sumXX - sumX * sumX / n
+        sxx = np.where(sxx > 1e-9 * n, sxx, 0.0)
+        sxy = sumXY - sumX * sumY / n
+        syy = np.maximum(sumYY - sumY * sumY / n, 0.0)
+        slope = np.where(sxx > 0, sxy / sxx, np.nan)
+        sse = np.where(sxx > 0, np.maximum(syy - slope * sxy, 0.0), syy)
+
+    return slope, sxx, sxy, syy, sse
+
+#Fit the trends from the Monitoring Year sums - slope per year, Standard Error and slope Confidence Intervals (Student T, N - 2 DOF) of each group with at least
+#'trendMinYears' years. Change points are tested at every split between Monitoring Years leaving 'trendChangePointYears' on each side (Chow F test of one line
+#against a line each side); the split with the largest F is reported, flagged when its Bonferroni adjusted p value is below 1 - confidence
+def fit_Trends(yearSumDF):
+    try:
+        from scipy.stats import f as fDistribution
+        confidenceList = confidence if isinstance(confidence, (list, tuple)) else [confidence]
+
+        #Trend of each group - sums over the Monitoring Years
+        grouped = yearSumDF.groupby(trendGroupFields, sort=False)
+        totalDF = grouped[trendSumFields].sum()
+        sumArray = totalDF[trendSumFields].to_numpy(dtype='float64')
+        slope, sxx, sxy, syy, sse = calc_LineFit(sumArray)
+        recordCount = sumArray[:, 0]
+
+        trendDF = pd.DataFrame({'Years': grouped.size(), 'FirstYear': grouped['Year'].min(), 'LastYear': grouped['Year'].max(), 'N': totalDF['N']})
+        fitted = (trendDF['Years'].to_numpy() >= trendMinYears) & (sxx > 0) & (recordCount > 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trendDF['Mean'] = sumArray[:, 2] / recordCount
+            trendDF['MeanYear'] = sumArray[:, 1] / recordCount
+            standardError = np.where(fitted, np.sqrt(sse / (recordCount - 2) / sxx), np.nan)
+            trendDF['R2'] = np.where(fitted & (syy > 0), slope * sxy / syy, np.nan)
+        trendDF['Slope_PerYear'] = np.where(fitted, slope, np.nan)
+        trendDF['StandardError'] = standardError
+
+        for confidenceLevel in confidenceList:
+            tCrit = defineStudentT(np.where(fitted, recordCount - 2, np.nan), confidenceLevel)
+            trendDF['SlopeLowerCI_' + str(confidenceLevel)] = trendDF['Slope_PerYear'] - standardError * tCrit
+            trendDF['SlopeUpperCI_' + str(confidenceLevel)] = trendDF['Slope_PerYear'] + standardError * tCrit
+
+        #Trend direction - the slope Confidence Interval of the first level excludes 0
+        confidenceStr = str(confidenceList[0])
+        trendDF['Trend'] = np.select([trendDF['SlopeLowerCI_' + confidenceStr] > 0, trendDF['SlopeUpperCI_' + confidenceStr] < 0, fitted],
+                                     ['Increasing', 'Decreasing', 'No Trend'], 'Too Few Years')
+
+        #Change point splits - the sums before the split are the running sums over the Monitoring Years of the group, the sums after are the rest
+        sideYears = max(2, trendChangePointYears)
+        yearsBefore = grouped.cumcount().to_numpy() + 1
+        yearsTotal = grouped['Year'].transform('size').to_numpy()
+        splitRows = (yearsBefore >= sideYears) & (yearsTotal - yearsBefore >= sideYears)
+
+        splitDF = yearSumDF.loc[splitRows, trendGroupFields].reset_index(drop=True)
+        beforeArray = grouped[trendSumFields].cumsum().to_numpy(dtype='float64')[splitRows]
+        groupArray = grouped[trendSumFields].transform('sum').to_numpy(dtype='float64')[splitRows]
+        slopeBefore, _, _, _, sseBefore = calc_LineFit(beforeArray)
+        slopeAfter, _, _, _, sseAfter = calc_LineFit(groupArray - beforeArray)
+        sseGroup = calc_LineFit(groupArray)[4]
+        splitDOF = groupArray[:, 0] - 4
+        with np.errstate(divide='ignore', invalid='ignore'):
+            splitF = np.maximum(sseGroup - sseBefore - sseAfter, 0.0) / 2 / ((sseBefore + sseAfter) / splitDOF)
+
+        splitDF['ChangePoint_Year'] = grouped['Year'].shift(-1).to_numpy()[splitRows]
+        splitDF['ChangePoint_F'] = splitF
+        splitDF['SlopeBefore'] = slopeBefore
+        splitDF['SlopeAfter'] = slopeAfter
+        validSplits = (splitDOF > 0) & ~np.isnan(splitF)
+        splitDF = splitDF[validSplits]
+        splitDF['ChangePoint_P'] = np.minimum(fDistribution.sf(splitF[validSplits], 2, splitDOF[validSplits]) * splitDF.groupby(trendGroupFields, sort=False)['ChangePoint_F'].transform('size').to_numpy(), 1.0)
+        splitDF = splitDF.sort_values(by='ChangePoint_F', ascending=False, kind='stable').drop_duplicates(trendGroupFields).set_index(trendGroupFields)
+
+        changeFields = ['ChangePoint_Year', 'ChangePoint_F', 'ChangePoint_P', 'SlopeBefore', 'SlopeAfter']
+        trendDF = trendDF.join(splitDF[changeFields])
+        trendDF.insert(trendDF.columns.get_loc('ChangePoint_Year'), 'ChangePoint', (trendDF['ChangePoint_P'] < 1 - confidenceList[0]).to_numpy())
+        trendDF['ChangePoint_Year'] = trendDF['ChangePoint_Year'].astype('Int64')
+
+        return "success function", trendDF.reset_index()
+
+    except:
+        messageTime = timeFun()
+        print("Error on fit_Trends Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'fit_Trends'"
+
+#Trend Analysis of the Marker Visits (all Monitoring Years) - 'yearSumDF' is the Monitoring Year sums when already summed (see 'build_Trends').
+#Output dict with the trends ('trends' - sheet 'Trend') and the Monitoring Year sums ('yearSums' - trend pdf)
+def define_Trends(markerDF, yearSumDF=None):
+    try:
+        if yearSumDF is None:
+            outVal = trend_YearSums(markerDF)
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'define_Trends'"
+            yearSumDF = outVal[1]
+
+        outVal = fit_Trends(yearSumDF)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'define_Trends'"
+        trendDF = outVal[1]
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  define_Trends - Monitoring Years: " + str(yearSumDF['Year'].nunique()) + " - Trends Fitted: " + str(int(trendDF['Slope_PerYear'].notna().sum())) +\
+                    " of " + str(len(trendDF)) + " - Change Points: " + str(int(trendDF['ChangePoint'].sum())) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='define_Trends')
+
+        return "success function", {'trends': trendDF, 'yearSums': yearSumDF}
+
+    except:
+        messageTime = timeFun()
+        print("Error on define_Trends Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'define_Trends'"
+
+#Build the Trend Figure for a Region - Segment Average Distance by Monitoring Year with the fitted trend lines and change points (top), and the Distance trend
+#of each Location with its Confidence Interval (bottom)
+def build_TrendFigure(regionTrendDF, regionSumDF, region):
+
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import MaxNLocator
+
+    figure = Figure(figsize=(8, 6))
+    axList = figure.subplots(2, 1)
+    confidenceStr = str(confidence[0] if isinstance(confidence, (list, tuple)) else confidence)
+
+    #Segment Average Distance of each Monitoring Year at its mean event date
+    ax = axList[0]
+    segmentTrends = regionTrendDF[(regionTrendDF['Level'] == 'Segment') & (regionTrendDF['Response'] == 'Distance')].set_index('Segment')
+    segmentSums = regionSumDF[(regionSumDF['Level'] == 'Segment') & (regionSumDF['Response'] == 'Distance')]
+    for segment, segmentDF in segmentSums.groupby('Segment', sort=False):
+        trendRow = segmentTrends.loc[segment]
+        xMean = (segmentDF['SumX'] / segmentDF['N']).to_numpy()
+        label = segment + (" - change point " + str(trendRow['ChangePoint_Year']) if trendRow['ChangePoint'] else "")
+        line = ax.plot(xMean, (segmentDF['SumY'] / segmentDF['N']).to_numpy(), marker='o', linestyle='none', label=label)[0]
+        if pd.notna(trendRow['Slope_PerYear']):
+            xLine = np.array([xMean.min(), xMean.max()])
+            ax.plot(xLine, trendRow['Mean'] + trendRow['Slope_PerYear'] * (xLine - trendRow['MeanYear']), color=line.get_color())
+        if trendRow['ChangePoint']:
+            ax.axvline(trendRow['ChangePoint_Year'], color=line.get_color(), linestyle=':')
+
+    ax.set_title("Segment Distance Trend - " + region)
+    ax.set_xlabel("Monitoring Year")
+    ax.set_ylabel("Average Distance (m)")
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.grid()
+    if len(segmentSums) > 0:
+        ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+
+    #Location Distance trends with the Confidence Interval of the first level
+    ax = axList[1]
+    locationTrends = regionTrendDF[(regionTrendDF['Level'] == 'Location') & (regionTrendDF['Response'] == 'Distance')]
+    xPosition = np.arange(len(locationTrends))
+    slope = locationTrends['Slope_PerYear'].to_numpy(dtype='float64')
+    ax.errorbar(xPosition, slope, yerr=[slope - locationTrends['SlopeLowerCI_' + confidenceStr].to_numpy(dtype='float64'),
+                                        locationTrends['SlopeUpperCI_' + confidenceStr].to_numpy(dtype='float64') - slope], fmt='o', capsize=2)
+    ax.axhline(0, color='grey', linewidth=0.8)
+    if np.isnan(slope).all():
+        ax.text(0.5, 0.5, "Fewer than " + str(trendMinYears) + " Monitoring Years", transform=ax.transAxes, ha='center', va='center')
+
+    ax.set_title("Location Distance Trend (" + confidenceStr + " Confidence Interval) - " + region)
+    ax.set_xlabel("Marker Points")
+    ax.set_ylabel("Distance Change (m/year)")
+    ax.set_xticks(xPosition)
+    ax.set_xticklabels(locationTrends['Location_Name'].to_numpy(), rotation=90)
+    ax.set_xlim(-0.5, len(xPosition) - 0.5)
+    ax.grid(axis='y')
+    ax.set_axisbelow(True)
+
+    figure.tight_layout(pad=0.4)
+
+    return figure
+
+#Create the Trend Figures - one page per Region with records in 'outPDF'
+def figure_Trends(trendResult, outPDF, regionList):
+    try:
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        trendFrames = partition_Frame(trendResult['trends'], regionList)
+        sumFrames = partition_Frame(trendResult['yearSums'], regionList)
+        with PdfPages(outPDF) as pdf:
+            for region in regionList:
+                if len(trendFrames[region]) == 0:
+                    continue
+                with profile_Stage('render_TrendPage', rowsIn=len(sumFrames[region]), region=region):
+                    figure = build_TrendFigure(trendFrames[region], sumFrames[region], region)
+                    pdf.savefig(figure)
+                    figure.clear()  #Release the Figure once saved
+
+        messageTime = timeFun()
+        scriptMsg = "Successfully Exported Trend Figures: " + outPDF + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='figure_Trends')
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on figure_Trends Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'figure_Trends'"
+
+
+#######################################
+# Streaming Ingestion - Running Aggregates
+#######################################
+#With 'streamingQueries' the SOP8-1 and SOP8-2 queries are read in chunks of 'queryChunkSize' rows and each chunk is folded into running aggregates by group,
+#so memory is bounded by the number of groups rather than the number of joined records
+
+#Marker Visit joins - Marker Data to Events, Event Groups and Locations (Access style nested joins)
+markerVisitJoin = "tbl_Locations INNER JOIN ((tbl_Event_Group INNER JOIN tbl_Events ON tbl_Event_Group.Event_Group_ID = tbl_Events.Event_Group_ID)"\
+                  " INNER JOIN tbl_MarkerData ON tbl_Events.Event_ID = tbl_MarkerData.Event_ID) ON tbl_Locations.Location_ID = tbl_Events.Location_ID"
+
+#Vegetation records (Percent Cover not null) at the Marker Visits with their Scientific Name - FROM/WHERE clause (further conditions may be appended)
+vegetationVisitJoin = " FROM (tbl_MarkerData_Vegetation INNER JOIN (" + markerVisitJoin + ") ON tbl_MarkerData_Vegetation.Point_ID = tbl_MarkerData.Point_ID)"\
+                      " LEFT JOIN tlu_Vegetation ON tbl_MarkerData_Vegetation.SpeciesCode = tlu_Vegetation.SpeciesCode"\
+                      " WHERE tbl_Events.Event_Type = 'Marker Visit' AND NOT (tbl_MarkerData_Vegetation.PercentCover IS NULL)"
+
+#Fold the Distance aggregates of a chunk into the running aggregates - count, mean, sum of squared deviations (M2), minimum and maximum by group.
+#Means and M2 are combined with the pairwise update of Chan et al. so the Standard Error is stable for any chunk size
+def fold_DistanceAggregates(runningDF, chunkDF):
+
+    if len(runningDF) == 0:
+        return chunkDF
+
+    groupIndex = runningDF.index.union(chunkDF.index)
+    runningDF = runningDF.reindex(groupIndex)
+    chunkDF = chunkDF.reindex(groupIndex)
+    countA = runningDF['RecCount'].fillna(0).to_numpy()
+    countB = chunkDF['RecCount'].fillna(0).to_numpy()
+    countAB = countA + countB
+    delta = chunkDF['Mean'].to_numpy() - runningDF['Mean'].to_numpy()
+    bothCounts = (countA > 0) & (countB > 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        outDF = pd.DataFrame({'RecCount': countAB,
+                              'Mean': np.where(countA == 0, chunkDF['Mean'], np.where(countB == 0, runningDF['Mean'], runningDF['Mean'].to_numpy() + delta * countB / countAB)),
+                              'M2': runningDF['M2'].fillna(0).to_numpy() + chunkDF['M2'].fillna(0).to_numpy() + np.where(bothCounts, delta ** 2 * countA * countB / countAB, 0),
+                              'Min': np.fmin(runningDF['Min'], chunkDF['Min']), 'Max': np.fmax(runningDF['Max'], chunkDF['Max'])}, index=groupIndex)
+
+    return outDF
+
+#Grouped SOP8-1 table (as output by the grouped pass of 'SummarizeFigure8_1') from Distance aggregates indexed by group - RecCount, Mean, M2, Min and Max.
+#Standard Error is the sample standard deviation / sqrt(n)
+def finish_DistanceAggregates(aggDF):
+
+    recCount = aggDF['RecCount'].to_numpy(dtype='float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        standardError = np.where(recCount > 1, np.sqrt(aggDF['M2'].to_numpy(dtype='float64') / (recCount - 1)) / np.sqrt(recCount), np.nan)
+    groupedDF = pd.DataFrame({'AverageDist_M': aggDF['Mean'].to_numpy(dtype='float64'), 'StandardError': standardError, 'RecCount': recCount.astype('int64'),
+                              'MinDifference': aggDF['Min'].to_numpy(dtype='float64'), 'MaxDifference': aggDF['Max'].to_numpy(dtype='float64')}, index=aggDF.index).reset_index()
+    groupedDF['DOF'] = groupedDF['RecCount'] - 1
+
+    return groupedDF
+
+#SOP8-1 from the Marker Distance records read in chunks - the running aggregates replace the grouped pass of 'SummarizeFigure8_1'
+def stream_SummarizeFigure8_1():
+
+    try:
+        groupFields = ['Event_Group_ID', 'Region', 'Segment']
+        inQuery = "SELECT tbl_Events.Event_Group_ID AS Event_Group_ID, tbl_Locations.Region AS Region, tbl_Locations.Segment AS Segment, tbl_MarkerData.Distance AS Distance FROM " + markerVisitJoin +\
+                  " WHERE tbl_Events.Event_Type = 'Marker Visit'" + report_GroupFilter() + ";"
+
+        #Empty running aggregates - a query without records gives an empty grouped table
+        runningDF = pd.DataFrame({field: pd.Series(dtype='float64') for field in ['RecCount', 'Mean', 'Min', 'Max', 'M2']},
+                                 index=pd.MultiIndex.from_arrays([[], [], []], names=groupFields))
+        chunkCount = 0
+        for chunkDF in query_DataSourceChunks(inQuery, inDB, queryChunkSize):
+            chunkDF['Distance'] = pd.to_numeric(chunkDF['Distance'], errors='coerce')
+            groupDistance = chunkDF.groupby(groupFields)['Distance']
+            chunkAgg = groupDistance.agg(['count', 'mean', 'min', 'max']).rename(columns={'count': 'RecCount', 'mean': 'Mean', 'min': 'Min', 'max': 'Max'})
+            chunkAgg['M2'] = groupDistance.var(ddof=0) * chunkAgg['RecCount']
+            runningDF = fold_DistanceAggregates(runningDF, chunkAgg)
+            chunkCount += 1
+
+        runningDF.sort_index(inplace=True)
+        groupedDF = finish_DistanceAggregates(runningDF)
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  stream_SummarizeFigure8_1 - Chunks: " + str(chunkCount) + " - Groups: " + str(len(groupedDF)) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='stream_SummarizeFigure8_1')
+
+        return SummarizeFigure8_1(None, groupedDF)
+
+    except:
+        messageTime = timeFun()
+        print("Error on stream_SummarizeFigure8_1 Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'stream_SummarizeFigure8_1'"
+
+#SOP8-2 Region tables from the vegetation records joined to the Marker Visits read in chunks - the Absolute Cover of each chunk is summed into the running
+#(Region, Community Type, Vegetation Type, Taxon, Location Name) totals, which then take the crosstab path of 'pivot_VegCoverAbsolute'
+def stream_VegCoverByPointAbsolute(regionList):
+
+    try:
+        keyFields = ['Region', 'CommunityType', 'VegetationType', 'ScientificName', 'Location_Name']
+        coverFields = [side + '_Cover_' + stratum for side in vegCommunitySides.values() for stratum in ['Overall'] + vegStrata]
+        inQuery = "SELECT tbl_Locations.Region AS Region, tbl_MarkerData_Vegetation.CommunityType AS CommunityType, tbl_MarkerData_Vegetation.VegetationType AS VegetationType,"\
+                  " tlu_Vegetation.ScientificName AS ScientificName, tbl_Locations.Location_Name AS Location_Name, tbl_MarkerData_Vegetation.PercentCover AS PercentCover, " +\
+                  ", ".join("tbl_MarkerData." + field + " AS " + field for field in coverFields) + vegetationVisitJoin + report_GroupFilter() + ";"
+
+        #Empty running totals - a query without records gives empty Region tables
+        longSeries = pd.Series(dtype='float64', index=pd.MultiIndex.from_arrays([[]] * len(keyFields), names=keyFields), name='AbsolutePercCover')
+        chunkCount = 0
+        for chunkDF in query_DataSourceChunks(inQuery, inDB, queryChunkSize):
+            absCoverDF = chunkDF[keyFields].copy()
+            absCoverDF['AbsolutePercCover'] = calc_VegCoverAbsolute(chunkDF)
+            chunkSeries = absCoverDF.groupby(keyFields, dropna=False)['AbsolutePercCover'].sum(min_count=1)
+            longSeries = chunkSeries if chunkCount == 0 else pd.concat([longSeries, chunkSeries]).groupby(level=keyFields, dropna=False).sum(min_count=1)
+            chunkCount += 1
+
+        vegCrosstab = crosstab_VegCoverAbsolute(sort_VegCoverAbsolute(longSeries))
+        regionTables = {region: regionTable_VegCoverAbsolute(vegCrosstab, region) for region in regionList}
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  stream_VegCoverByPointAbsolute - Chunks: " + str(chunkCount) + " - Taxon/Location Totals: " + str(len(longSeries)) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='stream_VegCoverByPointAbsolute')
+
+        return "success function", regionTables
+
+    except:
+        messageTime = timeFun()
+        print("Error on stream_VegCoverByPointAbsolute Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'stream_VegCoverByPointAbsolute'"
+
+#QA Validation records of 'tableName' ('markerVisits' or 'vegetation') read in chunks - each chunk has the fields and Point_ID index of the Marker Visit Dataset
+#table, so tables which are not held in memory (streamed, aggregated in the database or not selected) are validated without being loaded
+def stream_ValidationRecords(tableName):
+
+    coverFields = [side + '_Cover_' + stratum for side in vegCommunitySides.values() for stratum in ['Overall'] + vegStrata]
+    inQuery = "SELECT tbl_MarkerData.Point_ID AS Point_ID, tbl_Events.Event_Group_ID AS Event_Group_ID, tbl_Event_Group.Start_Date AS Start_Date, tbl_Locations.Region AS Region,"\
+              " tbl_Locations.Location_Name AS Location_Name, " + ", ".join("tbl_MarkerData." + field + " AS " + field for field in coverFields)
+    if tableName == 'markerVisits':
+        numericFields = coverFields + ['Distance']
+        inQuery = inQuery + ", tbl_MarkerData.Distance AS Distance FROM " + markerVisitJoin + " WHERE tbl_Events.Event_Type = 'Marker Visit'" + report_GroupFilter() + ";"
+    else:
+        numericFields = coverFields + ['PercentCover']
+        inQuery = inQuery + ", tbl_MarkerData_Vegetation.CommunityType AS CommunityType, tbl_MarkerData_Vegetation.VegetationType AS VegetationType,"\
+                  " tlu_Vegetation.ScientificName AS ScientificName, tbl_MarkerData_Vegetation.PercentCover AS PercentCover" + vegetationVisitJoin + report_GroupFilter() + ";"
+
+    for chunkDF in query_DataSourceChunks(inQuery, inDB, queryChunkSize):
+        for field in numericFields:
+            chunkDF[field] = pd.to_numeric(chunkDF[field], errors='coerce')
+        chunkDF['Year'] = pd.to_datetime(chunkDF['Start_Date']).dt.year
+        yield chunkDF.set_index('Point_ID')
+
+#Tables of the Marker Visit Dataset to validate - the tables not held in 'markerDataset' (None with Aggregation Pushdown, or 'includeVegetation' False)
+#are read in chunks by 'stream_ValidationRecords'
+def define_ValidationDataset(markerDataset, includeVegetation):
+
+    return {'markerVisits': markerDataset['markerVisits'] if markerDataset is not None else stream_ValidationRecords('markerVisits'),
+            'vegetation': markerDataset['vegetation'] if markerDataset is not None and includeVegetation else stream_ValidationRecords('vegetation')}
+
+
+#######################################
+# Aggregation Pushdown
+#######################################
+#With 'pushdownAggregation' the SOP8-1 Distance aggregates (GROUP BY Event Group/Region/Segment) and the SOP8-3 stratum cover fields are calculated in the
+#database query, so only one row per group (SOP8-1) and only the needed fields (SOP8-3) are transferred. Mean, Standard Error and CI are finished locally
+
+#SOP8-1 from the Distance aggregates calculated in the database - count, sum, sum of squares, minimum and maximum by Event Group/Region/Segment
+def aggregate_Figure8_1():
+
+    try:
+        groupFields = ['Event_Group_ID', 'Region', 'Segment']
+        inQuery = "SELECT tbl_Events.Event_Group_ID AS Event_Group_ID, tbl_Locations.Region AS Region, tbl_Locations.Segment AS Segment, Count(tbl_MarkerData.Distance) AS RecCount,"\
+                  " Sum(tbl_MarkerData.Distance) AS SumDistance, Sum(tbl_MarkerData.Distance * tbl_MarkerData.Distance) AS SumSqDistance,"\
+                  " Min(tbl_MarkerData.Distance) AS Min, Max(tbl_MarkerData.Distance) AS Max FROM " + markerVisitJoin +\
+                  " WHERE tbl_Events.Event_Type = 'Marker Visit'" + report_GroupFilter() + " GROUP BY tbl_Events.Event_Group_ID, tbl_Locations.Region, tbl_Locations.Segment;"
+
+        outVal = query_DataSource(inQuery, inDB)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'aggregate_Figure8_1'"
+        aggDF = outVal[1]
+        for field in ('RecCount', 'SumDistance', 'SumSqDistance', 'Min', 'Max'):
+            aggDF[field] = pd.to_numeric(aggDF[field], errors='coerce')
+
+        #Mean and sum of squared deviations (M2) from the sums
+        recCount = aggDF['RecCount'].fillna(0).to_numpy(dtype='float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            aggDF['Mean'] = np.where(recCount > 0, aggDF['SumDistance'].to_numpy(dtype='float64') / recCount, np.nan)
+        aggDF['M2'] = np.maximum(aggDF['SumSqDistance'].to_numpy(dtype='float64') - aggDF['SumDistance'].to_numpy(dtype='float64') * aggDF['Mean'].to_numpy(), 0)
+        aggDF['RecCount'] = recCount
+        groupedDF = finish_DistanceAggregates(aggDF.set_index(groupFields).sort_index())
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  aggregate_Figure8_1 - Rows Transferred: " + str(len(aggDF)) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='aggregate_Figure8_1')
+
+        return SummarizeFigure8_1(None, groupedDF)
+
+    except:
+        messageTime = timeFun()
+        print("Error on aggregate_Figure8_1 Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'aggregate_Figure8_1'"
+
+#SOP8-3 stratum cover records with the Absolute Cover by Side and Stratum (Overall Cover * (Stratum Cover/100)) calculated in the database - same fields and
+#order as 'defineRecords_CoverByStratum'
+def aggregate_CoverByStratum():
+
+    try:
+        selectList = ["tbl_Events.Location_ID AS Location_ID", "tbl_Locations.Order_ID AS Order_ID", "tbl_Locations.Region AS Region", "tbl_Locations.Location_Name AS Location_Name",
+                      "tbl_Events.Event_ID AS Event_ID", "tbl_Event_Group.Start_Date AS Start_Date"]
+        for side, community in (('MangroveSide', 'Mangrove'), ('MarshSide', 'Marsh')):
+            selectList += ["tbl_MarkerData." + side + "_Cover_" + stratum + " AS " + side + "_Cover_" + stratum for stratum in ['Overall'] + vegStrata]
+            selectList += ["tbl_MarkerData." + side + "_Cover_Overall * (tbl_MarkerData." + side + "_Cover_" + stratum + " / 100.0) AS AbsCover_" + community + "_" + stratum for stratum in vegStrata]
+        inQuery = "SELECT " + ", ".join(selectList) + " FROM " + markerVisitJoin + " WHERE tbl_Events.Event_Type = 'Marker Visit'" + report_GroupFilter() + ";"
+
+        outVal = query_DataSource(inQuery, inDB)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'aggregate_CoverByStratum'"
+        outDF = outVal[1]
+
+        outDF['Start_Date'] = pd.to_datetime(outDF['Start_Date'])
+        outDF.sort_values(by=['Order_ID', 'Location_Name', 'Start_Date'], kind='stable', inplace=True)
+        outDF.reset_index(drop=True, inplace=True)
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  aggregate_CoverByStratum - Rows Transferred: " + str(len(outDF)) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='aggregate_CoverByStratum')
+
+        return "success function", outDF
+
+    except:
+        messageTime = timeFun()
+        print("Error on aggregate_CoverByStratum Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'aggregate_CoverByStratum'"
+
+
+#######################################
+# Parquet Snapshot of the Source Tables
+#######################################
+
+#Source tables held in the snapshot. Lookup tables are small and re-pulled in full, event tables are refreshed by Event Group -
+#'groupJoin' resolves each record to its Event_Group_ID so only the groups which are new or changed are pulled from 'inDB'
+snapshotTables = {
+    'tbl_Locations': {'key': 'Location_ID', 'groupJoin': None},
+    'tlu_Vegetation': {'key': 'SpeciesCode', 'groupJoin': None},
+    'tbl_Event_Group': {'key': 'Event_Group_ID', 'groupJoin': None},
+    'tbl_Events': {'key': 'Event_ID', 'groupJoin': "tbl_Events"},
+    'tbl_MarkerData': {'key': 'Point_ID', 'groupJoin': "tbl_MarkerData INNER JOIN tbl_Events ON tbl_MarkerData.Event_ID = tbl_Events.Event_ID"},
+    'tbl_MarkerData_Vegetation': {'key': 'Point_ID', 'groupJoin': "tbl_MarkerData_Vegetation INNER JOIN (tbl_MarkerData INNER JOIN tbl_Events ON tbl_MarkerData.Event_ID = tbl_Events.Event_ID)"
+                                                                  " ON tbl_MarkerData_Vegetation.Point_ID = tbl_MarkerData.Point_ID"}
+}
+
+#Define the Parquet file for a snapshot table
+def snapshotFile(snapshotDir, tableName):
+    return os.path.join(snapshotDir, tableName + ".parquet")
+
+#Attach the Event_Group_ID to the records of a snapshot table (via tbl_Events and tbl_MarkerData in the snapshot)
+def snapshot_EventGroupIDs(tableName, inDF, snapDFs):
+
+    if tableName == 'tbl_Events':
+        return inDF['Event_Group_ID']
+
+    eventGroup = snapDFs['tbl_Events'].set_index('Event_ID')['Event_Group_ID']
+    if tableName == 'tbl_MarkerData':
+        return inDF['Event_ID'].map(eventGroup)
+
+    pointGroup = snapDFs['tbl_MarkerData'].set_index('Point_ID')['Event_ID'].map(eventGroup)
+    return inDF['Point_ID'].map(pointGroup)
+
+#Text fields in the Event Group checksum - the length and the position weighted character codes of the first 'snapshotTextChars' characters (padded with spaces)
+snapshotTextChars = 8
+
+#SQL of a text field's length and Unicode character code at a position by Data Source Type ('{field}', '{pos}', '{pad}' - 'snapshotTextChars' spaces)
+snapshotTextSQL = {'access': {'length': "Len({field})", 'char': "CDbl(AscW(Mid({field} & Space(" + str(snapshotTextChars) + "), {pos}, 1)))"},
+                   'sqlite': {'length': "Length({field})", 'char': "Unicode(Substr(Coalesce({field}, '') || '{pad}', {pos}, 1))"},
+                   'duckdb': {'length': "Length(CAST({field} AS VARCHAR))", 'char': "Unicode(Substr(Coalesce(CAST({field} AS VARCHAR), '') || '{pad}', {pos}, 1))"}}
+
+#Checksum field types of a snapshot table from its Parquet types - 'number' (sum), 'bool' (sum of the absolute value - Access True is -1), 'date' (count only)
+#and 'text' (length and character codes)
+def snapshot_FieldTypes(snapDF):
+
+    fieldTypes = {}
+    for field in snapDF.columns:
+        if pd.api.types.is_bool_dtype(snapDF[field]):
+            fieldTypes[field] = 'bool'
+        elif pd.api.types.is_numeric_dtype(snapDF[field]):
+            fieldTypes[field] = 'number'
+        elif pd.api.types.is_datetime64_any_dtype(snapDF[field]):
+            fieldTypes[field] = 'date'
+        else:
+            fieldTypes[field] = 'text'
+
+    return fieldTypes
+
+#Per Event Group checksum of a table - record count and for each field the non null count, plus the sum (number/bool) or the sum of the lengths and of the
+#character codes (text). Calculated in the database for 'inDB' (one row per Event Group is transferred) or from 'snapDF' for the snapshot
+def snapshot_GroupChecksum(tableName, fieldTypes, snapDF=None, groupIDs=None):
+
+    if snapDF is not None:
+        checkDF = pd.DataFrame({'Event_Group_ID': groupIDs.values, 'RecCount': 1})
+        for field, fieldType in fieldTypes.items():
+            values = snapDF[field]
+            checkDF['Count_' + field] = values.notna().to_numpy(dtype='int64')
+            if fieldType == 'number':
+                checkDF['Sum_' + field] = values.astype(float).to_numpy()
+            elif fieldType == 'bool':
+                checkDF['Sum_' + field] = values.astype(float).abs().to_numpy()
+            elif fieldType == 'text':
+                textValues = values.astype(str).where(values.notna(), "")
+                checkDF['Len_' + field] = textValues.str.len().where(values.notna()).to_numpy(dtype='float64')
+                charArray = np.array(textValues.str.slice(0, snapshotTextChars).str.pad(snapshotTextChars, side='right').to_numpy(dtype=str), dtype='U' + str(snapshotTextChars))
+                checkDF['Code_' + field] = charArray.view(np.uint32).reshape(-1, snapshotTextChars).astype('float64') @ np.arange(1, snapshotTextChars + 1, dtype='float64')
+        return "success function", checkDF.groupby('Event_Group_ID').sum(min_count=1)
+
+    textSQL = snapshotTextSQL[dataSourceType]
+    selectList = ["tbl_Events.Event_Group_ID AS Event_Group_ID", "Count(*) AS RecCount"]
+    for field, fieldType in fieldTypes.items():
+        tableField = tableName + "." + field
+        selectList.append("Count(" + tableField + ") AS Count_" + field)
+        if fieldType == 'number':
+            selectList.append("Sum(" + tableField + ") AS Sum_" + field)
+        elif fieldType == 'bool':
+            selectList.append("Sum(Abs(" + tableField + ")) AS Sum_" + field)
+        elif fieldType == 'text':
+            selectList.append("Sum(" + textSQL['length'].format(field=tableField) + ") AS Len_" + field)
+            charCodes = [str(pos) + " * " + textSQL['char'].format(field=tableField, pos=pos, pad=" " * snapshotTextChars) for pos in range(1, snapshotTextChars + 1)]
+            selectList.append("Sum(" + " + ".join(charCodes) + ") AS Code_" + field)
+    inQuery = "SELECT " + ", ".join(selectList) + " FROM " + snapshotTables[tableName]['groupJoin'] + " GROUP BY tbl_Events.Event_Group_ID;"
+    outVal = query_DataSource(inQuery, inDB)
+    if outVal[0].lower() != "success function":
+        return "failed function"
+
+    return "success function", outVal[1].set_index('Event_Group_ID')
+
+#Export the source tables in 'inDB' to typed Parquet files in 'snapshotDir'. The first run extracts every table, later runs pull only the
+#Event Groups which are new, whose tbl_Event_Group record (e.g. Start_Date/End_Date) changed, or whose Events/Marker/Vegetation checksums differ
+def refresh_Snapshot(snapshotDir, fullRefresh=False):
+
+    try:
+        if not os.path.exists(snapshotDir):
+            os.makedirs(snapshotDir)
+
+        manifestFile = os.path.join(snapshotDir, "snapshot_manifest.json")
+        firstRun = fullRefresh or not os.path.exists(manifestFile) or not all(os.path.exists(snapshotFile(snapshotDir, tableName)) for tableName in snapshotTables)
+
+        #Lookup tables and tbl_Event_Group - always pulled in full
+        sourceDFs = {}
+        snapDFs = {}
+        for tableName, tableDef in snapshotTables.items():
+            if tableDef['groupJoin'] is None:
+                outVal = query_DataSource("SELECT * FROM " + tableName + ";", inDB)
+                if outVal[0].lower() != "success function":
+                    return "failed function"
+                sourceDFs[tableName] = outVal[1]
+            if not firstRun:
+                snapDFs[tableName] = pd.read_parquet(snapshotFile(snapshotDir, tableName))
+
+        groupDF = sourceDFs['tbl_Event_Group']
+        if firstRun:
+            changedGroups = set(groupDF['Event_Group_ID'])
+            removedGroups = set()
+        else:
+            #New, removed and changed tbl_Event_Group records
+            snapGroupDF = snapDFs['tbl_Event_Group']
+            removedGroups = set(snapGroupDF['Event_Group_ID']) - set(groupDF['Event_Group_ID'])
+            compareDF = pd.merge(groupDF.astype(str), snapGroupDF.astype(str), how='left', on='Event_Group_ID', suffixes=(None, "_Snap"), indicator=True)
+            changedMask = compareDF['_merge'] == 'left_only'
+            for field in groupDF.columns.drop('Event_Group_ID'):
+                changedMask |= compareDF[field] != compareDF[field + "_Snap"]
+            changedGroups = set(groupDF.loc[changedMask.values, 'Event_Group_ID'])
+
+            #Event Groups whose child records changed in place
+            for tableName, tableDef in snapshotTables.items():
+                if tableDef['groupJoin'] is None:
+                    continue
+                snapDF = snapDFs[tableName]
+                fieldTypes = snapshot_FieldTypes(snapDF)
+                outVal = snapshot_GroupChecksum(tableName, fieldTypes)
+                if outVal[0].lower() != "success function":
+                    return "failed function"
+                sourceCheck = outVal[1]
+                snapCheck = snapshot_GroupChecksum(tableName, fieldTypes, snapDF, snapshot_EventGroupIDs(tableName, snapDF, snapDFs))[1]
+                sourceCheck, snapCheck = sourceCheck.align(snapCheck, join='outer')
+                sourceCheck = sourceCheck.apply(pd.to_numeric, errors='coerce').astype(float).fillna(-1)
+                snapCheck = snapCheck.astype(float).fillna(-1)
+                #Sums of numbers within rounding, counts/lengths/character codes exactly
+                sumFields = [field for field in sourceCheck.columns if field.startswith('Sum_')]
+                otherFields = [field for field in sourceCheck.columns if not field.startswith('Sum_')]
+                differs = ~np.isclose(sourceCheck[sumFields], snapCheck[sumFields]).all(axis=1) | (sourceCheck[otherFields] != snapCheck[otherFields]).any(axis=1)
+                changedGroups |= set(sourceCheck.index[differs]) - removedGroups
+
+        #Pull the records for the changed Event Groups and merge into the snapshot
+        for tableName, tableDef in snapshotTables.items():
+            if tableDef['groupJoin'] is not None:
+                if len(changedGroups) == 0:
+                    continue
+                inQuery = "SELECT " + tableName + ".* FROM " + tableDef['groupJoin'] + " WHERE tbl_Events.Event_Group_ID IN (" + ", ".join(str(int(groupID)) for groupID in sorted(changedGroups)) + ");"
+                outVal = query_DataSource(inQuery, inDB)
+                if outVal[0].lower() != "success function":
+                    return "failed function"
+                pulledDF = outVal[1]
+
+                if not firstRun:
+                    snapDF = snapDFs[tableName]
+                    keepMask = ~snapshot_EventGroupIDs(tableName, snapDF, snapDFs).isin(changedGroups | removedGroups)
+                    pulledDF = pd.concat([snapDF[keepMask.values], pulledDF], ignore_index=True)
+                    pulledDF.sort_values(by=tableDef['key'], inplace=True, ignore_index=True)
+
+                sourceDFs[tableName] = pulledDF
+
+            sourceDFs[tableName].to_parquet(snapshotFile(snapshotDir, tableName), index=False)
+
+        manifest = {'inDB': inDB, 'refreshed': timeFun(), 'eventGroups': sorted(int(groupID) for groupID in groupDF['Event_Group_ID']),
+                    'tables': {tableName: len(sourceDFs.get(tableName, snapDFs.get(tableName, []))) for tableName in snapshotTables}}
+        with open(manifestFile, "w") as manifestOut:
+            json.dump(manifest, manifestOut, indent=2)
+
+        messageTime = timeFun()
+        scriptMsg = "Successfully Refreshed Snapshot: " + snapshotDir + " - Event Groups Pulled: " + str(len(changedGroups)) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='refresh_Snapshot')
+
+        return "success function", sorted(changedGroups)
+
+    except:
+        messageTime = timeFun()
+        print("Error on refresh_Snapshot Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'refresh_Snapshot'"
+
+#Open the Parquet snapshot as a queryable database - DuckDB views over the Parquet files, or an in memory SQLite database when DuckDB is not installed
+def open_ParquetSnapshot(snapshotDir):
+
+    try:
+        import duckdb
+        cnxn = duckdb.connect(":memory:")
+        for tableName in snapshotTables:
+            cnxn.execute("CREATE VIEW " + tableName + " AS SELECT * FROM read_parquet('" + snapshotFile(snapshotDir, tableName).replace("'", "''") + "');")
+        return cnxn
+
+    except ImportError:
+        import sqlite3
+        cnxn = sqlite3.connect(":memory:", check_same_thread=False)
+        for tableName in snapshotTables:
+            pd.read_parquet(snapshotFile(snapshotDir, tableName), memory_map=True).to_sql(tableName, cnxn, index=False)
+        return cnxn
+
+dataSourceOpeners['parquet'] = open_ParquetSnapshot
+
+
+#######################################
+# Result Cache
+#######################################
+#Disk backed cache of stage results in 'cacheDir' - one entry directory per cache key with a Parquet file per DataFrame.
+#The key is a sha256 of the stage name, its parameters and either the source fingerprint (queries) or the content hash of the input DataFrames (derived stages),
+#so a new 'confidence' or region list only recomputes the stages it reaches. Entries are evicted least recently used first once 'cacheMaxMB' is exceeded
+cacheVersion = 1  #Bump when a cached stage changes its output
+
+#Fingerprint of the Data Source - path, size and modified time of the database file (or of each snapshot Parquet file). Computed once per open session,
+#'inDB' when no session is open
+def define_SourceFingerprint():
+
+    if dataSession['fingerprint'] is not None:
+        return dataSession['fingerprint']
+
+    sourcePath = dataSession['inDB'] if dataSession['connection'] is not None else inDB
+    if os.path.isdir(sourcePath):
+        fileList = sorted(os.path.join(sourcePath, fileName) for fileName in os.listdir(sourcePath) if fileName.endswith('.parquet'))
+    else:
+        fileList = [sourcePath]
+    fingerprint = [[filePath, os.stat(filePath).st_size, os.stat(filePath).st_mtime_ns] for filePath in fileList if os.path.exists(filePath)]
+    if dataSession['connection'] is not None:
+        dataSession['fingerprint'] = fingerprint
+
+    return fingerprint
+
+#Cache Key of a stage - None when the cache is off. 'inputFrames' are content hashed (values and index), otherwise the key is bound to the Data Source fingerprint
+def define_CacheKey(stageName, stageParams, inputFrames=None):
+
+    if cacheDir is None:
+        return None
+
+    return stageName + '-' + hash_Content(stageName, stageParams, inputFrames)[:32]
+
+#sha256 of a stage name, its parameters and either the content of 'inputFrames' (values, index and dtypes) or the Data Source fingerprint
+def hash_Content(stageName, stageParams, inputFrames=None):
+
+    import hashlib
+    keyHash = hashlib.sha256()
+    keyHash.update(json.dumps({'stage': stageName, 'version': cacheVersion, 'params': stageParams}, sort_keys=True, default=str).encode())
+    if inputFrames is None:
+        keyHash.update(json.dumps(define_SourceFingerprint()).encode())
+    else:
+        for inDF in inputFrames:
+            keyHash.update(json.dumps([str(field) + ':' + str(inDF[field].dtype) for field in inDF.columns]).encode())
+            keyHash.update(pd.util.hash_pandas_object(inDF, index=True).to_numpy().tobytes())
+
+    return keyHash.hexdigest()
+
+#Read a stored entry directory - returns the entry information and the result (DataFrame, dict of DataFrames, pdf bytes or None)
+def read_Entry(entryDir):
+
+    with open(os.path.join(entryDir, "entry.json")) as entryIn:
+        entryInfo = json.load(entryIn)
+    if entryInfo.get('bytes'):
+        with open(os.path.join(entryDir, "page.pdf"), "rb") as pageIn:
+            return entryInfo, pageIn.read()
+    if not entryInfo['frames']:
+        return entryInfo, None
+    frameDict = {frameName: pd.read_parquet(os.path.join(entryDir, str(count) + ".parquet")) for count, frameName in enumerate(entryInfo['frames'])}
+
+    return entryInfo, (frameDict if entryInfo['frames'] != [None] else frameDict.get(None))
+
+#Write an entry directory - a Parquet file per DataFrame (or 'page.pdf' for bytes) and 'entry.json', written to a temporary directory and renamed into place.
+#An existing entry is kept unless 'replace' is set
+def write_Entry(entryDir, outResult, entryInfo=None, replace=False):
+
+    import shutil
+    tempDir = entryDir + ".tmp" + str(os.getpid())
+    entryInfo = dict(entryInfo or {})
+
+    os.makedirs(tempDir)
+    if isinstance(outResult, bytes):
+        entryInfo.update({'bytes': True, 'frames': []})
+        with open(os.path.join(tempDir, "page.pdf"), "wb") as pageOut:
+            pageOut.write(outResult)
+    else:
+        frameDict = outResult if isinstance(outResult, dict) else {None: outResult}
+        frameDict = {frameName: outDF for frameName, outDF in frameDict.items() if outDF is not None}
+        for count, outDF in enumerate(frameDict.values()):
+            outDF.to_parquet(os.path.join(tempDir, str(count) + ".parquet"))
+        entryInfo['frames'] = list(frameDict)
+    with open(os.path.join(tempDir, "entry.json"), "w") as entryOut:
+        json.dump(entryInfo, entryOut)
+
+    if replace and os.path.exists(entryDir):
+        shutil.rmtree(entryDir, ignore_errors=True)
+    try:
+        os.rename(tempDir, entryDir)
+    except OSError:  #Stored by another process
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+#Load a cache entry - a DataFrame or a dict of DataFrames, None on a miss. A hit marks the entry as recently used
+def cache_Load(cacheKey):
+
+    if cacheKey is None:
+        return None
+    entryDir = os.path.join(cacheDir, cacheKey)
+    if not os.path.exists(entryDir):
+        return None
+
+    try:
+        outResult = read_Entry(entryDir)[1]
+        os.utime(entryDir)
+        return outResult
+    except:
+        traceback.print_exc(file=sys.stdout)
+        return None
+
+#Store a DataFrame (or dict of DataFrames) under 'cacheKey', then trim the cache to 'cacheMaxMB'
+def cache_Store(cacheKey, outResult):
+
+    if cacheKey is None:
+        return
+
+    try:
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+        write_Entry(os.path.join(cacheDir, cacheKey), outResult)
+        evict_Cache()
+    except:
+        traceback.print_exc(file=sys.stdout)
+
+#Evict the least recently used cache entries until the cache is within 'cacheMaxMB'
+def evict_Cache():
+
+    import shutil
+    entryList = []
+    for entryName in os.listdir(cacheDir):
+        entryDir = os.path.join(cacheDir, entryName)
+        if os.path.isdir(entryDir) and '.tmp' not in entryName:
+            entrySize = sum(os.path.getsize(os.path.join(entryDir, fileName)) for fileName in os.listdir(entryDir))
+            entryList.append((os.path.getmtime(entryDir), entrySize, entryDir))
+
+    cacheSize = sum(entry[1] for entry in entryList)
+    for lastUsed, entrySize, entryDir in sorted(entryList):
+        if cacheSize <= cacheMaxMB * 1048576:
+            break
+        shutil.rmtree(entryDir, ignore_errors=True)
+        cacheSize -= entrySize
+
+
+#######################################
+# Incremental Build Graph
+#######################################
+#Report build as a graph of nodes stored in 'buildDir' - the Marker Visit Dataset (from the source tables), SOP8-1 rows by Event Group/Segment, SOP8-2 Region tables,
+#SOP8-3 Region pages and the workbook and pdf products. Each node stores the fingerprint of its inputs with its output; a node whose fingerprint is unchanged reuses
+#the stored output, so a run only recomputes the years/segments/regions whose upstream rows changed and only rewrites the products they reach
+
+#Entry directory of a node - the node name with path characters replaced
+def node_Path(nodeName):
+
+    import re
+    return os.path.join(buildDir, re.sub(r'[^A-Za-z0-9_.-]+', '_', nodeName))
+
+#Stored output of a node when its stored fingerprint matches 'fingerprint' - None when the node is stale or missing
+def node_Load(nodeName, fingerprint):
+
+    entryDir = node_Path(nodeName)
+    if not os.path.exists(entryDir):
+        return None
+    try:
+        entryInfo, outResult = read_Entry(entryDir)
+        if entryInfo.get('fingerprint') != fingerprint:
+            return None
+        return outResult if outResult is not None else True
+    except:
+        traceback.print_exc(file=sys.stdout)
+        return None
+
+#Store the output (None for a product node) and fingerprint of a node
+def node_Store(nodeName, fingerprint, outResult=None):
+
+    if not os.path.exists(buildDir):
+        os.makedirs(buildDir)
+    write_Entry(node_Path(nodeName), outResult, {'node': nodeName, 'fingerprint': fingerprint}, replace=True)
+
+#Build a node - the stored output when current, otherwise 'stageFunction(*args)' (a "success function", result tuple) is run and stored.
+#Returns the stage tuple with True as the third value when the node was rebuilt
+def build_Node(nodeName, fingerprint, stageFunction, *args):
+
+    outResult = node_Load(nodeName, fingerprint)
+    if outResult is not None:
+        return "success function", outResult, False
+
+    outVal = stageFunction(*args)
+    if isinstance(outVal, tuple) and outVal[0].lower() == "success function":
+        node_Store(nodeName, fingerprint, outVal[1])
+        messageTime = timeFun()
+        scriptMsg = "Rebuilt Node: " + nodeName + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='build_Node')
+        return outVal[0], outVal[1], True
+
+    return outVal
+
+#SOP8-1 from the stored rows of each unchanged Event Group/Segment node - only the groups whose Marker Distance records changed are summarized again
+def build_SOP8_1(markerDF, nodePrefix=''):
+
+    try:
+        groupFields = ['Event_Group_ID', 'Region', 'Segment']
+        stageParams = {'confidence': confidence, 'bootstrapCI': bootstrapCI, 'bootstrapSamples': bootstrapSamples}
+        groupDict = {groupKey: groupDF for groupKey, groupDF in markerDF.groupby(groupFields, observed=True, sort=False)}
+        if not groupDict:
+            outVal = SummarizeFigure8_1(markerDF)
+            return outVal[0], outVal[1], None
+
+        groupFrames = []
+        changedKeys = []
+        fingerprintDict = {}
+        for groupKey, groupDF in groupDict.items():
+            nodeName = nodePrefix + 'SOP8-1|' + '|'.join(str(value) for value in groupKey)
+            fingerprintDict[nodeName] = hash_Content('SummarizeFigure8_1', stageParams, [groupDF.reset_index(drop=True)])
+            groupRows = node_Load(nodeName, fingerprintDict[nodeName])
+            if groupRows is None:
+                changedKeys.append((groupKey, nodeName))
+            else:
+                groupFrames.append(groupRows)
+
+        if changedKeys:
+            changedMask = pd.Series(False, index=markerDF.index)
+            for groupKey, nodeName in changedKeys:
+                changedMask[groupDict[groupKey].index] = True
+            outVal = SummarizeFigure8_1(markerDF[changedMask])
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'build_SOP8_1'"
+            changedDF = outVal[1]
+            for groupKey, nodeName in changedKeys:
+                groupRows = changedDF[(changedDF['Event_Group_ID'] == groupKey[0]) & (changedDF['Region'] == groupKey[1]) & (changedDF['Segment'] == groupKey[2])]
+                node_Store(nodeName, fingerprintDict[nodeName], groupRows)
+            groupFrames.append(changedDF)
+
+            messageTime = timeFun()
+            scriptMsg = "Rebuilt Nodes: " + str(len(changedKeys)) + " of " + str(len(groupDict)) + " SOP8-1 Event Group/Segments - " + messageTime
+            print(scriptMsg)
+            log_Message(scriptMsg, stage='build_SOP8_1')
+
+        #Rows in Event Group/Region/Segment order, then stable sort on the Segment Number as in 'SummarizeFigure8_1'
+        outDf_8pt1 = pd.concat(groupFrames)
+        for field in ('Region', 'Segment'):
+            outDf_8pt1[field] = outDf_8pt1[field].astype(str)
+        outDf_8pt1 = outDf_8pt1.reset_index().sort_values(by=groupFields, kind='stable').sort_values(by='SortField', kind='stable').set_index('SortField')
+
+        return "success function", outDf_8pt1, hash_Content('SOP8-1', sorted(fingerprintDict.items()), [])
+
+    except:
+        messageTime = timeFun()
+        print("Error on build_SOP8_1 Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'build_SOP8_1'"
+
+#SOP8-2 Region tables - a node per Region fingerprinted on the Region's vegetation records, only changed Regions are crosstabbed again
+def build_SOP8_2(markerDataset, regionList, nodePrefix=''):
+
+    try:
+        regionFrames = partition_Frame(markerDataset['vegetation'], regionList)
+        regionTables = {}
+        fingerprintDict = {}
+        for region, regionVegDF in regionFrames.items():
+            nodeName = nodePrefix + 'SOP8-2|' + region
+            fingerprintDict[region] = hash_Content('defineRecords_VegCoverByPointAbsolute', {'region': region}, [regionVegDF])
+            regionTables[region] = node_Load(nodeName, fingerprintDict[region])
+            if regionTables[region] is None:
+                outVal = defineRecords_VegCoverByPointAbsolute({'vegetation': regionVegDF}, [region])
+                if outVal[0].lower() != "success function":
+                    return "Failed function - 'build_SOP8_2'"
+                regionTables[region] = outVal[1][region]
+                node_Store(nodeName, fingerprintDict[region], regionTables[region])
+                messageTime = timeFun()
+                scriptMsg = "Rebuilt Node: " + nodeName + " - " + messageTime
+                print(scriptMsg)
+                log_Message(scriptMsg, stage='build_SOP8_2', region=region)
+
+        return "success function", regionTables, fingerprintDict
+
+    except:
+        messageTime = timeFun()
+        print("Error on build_SOP8_2 Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'build_SOP8_2'"
+
+#Workbook product node - exported only when a sheet fingerprint changed or 'outFull' does not exist. Sheets without a node fingerprint (None) are content hashed
+def build_Workbook(outFull, sheetDict, sheetFingerprints, nodePrefix=''):
+
+    nodeName = nodePrefix + 'Workbook'
+    if isinstance(sheetFingerprints, dict):
+        sheetFingerprints = {sheetName: fingerprint if fingerprint is not None else hash_Content(sheetName, {}, [sheetDict[sheetName]]) for sheetName, fingerprint in sheetFingerprints.items()}
+    fingerprint = hash_Content(nodeName, {'outFull': outFull, 'sheets': sheetFingerprints}, [])
+    if os.path.exists(outFull) and node_Load(nodeName, fingerprint) is not None:
+        print("Workbook Current - " + outFull)
+        return "success function"
+
+    outVal = export_Workbook(outFull, sheetDict)
+    if outVal.lower() == "success function":
+        node_Store(nodeName, fingerprint)
+
+    return outVal
+
+#SOP8-3 pdf from a page node per Region - only the pages of Regions whose stratum cover records changed are rendered, the pdf is reassembled (pypdf) when a page changed.
+#Without pypdf every page is rendered by 'figure_CoverByStratum' when any page changed
+def build_CoverByStratumPDF(inDF, outPDF, regionList, nodePrefix=''):
+
+    try:
+        regionFrames = partition_Frame(inDF, regionList)
+        pageFingerprints = {region: hash_Content('render_CoverByStratumPage', {'region': region}, [regionDF.reset_index(drop=True)]) for region, regionDF in regionFrames.items()}
+        nodeName = nodePrefix + 'PDF'
+        fingerprint = hash_Content(nodeName, {'outPDF': outPDF, 'pages': pageFingerprints}, [])
+        if os.path.exists(outPDF) and node_Load(nodeName, fingerprint) is not None:
+            print("PDF Current - " + outPDF)
+            return "success function"
+
+        try:
+            from pypdf import PdfWriter
+        except ImportError:
+            outVal = figure_CoverByStratum(inDF, outPDF, regionList)
+            if outVal.lower() == "success function":
+                node_Store(nodeName, fingerprint)
+            return outVal
+
+        #Render the stale pages - in worker processes when more than one
+        pageDict = {region: node_Load(nodePrefix + 'SOP8-3|' + region, pageFingerprints[region]) for region in regionList}
+        staleRegions = [region for region, page in pageDict.items() if page is None]
+        if len(staleRegions) > 1 and maxWorkers != 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+                pageList = list(executor.map(render_CoverByStratumPage, staleRegions, [regionFrames[region] for region in staleRegions]))
+        else:
+            pageList = [render_CoverByStratumPage(region, regionFrames[region]) for region in staleRegions]
+        for region, (page, seconds) in zip(staleRegions, pageList):
+            node_Store(nodePrefix + 'SOP8-3|' + region, pageFingerprints[region], page)
+            pageDict[region] = page
+
+        import io
+        pdfWriter = PdfWriter()
+        for region in regionList:
+            pdfWriter.append(io.BytesIO(pageDict[region]))
+        with open(outPDF, "wb") as pdfOut:
+            pdfWriter.write(pdfOut)
+        node_Store(nodeName, fingerprint)
+
+        messageTime = timeFun()
+        scriptMsg = "Successfully Exported Figures: " + outPDF + " - Rebuilt Pages: " + (", ".join(staleRegions) if staleRegions else "None") + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='build_CoverByStratumPDF')
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on build_CoverByStratumPDF Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'build_CoverByStratumPDF'"
+
+
+#Trend Analysis from the stored sums of each unchanged Monitoring Year node - only the Monitoring Years whose marker records changed (or were added) are summed
+#again, the trends are then refitted from the sums of every year
+def build_Trends(markerDF, nodePrefix=''):
+
+    try:
+        recordDF = markerDF[trendInputFields]
+        yearList = sorted(recordDF['Year'].dropna().unique())
+        yearFrames = partition_Frame(recordDF, yearList, 'Year')
+
+        yearSums = {}
+        changedYears = []
+        fingerprintDict = {}
+        for year, yearDF in yearFrames.items():
+            nodeName = nodePrefix + 'Trend|' + str(year)
+            fingerprintDict[nodeName] = hash_Content('trend_YearSums', {'trendResponses': trendResponses}, [yearDF.reset_index(drop=True)])
+            yearSums[year] = node_Load(nodeName, fingerprintDict[nodeName])
+            if yearSums[year] is None:
+                changedYears.append(year)
+
+        if changedYears:
+            outVal = trend_YearSums(recordDF[recordDF['Year'].isin(changedYears)])
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'build_Trends'"
+            for year, yearSumDF in partition_Frame(outVal[1], changedYears, 'Year').items():
+                node_Store(nodePrefix + 'Trend|' + str(year), fingerprintDict[nodePrefix + 'Trend|' + str(year)], yearSumDF)
+                yearSums[year] = yearSumDF
+
+            messageTime = timeFun()
+            scriptMsg = "Rebuilt Nodes: " + str(len(changedYears)) + " of " + str(len(yearList)) + " Trend Monitoring Years - " + messageTime
+            print(scriptMsg)
+            log_Message(scriptMsg, stage='build_Trends')
+
+        yearSumDF = pd.concat([yearSums[year] for year in yearList], ignore_index=True) if yearList else None
+        outVal = define_Trends(markerDF, yearSumDF)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'build_Trends'"
+
+        stageParams = {'nodes': sorted(fingerprintDict.items()), 'confidence': confidence, 'trendMinYears': trendMinYears, 'trendChangePointYears': trendChangePointYears}
+        return "success function", outVal[1], hash_Content('Trend', stageParams, [])
+
+    except:
+        messageTime = timeFun()
+        print("Error on build_Trends Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'build_Trends'"
+
+#Trend pdf product node - exported only when the trends changed or 'outPDF' does not exist
+def build_TrendPDF(trendResult, trendFingerprint, outPDF, regionList, nodePrefix=''):
+
+    nodeName = nodePrefix + 'Trend PDF'
+    fingerprint = hash_Content(nodeName, {'outPDF': outPDF, 'trends': trendFingerprint, 'regions': list(regionList)}, [])
+    if os.path.exists(outPDF) and node_Load(nodeName, fingerprint) is not None:
+        print("Trend PDF Current - " + outPDF)
+        return "success function"
+
+    outVal = figure_Trends(trendResult, outPDF, regionList)
+    if outVal.lower() == "success function":
+        node_Store(nodeName, fingerprint)
+
+    return outVal
+
+
+#######################################
+# Overlapped Pipeline
+#######################################
+#The report stages of 'main' run concurrently on an asyncio event loop. Database queries run in order on one fetch thread (the Data Source Session is
+#only used by that thread), pandas compute and the Excel/pdf writers run in worker threads and the SOP8-3 pages are rendered in worker processes
+#(worker thread without 'pypdf'). The stratum cover fetch and page rendering start while the SOP8-1/SOP8-2 tables are still being computed and written.
+#Stages are linked by bounded queues of 'pipelineQueueSize' items so a producing stage waits for its writer instead of holding every table/page
+
+#End of stage marker put on a pipeline queue by the producing stage
+pipelineEnd = None
+
+#Run a blocking stage function in 'executor' (None - the event loop's thread pool) without blocking the event loop. Thread stages run in a copy of the
+#task context, so the stages they profile are enclosed by the stages profiling the call
+async def run_Stage(executor, stageFunction, *args):
+    from concurrent.futures import ProcessPoolExecutor
+    if not isinstance(executor, ProcessPoolExecutor):
+        stageFunction, args = contextvars.copy_context().run, (stageFunction,) + args
+    return await asyncio.get_running_loop().run_in_executor(executor, stageFunction, *args)
+
+#Consume a pipeline queue until its end marker - 'stageFunction' (coroutine) is awaited for each item. After a failure the remaining items are drained
+#so the producing stage is never left waiting on a full queue
+async def consume_Queue(stageQueue, stageFunction):
+
+    outVal = "success function"
+    while True:
+        item = await stageQueue.get()
+        if item is pipelineEnd:
+            return outVal
+        if outVal != "success function":
+            continue
+        try:
+            await stageFunction(*item)
+        except:
+            messageTime = timeFun()
+            print("Error on consume_Queue Function - " + stageFunction.__name__ + " - " + messageTime)
+            traceback.print_exc(file=sys.stdout)
+            outVal = "Failed function - 'consume_Queue' - " + stageFunction.__name__
+
+#Fetch stage - Marker Visits of the Marker Visit Dataset (vegetation records are fetched by 'produce_Tables'). Returns the records of the Report Event Groups
+#and the full dataset (Trend Analysis)
+async def fetch_MarkerVisits(fetchExecutor):
+
+    with profile_Stage('defineRecords_MarkerVisitDataset') as stage:
+        outVal = await run_Stage(fetchExecutor, defineRecords_MarkerVisitDataset, False)
+        if outVal[0].lower() == "success function":
+            stage['rowsOut'] = len(outVal[1]['markerVisits'])
+            outVal = "success function", filter_ReportDataset(outVal[1]), outVal[1]
+    return outVal
+
+#Fetch stage - vegetation records joined to the Marker Visits, queued once the Marker Visits are fetched
+async def fetch_MarkerVegetation(fetchExecutor, markerFetch):
+
+    outVal = await markerFetch
+    if outVal[0].lower() != "success function":
+        return "Failed function - 'fetch_MarkerVegetation' - defineRecords_MarkerVisitDataset"
+
+    with profile_Stage('defineRecords_MarkerVegetation') as stage:
+        outVal = await run_Stage(fetchExecutor, defineRecords_MarkerVegetation, outVal[1]['markerVisits'])
+        if outVal[0].lower() == "success function":
+            stage['rowsOut'] = len(outVal[1])
+    return outVal
+
+#QA stage - the Marker Visits and vegetation records are validated alongside the report stages. Tables which are not fetched are read in chunks on the fetch
+#thread. Over 'qaMaxErrors' the run fails once the stages finish - the outputs are already written
+async def validate_Dataset(fetchExecutor, markerFetch, vegetationFetch, outQAPrefix):
+
+    markerDataset = None
+    if markerFetch is not None:
+        outVal = await markerFetch
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'validate_Dataset' - defineRecords_MarkerVisitDataset"
+        markerDataset = outVal[1]
+
+    if vegetationFetch is not None:
+        outVal = await vegetationFetch
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'validate_Dataset' - defineRecords_MarkerVegetation"
+        markerDataset = {'markerVisits': markerDataset['markerVisits'], 'vegetation': outVal[1]}
+
+    validationDataset = define_ValidationDataset(markerDataset, vegetationFetch is not None)
+    return await run_Stage(None if markerDataset is not None and vegetationFetch is not None else fetchExecutor, run_Validation, validationDataset, outQAPrefix)
+
+#Trend stage - the Trend Analysis of the Marker Visits, run alongside the report stages
+async def produce_Trends(markerFetch):
+
+    outVal = await markerFetch
+    if outVal[0].lower() != "success function":
+        return "Failed function - 'produce_Trends' - defineRecords_MarkerVisitDataset"
+
+    with profile_Stage('define_Trends', rowsIn=len(outVal[2]['markerVisits'])) as stage:
+        outVal = await run_Stage(None, define_Trends, outVal[2]['markerVisits'])
+        if outVal[0].lower() == "success function":
+            stage['rowsOut'] = len(outVal[1]['trends'])
+    return outVal
+
+#Table stages - SOP8-1 then the SOP8-2 Region tables are put on 'sheetQueue' (sheet name, DataFrame) as each is ready, then the Trend sheet and the QA Violations sheet last
+async def produce_Tables(fetchExecutor, markerFetch, vegetationFetch, trendFetch, qaCheck, regionList, sheetQueue):
+    try:
+        with profile_Stage('SummarizeFigure8_1') as stage:
+            if pushdownAggregation:
+                outVal = await run_Stage(fetchExecutor, aggregate_Figure8_1)
+            elif streamingQueries:
+                outVal = await run_Stage(fetchExecutor, stream_SummarizeFigure8_1)
+            else:
+                outVal = await markerFetch
+                if outVal[0].lower() == "success function":
+                    outVal = await run_Stage(None, defineRecords_MarkerData, outVal[1])
+                if outVal[0].lower() == "success function":
+                    stage['rowsIn'] = len(outVal[1])
+                    outVal = await run_Stage(None, SummarizeFigure8_1, outVal[1])
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'produce_Tables' - SummarizeFigure8_1"
+            stage['rowsOut'] = len(outVal[1])
+        await sheetQueue.put(('SOP8-1', outVal[1]))
+
+        sheetNames = define_RegionSheetNames(regionList)
+        if streamingQueries:
+            with profile_Stage('defineRecords_VegCoverByPointAbsolute') as stage:
+                outVal = await run_Stage(fetchExecutor, stream_VegCoverByPointAbsolute, regionList)
+                if outVal[0].lower() != "success function":
+                    return "Failed function - 'produce_Tables' - stream_VegCoverByPointAbsolute"
+                stage['rowsOut'] = sum(len(outDF) for outDF in outVal[1].values())
+            for region, outDF in outVal[1].items():
+                await sheetQueue.put((sheetNames[region], outDF))
+
+        else:
+            #Vegetation records are fetched while the SOP8-1 table (and the SOP8-3 stages) are processed
+            outVal = await vegetationFetch
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'produce_Tables' - defineRecords_MarkerVegetation"
+
+            with profile_Stage('defineRecords_VegCoverByPointAbsolute', rowsIn=len(outVal[1])):
+                vegCrosstab = await run_Stage(None, pivot_VegCoverAbsolute, outVal[1])
+            for region in regionList:
+                with profile_Stage('regionTable_VegCoverAbsolute', region=region) as stage:
+                    outDF = await run_Stage(None, regionTable_VegCoverAbsolute, vegCrosstab, region)
+                    stage['rowsOut'] = len(outDF)
+                print("Success:  defineRecords_VegCoverBySegment - " + region + " - " + timeFun())
+                await sheetQueue.put((sheetNames[region], outDF))
+
+        if trendFetch is not None:
+            outVal = await trendFetch
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'produce_Tables' - define_Trends"
+            await sheetQueue.put(('Trend', outVal[1]['trends']))
+
+        if qaCheck is not None:
+            outVal = await qaCheck
+            if outVal[0].lower() == "success function" and len(outVal[1]) > 0:
+                await sheetQueue.put(('QA-Violations', outVal[1]))
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on produce_Tables Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'produce_Tables'"
+
+    finally:
+        await sheetQueue.put(pipelineEnd)
+
+#Workbook writer stage - each sheet on 'sheetQueue' is written as it arrives to a temporary workbook, closed after the end marker. The workbook is renamed to
+#'outXLSX' once the table stages ('tablesTask') and the QA Validation ('qaCheck') succeeded - otherwise it is removed, no partial workbook is left
+async def write_WorkbookQueue(outXLSX, sheetQueue, tablesTask, qaCheck):
+
+    tempXLSX = os.path.splitext(outXLSX)[0] + ".tmp" + str(os.getpid()) + ".xlsx"
+    writer = await run_Stage(None, open_WorkbookWriter, tempXLSX)
+    sheetNames = []
+
+    async def write_Sheet(sheetName, outDF):
+        await run_Stage(None, write_WorkbookSheet, writer, sheetName, outDF)
+        sheetNames.append(sheetName)
+
+    outVal = await consume_Queue(sheetQueue, write_Sheet)
+    await run_Stage(None, close_WorkbookWriter, writer)
+
+    upstreamVal = await tablesTask
+    if upstreamVal.lower() == "success function" and qaCheck is not None:
+        qaVal = await qaCheck
+        upstreamVal = qaVal if isinstance(qaVal, str) else qaVal[0]
+    if outVal.lower() != "success function" or upstreamVal.lower() != "success function":
+        if os.path.exists(tempXLSX):
+            os.remove(tempXLSX)
+        scriptMsg = "WARNING - Workbook not exported - " + outXLSX + " - " + (outVal if outVal.lower() != "success function" else upstreamVal)
+        print(scriptMsg)
+        log_Message(scriptMsg, logging.WARNING, stage='write_WorkbookQueue')
+        return outVal if outVal.lower() != "success function" else "Failed function - 'write_WorkbookQueue' - upstream stage failed"
+    os.replace(tempXLSX, outXLSX)
+
+    for sheetName in sheetNames:
+        messageTime = timeFun()
+        scriptMsg = "Successfully Exported Table " + sheetName + " - to: " + outXLSX + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='write_WorkbookQueue')
+
+    return outVal
+
+#Figure stages - the Stratum Cover Data is fetched/calculated and put on 'regionQueue' (region, region DataFrame) one Region at a time
+async def produce_Figures(fetchExecutor, markerFetch, regionList, regionQueue):
+    try:
+        with profile_Stage('defineRecords_CoverByStratum') as stage:
+            if pushdownAggregation:
+                outVal = await run_Stage(fetchExecutor, aggregate_CoverByStratum)
+            else:
+                outVal = await markerFetch
+                if outVal[0].lower() == "success function":
+                    outVal = await run_Stage(None, defineRecords_CoverByStratum, outVal[1])
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'produce_Figures' - defineRecords_CoverByStratum"
+            stage['rowsOut'] = len(outVal[1])
+
+        for region, regionDF in partition_Frame(outVal[1], regionList).items():
+            await regionQueue.put((region, regionDF))
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on produce_Figures Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'produce_Figures'"
+
+    finally:
+        await regionQueue.put(pipelineEnd)
+
+#Render stage - the page of each Region is rendered to pdf bytes in 'renderExecutor' and put on 'pageQueue' (region, region DataFrame, page).
+#Without 'pypdf' the page is None and the pdf writer stage renders it into the pdf
+async def render_PageQueue(regionQueue, pageQueue, renderExecutor, renderPages):
+
+    async def render_Page(region, regionDF):
+        page = None
+        if renderPages:
+            with profile_Stage('render_CoverByStratumPage', rowsIn=len(regionDF), region=region):
+                page, seconds = await run_Stage(renderExecutor, render_CoverByStratumPage, region, regionDF)
+        await pageQueue.put((region, regionDF, page))
+
+    try:
+        return await consume_Queue(regionQueue, render_Page)
+    finally:
+        await pageQueue.put(pipelineEnd)
+
+#Pdf writer stage - pages on 'pageQueue' are added to 'outPDF' in Region order as they arrive
+async def write_PdfQueue(outPDF, pageQueue, renderPages):
+
+    import io
+    if renderPages:
+        from pypdf import PdfWriter
+        pdfWriter = PdfWriter()
+    else:
+        from matplotlib.backends.backend_pdf import PdfPages
+        pdf = PdfPages(outPDF)
+    regionNames = []
+
+    def save_Page(region, regionDF):
+        with profile_Stage('render_CoverByStratumPage', rowsIn=len(regionDF), region=region):
+            figure = build_CoverByStratumFigure(regionDF, region)
+            pdf.savefig(figure)
+            figure.clear()  #Release the Figure once saved
+
+    async def write_Page(region, regionDF, page):
+        if page is not None:
+            await run_Stage(None, pdfWriter.append, io.BytesIO(page))
+        else:
+            await run_Stage(None, save_Page, region, regionDF)
+        regionNames.append(region)
+
+    outVal = await consume_Queue(pageQueue, write_Page)
+    if renderPages:
+        with open(outPDF, "wb") as pdfOut:
+            await run_Stage(None, pdfWriter.write, pdfOut)
+    else:
+        await run_Stage(None, pdf.close)
+
+    for region in regionNames:
+        messageTime = timeFun()
+        scriptMsg = "Successfully Exported Figures Region:" + region + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='write_PdfQueue', region=region)
+
+    return outVal
+
+#Trend pdf writer stage - the Trend Figures are written once the Trend Analysis is ready
+async def write_TrendPDF(trendFetch, outTrendPDF, regionList):
+
+    outVal = await trendFetch
+    if outVal[0].lower() != "success function":
+        return "Failed function - 'write_TrendPDF' - define_Trends"
+
+    return await run_Stage(None, figure_Trends, outVal[1], outTrendPDF, regionList)
+
+#Run the selected products ('tables'/'figures') through the overlapped pipeline - workbook 'outXLSX', pdf 'outPDF', QA Violations '<outQAPrefix>.parquet' and the
+#Trend pdf 'outTrendPDF' ('trendAnalysis')
+async def run_OverlappedPipeline(productList, outXLSX, outPDF, outQAPrefix, outTrendPDF, regionList):
+
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+    #Pages are rendered in worker processes and merged with pypdf when it is installed
+    renderPages = importlib.util.find_spec('pypdf') is not None
+
+    #Render worker processes are spawned - forking while the fetch thread is querying is not safe
+    fetchExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fetch')
+    renderExecutor = None
+    if renderPages and maxWorkers != 1:
+        import multiprocessing
+        renderExecutor = ProcessPoolExecutor(max_workers=max(1, min(len(regionList), maxWorkers or os.cpu_count())), mp_context=multiprocessing.get_context('spawn'))
+    try:
+        #Marker Visits are the first fetch queued, then the figure stages ahead of the table stages
+        markerFetch = None
+        if trendAnalysis or ('tables' in productList and not streamingQueries) or ('figures' in productList and not pushdownAggregation):
+            markerFetch = asyncio.ensure_future(fetch_MarkerVisits(fetchExecutor))
+        vegetationFetch = None
+        if 'tables' in productList and not streamingQueries:
+            vegetationFetch = asyncio.ensure_future(fetch_MarkerVegetation(fetchExecutor, markerFetch))
+        qaCheck = None
+        if validateData:
+            qaCheck = asyncio.ensure_future(validate_Dataset(fetchExecutor, markerFetch, vegetationFetch, outQAPrefix))
+        trendFetch = None
+        if trendAnalysis:
+            trendFetch = asyncio.ensure_future(produce_Trends(markerFetch))
+
+        stageList = []
+        if 'figures' in productList:
+            regionQueue = asyncio.Queue(maxsize=pipelineQueueSize)
+            pageQueue = asyncio.Queue(maxsize=pipelineQueueSize)
+            stageList.extend([produce_Figures(fetchExecutor, markerFetch, regionList, regionQueue), render_PageQueue(regionQueue, pageQueue, renderExecutor, renderPages),
+                              write_PdfQueue(outPDF, pageQueue, renderPages)])
+            if trendFetch is not None:
+                stageList.append(write_TrendPDF(trendFetch, outTrendPDF, regionList))
+        if 'tables' in productList:
+            sheetQueue = asyncio.Queue(maxsize=pipelineQueueSize)
+            tablesTask = asyncio.ensure_future(produce_Tables(fetchExecutor, markerFetch, vegetationFetch, trendFetch, qaCheck, regionList, sheetQueue))
+            stageList.extend([tablesTask, write_WorkbookQueue(outXLSX, sheetQueue, tablesTask, qaCheck)])
+
+        stageResults = await asyncio.gather(*stageList)
+        for fetchTask in (markerFetch, vegetationFetch, trendFetch):
+            if fetchTask is not None:
+                await fetchTask
+        if qaCheck is not None:
+            outVal = await qaCheck
+            if outVal[0].lower() != "success function":
+                print("WARNING - Pipeline Stage - validate_Dataset - Failed")
+                return "Failed function - 'run_OverlappedPipeline' - QA Validation"
+
+        for outVal in stageResults:
+            if outVal.lower() != "success function":
+                print("WARNING - Pipeline Stage - " + outVal)
+                return "Failed function - 'run_OverlappedPipeline'"
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on run_OverlappedPipeline Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'run_OverlappedPipeline'"
+
+    finally:
+        fetchExecutor.shutdown()
+        if renderExecutor is not None:
+            renderExecutor.shutdown()
+
+
+#######################################
+# Batch Mode - Multiple Monitoring Years
+#######################################
+
+#Subset the Marker Visit Dataset to each (Monitoring Year, Region) Report Unit in 'unitList' - one grouping pass over each table
+def partition_MarkerVisitDataset(markerDataset, unitList):
+
+    unitFrames = {name: partition_Frame(inDF, unitList, ['Year', 'Region']) for name, inDF in markerDataset.items()}
+
+    return {unit: {name: unitFrames[name][unit] for name in markerDataset} for unit in unitList}
+
+#Batch worker process initializer - the settings of the run are applied and records are logged to the log queue of the run
+def init_Worker(settings, logQueue):
+
+    apply_Settings(settings)
+    if logQueue is not None:
+        start_WorkerLogging(logQueue)
+
+#Report Unit for one Monitoring Year and Region - run in a worker process by 'batch_main'.
+#Returns the SOP8-1 rows, the SOP8-2 table and the SOP8-3 stratum cover records of the Region
+def run_ReportUnit(year, region, unitDataset, profiled=False):
+
+    global profileRun
+    try:
+        #Stage records of this unit only - the worker may be reused across units. 'profiled' carries the switch into spawned workers
+        profileRun = profiled
+        del stageRecords[:]
+        start_Profiling()
+        set_LogFields(year=year, region=region)
+
+        with profile_Stage('defineRecords_MarkerData', rowsIn=len(unitDataset['markerVisits']), year=year, region=region):
+            outVal = defineRecords_MarkerData(unitDataset)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'run_ReportUnit' - defineRecords_MarkerData"
+
+        with profile_Stage('SummarizeFigure8_1', rowsIn=len(outVal[1]), year=year, region=region):
+            outVal = SummarizeFigure8_1(outVal[1])
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'run_ReportUnit' - SummarizeFigure8_1"
+        outDf_8pt1 = outVal[1]
+
+        with profile_Stage('defineRecords_VegCoverByPointAbsolute', rowsIn=len(unitDataset['vegetation']), year=year, region=region) as stage:
+            outDf_8pt2 = regionTable_VegCoverAbsolute(pivot_VegCoverAbsolute(unitDataset['vegetation']), region)
+            stage['rowsOut'] = len(outDf_8pt2)
+
+        with profile_Stage('defineRecords_CoverByStratum', rowsIn=len(unitDataset['markerVisits']), year=year, region=region):
+            outVal = defineRecords_CoverByStratum(unitDataset)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'run_ReportUnit' - defineRecords_CoverByStratum"
+        outDf_stratum = outVal[1]
+
+        return "success function", {'year': year, 'region': region, 'SOP8-1': outDf_8pt1, 'SOP8-2': outDf_8pt2, 'SOP8-3': outDf_stratum,
+                                    'stages': list(stageRecords)}
+
+    except:
+        messageTime = timeFun()
+        print("Error on run_ReportUnit Function - " + str(year) + " - " + region + " - " + messageTime)
+        log_Message("Error on run_ReportUnit Function - " + messageTime, logging.ERROR, withTraceback=True, stage='run_ReportUnit')
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'run_ReportUnit'"
+
+    finally:
+        set_LogFields(year=None, region=None)
+
+#Batch Mode - fan the (year, region) Report Units out over a process pool, then gather them into a workbook and/or pdf per Monitoring Year ('productList').
+#The Marker Visit Dataset is queried once and each worker only receives the records of its unit
+def batch_main(yearList, productList=('tables', 'figures')):
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+
+        start_Profiling()
+        outVal = open_DataSource(snapshotDir, 'parquet') if snapshotDir is not None else open_DataSource(inDB, dataSourceType)
+        if outVal[0].lower() != "success function":
+            print("WARNING - Function open_DataSource - Failed - Exiting Script")
+            exit()
+
+        with profile_Stage('defineRecords_MarkerVisitDataset') as stage:
+            outVal = defineRecords_MarkerVisitDataset()
+        if outVal[0].lower() != "success function":
+            print("WARNING - Function defineRecords_MarkerVisitDataset - Failed - Exiting Script")
+            exit()
+        markerDataset = outVal[1]
+        stage['rowsOut'] = len(markerDataset['markerVisits']) + len(markerDataset['vegetation'])
+
+        outVal = define_PartitionIndex()
+        if outVal[0].lower() != "success function":
+            print("WARNING - Function define_PartitionIndex - Failed - Exiting Script")
+            exit()
+        regionNames = list(outVal[1])
+        close_DataSource()
+
+        #QA Validation of all Monitoring Years - the violations of each year are added to its workbook
+        yearViolations = {}
+        if validateData:
+            outVal = run_Validation(markerDataset, os.path.join(outputDir, "MangroveMarsh_QA_Violations_Batch_" + dateString))
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function run_Validation - Failed - Exiting Script")
+                exit()
+            yearViolations = partition_Frame(outVal[1], yearList, 'Year')
+
+        unitList = [(year, region) for year in yearList for region in regionNames]
+        unitDatasets = partition_MarkerVisitDataset(markerDataset, unitList)
+        unitResults = {}
+
+        #Incremental Build - Report Units whose records are unchanged are loaded from their node in 'buildDir'
+        unitFingerprints = {}
+        if buildDir is not None:
+            stageParams = {'confidence': confidence, 'bootstrapCI': bootstrapCI, 'bootstrapSamples': bootstrapSamples}
+            for year, region in unitList:
+                unitFingerprints[(year, region)] = hash_Content('run_ReportUnit', dict(stageParams, year=year, region=region), list(unitDatasets[(year, region)].values()))
+                unitFrames = node_Load('Unit|' + str(year) + '|' + region, unitFingerprints[(year, region)])
+                if unitFrames is not None:
+                    unitResults[(year, region)] = dict(unitFrames, year=year, region=region)
+
+        #Command line/config settings are applied in each worker - spawned workers re-import the module with the parameter defaults
+        staleUnits = [unit for unit in unitList if unit not in unitResults]
+        with ProcessPoolExecutor(max_workers=maxWorkers, initializer=init_Worker, initargs=(runSettings, logState['queue'])) as executor:
+            futureList = [executor.submit(run_ReportUnit, year, region, unitDatasets[(year, region)], profileRun) for year, region in staleUnits]
+            for (year, region), future in zip(staleUnits, futureList):
+                outVal = future.result()
+                if outVal[0].lower() != "success function":
+                    print("WARNING - Function run_ReportUnit - " + str(year) + " - " + region + " - Failed - Exiting Script")
+                    exit()
+                unitResults[(year, region)] = outVal[1]
+                stageRecords.extend(outVal[1]['stages'])
+                if buildDir is not None:
+                    node_Store('Unit|' + str(year) + '|' + region, unitFingerprints[(year, region)], {name: outVal[1][name] for name in ('SOP8-1', 'SOP8-2', 'SOP8-3')})
+                    messageTime = timeFun()
+                    scriptMsg = "Rebuilt Node: Unit|" + str(year) + "|" + region + " - " + messageTime
+                    print(scriptMsg)
+                    log_Message(scriptMsg, stage='batch_main', region=region, year=year)
+
+        #Gather the Report Units into the outputs for each Monitoring Year
+        for year in yearList:
+            set_LogFields(year=year)
+            yearResults = [unitResults[(year, region)] for region in regionNames]
+
+            if 'tables' in productList:
+                outDf_8pt1 = pd.concat([result['SOP8-1'] for result in yearResults])
+                outDf_8pt1.sort_index(kind='stable', inplace=True)
+                sheetDict = {'SOP8-1': outDf_8pt1}
+                sheetNames = define_RegionSheetNames(regionNames)
+                for result in yearResults:
+                    sheetDict[sheetNames[result['region']]] = result['SOP8-2']
+                if len(yearViolations.get(year, [])) > 0:
+                    sheetDict['QA-Violations'] = yearViolations[year]
+
+                outXLSX = os.path.join(outputDir, "MangroveMarsh_Export_" + str(year) + "_" + dateString + ".xlsx")
+                if buildDir is not None:
+                    sheetFingerprints = [unitFingerprints[(year, region)] for region in regionNames]
+                    if 'QA-Violations' in sheetDict:
+                        sheetFingerprints.append(hash_Content('QA-Violations', {}, [sheetDict['QA-Violations']]))
+                    outVal = build_Workbook(outXLSX, sheetDict, sheetFingerprints, str(year) + '|')
+                else:
+                    outVal = export_Workbook(outXLSX, sheetDict)
+                if outVal.lower() != "success function":
+                    print("WARNING - Function export_Workbook - " + str(year) + " - Failed - Exiting Script")
+                    exit()
+
+            if 'figures' in productList:
+                outYearPDF = os.path.join(outputDir, "MangroveMarsh_AnnualTablesFigs_" + str(year) + "_" + dateString + ".pdf")
+                outDF = pd.concat([result['SOP8-3'] for result in yearResults], ignore_index=True)
+                if buildDir is not None:
+                    outVal = build_CoverByStratumPDF(outDF, outYearPDF, regionNames, str(year) + '|')
+                else:
+                    outVal = figure_CoverByStratum(outDF, outYearPDF, regionNames)
+                if outVal.lower() != "success function":
+                    print("WARNING - Function figure_CoverByStratum - " + str(year) + " - Failed - Exiting Script")
+                    exit()
+        set_LogFields(year=None)
+
+        messageTime = timeFun()
+        scriptMsg = "Successfully Finished Batch Processing - SFCN_MangroveMash_Tables_Figures - Years: " + ", ".join(str(year) for year in yearList) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='batch_main')
+
+        export_RunReport(os.path.join(outputDir, "MangroveMarsh_RunReport_Batch_" + dateString))
+
+        return "success function"
+
+    except:
+
+        messageTime = timeFun()
+        scriptMsg = "WARNING Batch Script Failed - " + messageTime
+        print (scriptMsg)
+        log_Message(scriptMsg, logging.ERROR, withTraceback=True, stage='batch_main')
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'batch_main'"
+
+    finally:
+        set_LogFields(year=None)
+        close_DataSource()
+
+
+#######################################
+# Report Service
+#######################################
+#Long running report service ('serve' command) - the Marker Visit Dataset (marker and vegetation records) is pulled once and held in memory with the Partition Index,
+#and single products are served over a local HTTP API on 'serviceHost':'servicePort' or the Unix socket 'serviceSocket'. Derived tables (SOP8-2 crosstab, stratum
+#cover, trend sums) are calculated on first use and rendered products are kept in an LRU cache of 'serviceCacheSize' entries. The Data Source fingerprint is
+#checked at most every 'serviceCheckSeconds' - when the source changed the dataset is pulled again and the cache cleared. Requests are served one at a time
+#(the Data Source Session and the parameters set by a request are not shared across threads). With 'snapshotDir' the snapshot is refreshed when the service starts
+
+#Dataset held by the service - the Marker Visit Dataset, Regions of the Partition Index, source fingerprint and the derived tables of the dataset
+serviceState = {'markerDataset': None, 'regionNames': [], 'fingerprint': None, 'checkTime': 0.0, 'loadTime': None, 'derived': {}}
+
+#Rendered products - (product, request parameters): (content type, body) in least to most recently used order, with the cache counters
+serviceCache = OrderedDict()
+serviceCounters = {'requests': 0, 'hits': 0, 'reloads': 0}
+
+#Content types of the product formats
+serviceContentTypes = {'csv': 'text/csv; charset=utf-8', 'json': 'application/json', 'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                       'png': 'image/png', 'pdf': 'application/pdf', 'text': 'text/plain; charset=utf-8'}
+
+#Open the Data Source and pull the Marker Visit Dataset into the service - the cache of rendered products is cleared
+def load_ServiceDataset():
+    try:
+        close_DataSource()
+        if snapshotDir is not None:
+            outVal = open_DataSource(snapshotDir, 'parquet')
+        else:
+            outVal = open_DataSource(inDB, dataSourceType)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'load_ServiceDataset' - open_DataSource"
+        fingerprint = define_SourceFingerprint()
+
+        outVal = define_PartitionIndex()
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'load_ServiceDataset' - define_PartitionIndex"
+        regionNames = list(outVal[1])
+
+        outVal = defineRecords_MarkerVisitDataset(True)
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'load_ServiceDataset' - defineRecords_MarkerVisitDataset"
+        markerDataset = outVal[1]
+
+        serviceState.update({'markerDataset': markerDataset, 'regionNames': regionNames, 'fingerprint': fingerprint, 'checkTime': time.monotonic(),
+                             'loadTime': timeFun(), 'derived': {}})
+        serviceCache.clear()
+
+        messageTime = timeFun()
+        scriptMsg = "Report Service Dataset Loaded - Marker Visits: " + str(len(markerDataset['markerVisits'])) + " - Vegetation Records: " + str(len(markerDataset['vegetation'])) +\
+                    " - Regions: " + ", ".join(regionNames) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='load_ServiceDataset')
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on load_ServiceDataset Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'load_ServiceDataset'"
+
+#Pull the dataset again when the Data Source fingerprint changed - checked at most every 'serviceCheckSeconds'
+def check_ServiceDataset():
+
+    if serviceState['markerDataset'] is not None and time.monotonic() - serviceState['checkTime'] < serviceCheckSeconds:
+        return "success function"
+
+    serviceState['checkTime'] = time.monotonic()
+    dataSession['fingerprint'] = None
+    if serviceState['markerDataset'] is not None and define_SourceFingerprint() == serviceState['fingerprint']:
+        return "success function"
+
+    messageTime = timeFun()
+    scriptMsg = "Report Service - Data Source changed - reloading the dataset - " + messageTime
+    print(scriptMsg)
+    log_Message(scriptMsg, stage='check_ServiceDataset')
+    serviceCounters['reloads'] += 1
+
+    return load_ServiceDataset()
+
+#Tables derived from the service dataset - calculated on first use and held until the dataset is reloaded
+serviceDerivations = {'markerData': lambda markerDataset: defineRecords_MarkerData(markerDataset),
+                      'vegCrosstab': lambda markerDataset: ("success function", pivot_VegCoverAbsolute(markerDataset['vegetation'])),
+                      'coverByStratum': lambda markerDataset: defineRecords_CoverByStratum(markerDataset),
+                      'trendSums': lambda markerDataset: trend_YearSums(markerDataset['markerVisits'])}
+
+#Derived table 'name' of the service dataset (see 'serviceDerivations')
+def service_Derived(name):
+
+    derived = serviceState['derived']
+    if name not in derived:
+        outVal = serviceDerivations[name](serviceState['markerDataset'])
+        if outVal[0].lower() != "success function":
+            raise RuntimeError("Failed function - 'service_Derived' - " + name)
+        derived[name] = outVal[1]
+
+    return derived[name]
+
+#Parameters set for one request - the previous values are restored when the request is done
+@contextmanager
+def request_Settings(**settings):
+
+    previous = {name: globals()[name] for name in settings}
+    globals().update(settings)
+    try:
+        yield
+    finally:
+        globals().update(previous)
+
+#Last value of request parameter 'name' - 'default' when not given
+def request_Value(query, name, default=None):
+
+    return query.get(name, [default])[-1]
+
+#Output format of a request - the first of 'formatList' when not given. An unsupported format is a bad request (ValueError)
+def request_Format(query, formatList):
+
+    outFormat = request_Value(query, 'format', formatList[0]).lower()
+    if outFormat not in formatList:
+        raise ValueError("format must be one of: " + ", ".join(formatList))
+
+    return outFormat
+
+#Region of a request - a Region of the Partition Index. 'required' False returns None when not given
+def request_Region(query, required=True):
+
+    region = request_Value(query, 'region')
+    if region is None and not required:
+        return None
+    if region not in serviceState['regionNames']:
+        raise ValueError("region must be one of: " + ", ".join(serviceState['regionNames']))
+
+    return region
+
+#Confidence level(s) of a request - repeat 'confidence' for more than one level, the 'confidence' parameter when not given
+def request_Confidence(query):
+
+    try:
+        levelList = [float(level) for level in query.get('confidence', [])]
+    except ValueError:
+        raise ValueError("confidence must be a number between 0 and 1")
+    if not levelList:
+        return confidence
+    if not all(0 < level < 1 for level in levelList):
+        raise ValueError("confidence must be a number between 0 and 1")
+
+    return levelList[0] if len(levelList) == 1 else levelList
+
+#Table in the requested format - csv, json (records) or a single sheet workbook
+def format_ServiceTable(outDF, outFormat, sheetName):
+
+    if outFormat == 'csv':
+        return serviceContentTypes['csv'], outDF.to_csv(index=False).encode('utf-8')
+    if outFormat == 'json':
+        return serviceContentTypes['json'], outDF.to_json(orient='records', date_format='iso').encode('utf-8')
+
+    import io
+    workbookBuffer = io.BytesIO()
+    with pd.ExcelWriter(workbookBuffer, engine='openpyxl') as writer:
+        outDF.to_excel(writer, sheet_name=sheetName, index=False)
+    return serviceContentTypes['xlsx'], workbookBuffer.getvalue()
+
+#Figure in the requested format (png or pdf) - the Figure is released once saved
+def format_ServiceFigure(figure, outFormat):
+
+    import io
+    figureBuffer = io.BytesIO()
+    figure.savefig(figureBuffer, format=outFormat)
+    figure.clear()
+
+    return serviceContentTypes[outFormat], figureBuffer.getvalue()
+
+#SOP8-1 table - parameters 'confidence' (repeat for more than one level), 'region' (optional) and 'format' (csv, json, xlsx)
+def serve_SOP8_1(query):
+
+    outFormat = request_Format(query, ['csv', 'json', 'xlsx'])
+    region = request_Region(query, required=False)
+    with request_Settings(confidence=request_Confidence(query)):
+        outVal = SummarizeFigure8_1(service_Derived('markerData'))
+    if outVal[0].lower() != "success function":
+        raise RuntimeError("Failed function - 'serve_SOP8_1'")
+    outDF = outVal[1] if region is None else outVal[1][outVal[1]['Region'] == region]
+
+    return format_ServiceTable(outDF, outFormat, 'SOP8-1')
+
+#SOP8-2 Absolute Cover table of a Region - parameters 'region', 'location' (optional - the cover by taxon at one Marker Point) and 'format' (csv, json, xlsx)
+def serve_SOP8_2(query):
+
+    outFormat = request_Format(query, ['csv', 'json', 'xlsx'])
+    region = request_Region(query)
+    locationName = request_Value(query, 'location')
+    if locationName is not None:
+        outDF = pointCover_VegCoverAbsolute(service_Derived('vegCrosstab'), region, locationName).rename('AbsolutePercCover').reset_index()
+    else:
+        outDF = regionTable_VegCoverAbsolute(service_Derived('vegCrosstab'), region)
+
+    return format_ServiceTable(outDF, outFormat, define_RegionSheetNames([region])[region])
+
+#SOP8-3 Figure of a Region - parameters 'region' and 'format' (png, pdf)
+def serve_SOP8_3(query):
+
+    outFormat = request_Format(query, ['png', 'pdf'])
+    region = request_Region(query)
+    regionDF = partition_Frame(service_Derived('coverByStratum'), [region])[region]
+
+    return format_ServiceFigure(build_CoverByStratumFigure(regionDF, region), outFormat)
+
+#Trend table or Figure - parameters 'confidence', 'region' (optional for the table), 'level' (Segment/Location), 'response' and 'format' (csv, json, xlsx, png, pdf).
+#Trends are refitted from the held Monitoring Year sums for the requested confidence
+def serve_Trend(query):
+
+    outFormat = request_Format(query, ['csv', 'json', 'xlsx', 'png', 'pdf'])
+    region = request_Region(query, required=outFormat in ('png', 'pdf'))
+    yearSumDF = service_Derived('trendSums')
+    with request_Settings(confidence=request_Confidence(query)):
+        outVal = fit_Trends(yearSumDF)
+        if outVal[0].lower() != "success function":
+            raise RuntimeError("Failed function - 'serve_Trend'")
+        trendDF = outVal[1]
+
+        if outFormat in ('png', 'pdf'):
+            figure = build_TrendFigure(trendDF[trendDF['Region'] == region], yearSumDF[yearSumDF['Region'] == region], region)
+            return format_ServiceFigure(figure, outFormat)
+
+    for field, name in (('Region', 'region'), ('Level', 'level'), ('Response', 'response')):
+        value = request_Value(query, name)
+        if value is not None:
+            trendDF = trendDF[trendDF[field] == value]
+
+    return format_ServiceTable(trendDF, outFormat, 'Trend')
+
+#Service status - dataset, source fingerprint and cache counters (json). Not cached
+def serve_Status(query):
+
+    markerDataset = serviceState['markerDataset'] or {}
+    statusDict = {'inDB': snapshotDir if snapshotDir is not None else inDB, 'loadTime': serviceState['loadTime'], 'fingerprint': serviceState['fingerprint'],
+                  'markerVisits': len(markerDataset.get('markerVisits', [])), 'vegetation': len(markerDataset.get('vegetation', [])), 'regions': serviceState['regionNames'],
+                  'derived': list(serviceState['derived']), 'cacheEntries': len(serviceCache)}
+    statusDict.update(serviceCounters)
+
+    return serviceContentTypes['json'], json.dumps(statusDict, default=str).encode('utf-8')
+
+#Products served - request path: product function of the request parameters (dict of value lists) returning (content type, body)
+serviceProducts = {'sop8-1': serve_SOP8_1, 'sop8-2': serve_SOP8_2, 'sop8-3': serve_SOP8_3, 'trend': serve_Trend, 'status': serve_Status}
+
+#Serve a request path (e.g. '/sop8-3?region=Shark%20Slough&format=png') - returns (HTTP status, content type, body). Bad requests (unknown product, region,
+#format or confidence) are 404/400, a failed product 500 and a failed dataset reload 503
+def serve_Request(requestPath):
+
+    from urllib.parse import urlsplit, parse_qs
+
+    try:
+        urlParts = urlsplit(requestPath)
+        product = urlParts.path.strip('/').lower()
+        query = parse_qs(urlParts.query)
+        serviceCounters['requests'] += 1
+
+        if product not in serviceProducts:
+            return 404, serviceContentTypes['text'], ("Unknown product: " + product + " - Products: " + ", ".join(serviceProducts)).encode('utf-8')
+        if product == 'status':
+            return (200,) + serve_Status(query)
+
+        outVal = check_ServiceDataset()
+        if outVal.lower() != "success function":
+            return 503, serviceContentTypes['text'], outVal.encode('utf-8')
+
+        cacheKey = (product, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+        if cacheKey in serviceCache:
+            serviceCache.move_to_end(cacheKey)
+            serviceCounters['hits'] += 1
+            return (200,) + serviceCache[cacheKey]
+
+        with profile_Stage('serve_Request', product=product):
+            outResult = serviceProducts[product](query)
+        serviceCache[cacheKey] = outResult
+        while len(serviceCache) > serviceCacheSize:
+            serviceCache.popitem(last=False)
+
+        return (200,) + outResult
+
+    except ValueError as error:
+        return 400, serviceContentTypes['text'], str(error).encode('utf-8')
+
+    except:
+        messageTime = timeFun()
+        print("Error on serve_Request Function - " + requestPath + " - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return 500, serviceContentTypes['text'], ("Failed request: " + requestPath).encode('utf-8')
+
+#HTTP request handler of the service - GET requests are passed to 'serve_Request' and logged with the status and time taken
+def define_ServiceHandler():
+
+    from http.server import BaseHTTPRequestHandler
+
+    class ServiceHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            startTime = time.perf_counter()
+            status, contentType, body = serve_Request(self.path)
+            self.send_response(status)
+            self.send_header('Content-Type', contentType)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+            messageTime = timeFun()
+            requestSeconds = time.perf_counter() - startTime
+            scriptMsg = "Report Service Request: " + self.path + " - " + str(status) + " - " + str(round(requestSeconds * 1000, 1)) + " ms - " + messageTime
+            print(scriptMsg)
+            log_Message(scriptMsg, stage='serve_Request', duration=round(requestSeconds, 6))
+
+        #Unix socket clients have no address
+        def address_string(self):
+            return str(self.client_address[0]) if self.client_address else 'unix socket'
+
+        #Requests are logged by 'do_GET'
+        def log_request(self, code='-', size='-'):
+            pass
+
+    return ServiceHandler
+
+#Run the Report Service until interrupted (Ctrl+C) - the dataset is pulled and the figure/Student T libraries imported before the first request
+def run_Service():
+    try:
+        if snapshotDir is not None and refreshSnapshot:
+            outVal = refresh_Snapshot(snapshotDir)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function refresh_Snapshot - Failed")
+                return "Failed function - 'run_Service'"
+
+        outVal = load_ServiceDataset()
+        if outVal.lower() != "success function":
+            print("WARNING - Function load_ServiceDataset - Failed")
+            return "Failed function - 'run_Service'"
+
+        #Warm the figure and statistics modules so the first request does not pay their import time
+        for moduleName in ('matplotlib.figure', 'scipy.stats'):
+            importlib.import_module(moduleName)
+
+        from http.server import HTTPServer
+        serviceHandler = define_ServiceHandler()
+        if serviceSocket is not None:
+            import socketserver
+            if os.path.exists(serviceSocket):
+                os.remove(serviceSocket)
+            server = socketserver.UnixStreamServer(serviceSocket, serviceHandler)
+            serviceAddress = serviceSocket
+        else:
+            server = HTTPServer((serviceHost, servicePort), serviceHandler)
+            serviceAddress = "http://" + serviceHost + ":" + str(server.server_address[1])
+
+        messageTime = timeFun()
+        scriptMsg = "Report Service listening on " + serviceAddress + " - Products: " + ", ".join(serviceProducts) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='run_Service')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Report Service stopped")
+        finally:
+            server.server_close()
+            if serviceSocket is not None and os.path.exists(serviceSocket):
+                os.remove(serviceSocket)
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on run_Service Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'run_Service'"
+
+    finally:
+        close_DataSource()
+
+#Request a product from a running Report Service ('query' command) - 'params' are the request parameters. The body is written to 'outFile' or stdout
+def query_Service(product, params, outFile=None):
+    try:
+        import http.client
+        from urllib.parse import urlencode, quote
+
+        requestPath = '/' + quote(product) + ('?' + urlencode(params, doseq=True) if params else '')
+        if serviceSocket is not None:
+            import socket
+            connection = http.client.HTTPConnection('localhost')
+            connection.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.sock.connect(serviceSocket)
+        else:
+            connection = http.client.HTTPConnection(serviceHost, servicePort)
+        connection.request('GET', requestPath)
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+
+        if response.status != 200:
+            print("WARNING - Report Service - " + requestPath + " - " + str(response.status) + " - " + body.decode('utf-8', 'replace'))
+            return "Failed function - 'query_Service'"
+
+        if outFile is not None:
+            with open(outFile, "wb") as productOut:
+                productOut.write(body)
+            print("Report Service - " + requestPath + " - written to: " + outFile)
+        else:
+            sys.stdout.buffer.write(body)
+            sys.stdout.flush()
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on query_Service Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'query_Service'"
+
+
+#######################################
+# Synthetic Dataset and Benchmark
+#######################################
+
+#Generate a synthetic Mangrove Marsh database 'outDB' (sqlite) with the tbl_Locations/tbl_Event_Group/tbl_Events/tbl_MarkerData/tbl_MarkerData_Vegetation/tlu_Vegetation schema.
+#Each Marker Point is visited once per year, with 'recordsPerStratum' species per Community Type and Stratum. Segments are numbered across Regions as 'Segment_<n>'
+def generate_SyntheticDatabase(outDB, regionCount=3, segmentsPerRegion=4, pointsPerSegment=10, yearList=None, speciesCount=60, recordsPerStratum=2, seed=0):
+
+    try:
+        import sqlite3
+        rng = np.random.default_rng(seed)
+        yearList = yearList if yearList else [monitoringYear]
+        namedRegions = list(regionList or [])
+        regionNames = (namedRegions + ['Region ' + str(regionNumber) for regionNumber in range(len(namedRegions) + 1, regionCount + 1)])[:regionCount]
+
+        #Locations - Order_ID in Region/Segment/Point order
+        pointCount = regionCount * segmentsPerRegion * pointsPerSegment
+        segmentNumber = np.repeat(np.arange(1, regionCount * segmentsPerRegion + 1), pointsPerSegment)
+        pointNumber = np.tile(np.arange(1, pointsPerSegment + 1), regionCount * segmentsPerRegion)
+        locationDF = pd.DataFrame({'Location_ID': np.arange(1, pointCount + 1), 'Order_ID': np.arange(1, pointCount + 1),
+                                   'Region': np.repeat(regionNames, segmentsPerRegion * pointsPerSegment), 'Segment': ['Segment_' + str(number) for number in segmentNumber]})
+        locationDF['Location_Name'] = ['S' + str(segment).zfill(3) + '_P' + str(point).zfill(3) for segment, point in zip(segmentNumber, pointNumber)]
+
+        #Event Groups - one per Monitoring Year
+        eventGroupDF = pd.DataFrame({'Event_Group_ID': np.arange(1, len(yearList) + 1), 'Event_Group_Name': ['Mangrove Marsh ' + str(year) for year in yearList],
+                                     'Start_Date': [str(year) + '-03-01' for year in yearList], 'End_Date': [str(year) + '-03-31' for year in yearList], 'Assessment': 1})
+
+        #Events and Marker Data - one Marker Visit per Location and Event Group
+        visitCount = pointCount * len(yearList)
+        eventDF = pd.DataFrame({'Event_ID': np.arange(1, visitCount + 1), 'Event_Group_ID': np.repeat(eventGroupDF['Event_Group_ID'].to_numpy(), pointCount),
+                                'Location_ID': np.tile(locationDF['Location_ID'].to_numpy(), len(yearList)), 'Event_Type': 'Marker Visit'})
+        markerDF = pd.DataFrame({'Point_ID': np.arange(1, visitCount + 1), 'Event_ID': eventDF['Event_ID'], 'Distance': rng.normal(0, 2.5, visitCount).round(2), 'Method': 'GPS'})
+        for side in vegCommunitySides.values():
+            markerDF[side + '_Cover_Overall'] = rng.integers(30, 101, visitCount)
+            for stratum in vegStrata:
+                markerDF[side + '_Cover_' + stratum] = rng.integers(0, 101, visitCount)
+
+        #Species lookup and Vegetation records - 'recordsPerStratum' species per Point, Community Type and Stratum, about 1 in 10 with a null Percent Cover
+        speciesDF = pd.DataFrame({'SpeciesCode': ['SP' + str(number).zfill(4) for number in range(speciesCount)],
+                                  'ScientificName': ['Species ' + str(number).zfill(4) for number in range(speciesCount)]})
+        recordsPerPoint = len(vegCommunitySides) * len(vegStrata) * recordsPerStratum
+        vegCount = visitCount * recordsPerPoint
+        percentCover = rng.choice([5.0, 10.0, 25.0, 50.0, 75.0], vegCount)
+        percentCover[rng.random(vegCount) < 0.1] = np.nan
+        vegetationDF = pd.DataFrame({'Vegetation_ID': np.arange(1, vegCount + 1), 'Point_ID': np.repeat(markerDF['Point_ID'].to_numpy(), recordsPerPoint),
+                                     'CommunityType': np.tile(np.repeat(list(vegCommunitySides), len(vegStrata) * recordsPerStratum), visitCount),
+                                     'VegetationType': np.tile(np.repeat(vegStrata, recordsPerStratum), visitCount * len(vegCommunitySides)),
+                                     'SpeciesCode': speciesDF['SpeciesCode'].to_numpy()[rng.integers(0, speciesCount, vegCount)], 'PercentCover': percentCover})
+
+        if os.path.exists(outDB):
+            os.remove(outDB)
+        cnxn = sqlite3.connect(outDB)
+        try:
+            for tableName, tableDF in (('tbl_Locations', locationDF), ('tbl_Event_Group', eventGroupDF), ('tbl_Events', eventDF), ('tbl_MarkerData', markerDF),
+                                       ('tbl_MarkerData_Vegetation', vegetationDF), ('tlu_Vegetation', speciesDF)):
+                tableDF.to_sql(tableName, cnxn, index=False)
+            cnxn.commit()
+        finally:
+            cnxn.close()
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  generate_SyntheticDatabase - " + outDB + " - Marker Visits: " + str(visitCount) + " - Vegetation Records: " + str(vegCount) + " - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='generate_SyntheticDatabase')
+
+        return "success function", outDB
+
+    except:
+        messageTime = timeFun()
+        print("Error on generate_SyntheticDatabase Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'generate_SyntheticDatabase'"
+
+#Time 'stageFunction' over 'repeats' calls - the stage must return "success function" (or a tuple starting with it). Returns the list of seconds
+def time_BenchmarkStage(stageName, stageFunction, repeats):
+
+    secondsList = []
+    for repeat in range(repeats):
+        startTime = time.perf_counter()
+        outVal = stageFunction()
+        secondsList.append(time.perf_counter() - startTime)
+        status = outVal[0] if isinstance(outVal, tuple) else outVal
+        if status.lower() != "success function":
+            raise RuntimeError("Benchmark stage failed: " + stageName)
+
+    return secondsList
+
+#Report stages of the benchmark on the synthetic database 'syntheticDB' - list of (stage name, input rows, stage function). The stage inputs are prepared here
+#so only the stage itself is timed, the workbook and pdf are written to 'benchmarkDir' with the 'label' suffix
+def define_BenchmarkStages(syntheticDB, benchmarkDir, label):
+
+    try:
+        outVal = open_DataSource(syntheticDB, 'sqlite')
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'define_BenchmarkStages' - open_DataSource"
+        outVal = defineRecords_MarkerVisitDataset()
+        if outVal[0].lower() != "success function":
+            close_DataSource()
+            return "Failed function - 'define_BenchmarkStages' - defineRecords_MarkerVisitDataset"
+        markerDataset = outVal[1]
+        outVal = define_PartitionIndex()
+        close_DataSource()
+        if outVal[0].lower() != "success function":
+            return "Failed function - 'define_BenchmarkStages' - define_PartitionIndex"
+        benchmarkRegions = list(outVal[1])
+        markerDF = defineRecords_MarkerData(markerDataset)[1]
+        ciDF = markerDF.groupby(['Event_Group_ID', 'Region', 'Segment'], observed=True, as_index=False).agg(
+            AverageDist_M=('Distance', 'mean'), StandardError=('Distance', 'sem'), RecCount=('Distance', 'count'))
+        ciDF['DOF'] = ciDF['RecCount'] - 1
+        sheetDict = {'SOP8-1': SummarizeFigure8_1(markerDF)[1]}
+        sheetNames = define_RegionSheetNames(benchmarkRegions)
+        for region, outDF in defineRecords_VegCoverByPointAbsolute(markerDataset, benchmarkRegions)[1].items():
+            sheetDict[sheetNames[region]] = outDF
+        stratumDF = defineRecords_CoverByStratum(markerDataset)[1]
+        outXLSX = os.path.join(benchmarkDir, "MangroveMarsh_Benchmark_" + label + ".xlsx")
+        outBenchPDF = os.path.join(benchmarkDir, "MangroveMarsh_Benchmark_" + label + ".pdf")
+
+        stageList = [('SummarizeFigure8_1', len(markerDF), lambda: SummarizeFigure8_1(markerDF)),
+                     ('calc_CI', len(ciDF), lambda: calc_CI(ciDF.copy(), confidence)),
+                     ('defineRecords_VegCoverByPointAbsolute', len(markerDataset['vegetation']), lambda: defineRecords_VegCoverByPointAbsolute(markerDataset, benchmarkRegions)),
+                     ('export_Workbook', sum(len(outDF) for outDF in sheetDict.values()), lambda: export_Workbook(outXLSX, sheetDict)),
+                     ('figure_CoverByStratum', len(stratumDF), lambda: figure_CoverByStratum(stratumDF, outBenchPDF, benchmarkRegions))]
+
+        return "success function", stageList
+
+    except:
+        messageTime = timeFun()
+        print("Error on define_BenchmarkStages Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'define_BenchmarkStages'"
+
+#Benchmark the report stages (SOP8-1 summary, calc_CI, SOP8-2 crosstab, Excel export and SOP8-3 figures) on synthetic databases at each scale in 'scaleList'.
+#Scale multiplies the Segments per Region of the 1x dataset (see 'benchmarkDataset'). Exports the timings with the fitted scaling exponent per stage (seconds ~ scale^k)
+#as a csv and the scaling curves as a pdf to 'outputDir'. When 'baselineCSV' is defined, stages slower than 'tolerance' x the baseline best time fail the benchmark
+def benchmark_Pipeline(scaleList, repeats, baselineCSV=None, tolerance=1.5):
+
+    try:
+        benchmarkDir = os.path.join(workspace, "benchmark")
+        if not os.path.exists(benchmarkDir):
+            os.makedirs(benchmarkDir)
+
+        recordList = []
+        for scale in scaleList:
+            datasetConfig = dict(benchmarkDataset)
+            datasetConfig['segmentsPerRegion'] = datasetConfig['segmentsPerRegion'] * scale
+            syntheticDB = os.path.join(benchmarkDir, "MangroveMarsh_Synthetic_" + str(scale) + "x.sqlite")
+            outVal = generate_SyntheticDatabase(syntheticDB, **datasetConfig)
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'benchmark_Pipeline' - generate_SyntheticDatabase"
+
+            outVal = define_BenchmarkStages(syntheticDB, benchmarkDir, str(scale) + "x")
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'benchmark_Pipeline' - define_BenchmarkStages"
+            stageList = outVal[1]
+
+            for stageName, rowsIn, stageFunction in stageList:
+                secondsList = time_BenchmarkStage(stageName, stageFunction, repeats)
+                recordList.append({'scale': scale, 'stage': stageName, 'rowsIn': rowsIn, 'repeats': repeats, 'bestSeconds': min(secondsList),
+                                   'medianSeconds': float(np.median(secondsList)), 'rowsPerSecond': rowsIn / min(secondsList) if min(secondsList) > 0 else None})
+
+        benchDF = pd.DataFrame(recordList)
+
+        #Scaling exponent of each stage - slope of log(best seconds) on log(scale)
+        if len(scaleList) > 1:
+            exponentDict = {stageName: np.polyfit(np.log(stageDF['scale']), np.log(stageDF['bestSeconds']), 1)[0] for stageName, stageDF in benchDF.groupby('stage')}
+            benchDF['scalingExponent'] = benchDF['stage'].map(exponentDict).round(3)
+
+        #Regression Guard - best time against the baseline benchmark at the same scale and stage
+        regressionDF = pd.DataFrame()
+        if baselineCSV is not None:
+            baselineDF = pd.read_csv(baselineCSV)[['scale', 'stage', 'bestSeconds']].rename(columns={'bestSeconds': 'baselineSeconds'})
+            benchDF = pd.merge(benchDF, baselineDF, how='left', on=['scale', 'stage'])
+            benchDF['baselineRatio'] = (benchDF['bestSeconds'] / benchDF['baselineSeconds']).round(3)
+            regressionDF = benchDF[benchDF['baselineRatio'] > tolerance]
+
+        outPrefix = os.path.join(outputDir, "MangroveMarsh_Benchmark_" + dateString)
+        benchDF.to_csv(outPrefix + ".csv", index=False)
+
+        #Scaling Curves - best seconds by input rows for each stage
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=(8.5, 6.5))
+        ax = figure.add_subplot(1, 1, 1)
+        for stageName, stageDF in benchDF.groupby('stage', sort=False):
+            ax.plot(stageDF['rowsIn'], stageDF['bestSeconds'], marker='o', label=stageName)
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel('Input Records')
+        ax.set_ylabel('Best Time (seconds)')
+        ax.set_title('Mangrove Marsh Benchmark - Scales ' + ', '.join(str(scale) + 'x' for scale in scaleList))
+        ax.legend(fontsize=8)
+        figure.savefig(outPrefix + ".pdf")
+
+        messageTime = timeFun()
+        scriptMsg = "Successfully Exported Benchmark: " + outPrefix + ".csv/.pdf - " + messageTime
+        print(scriptMsg)
+        log_Message(scriptMsg, stage='benchmark_Pipeline')
+        for record in regressionDF.itertuples():
+            scriptMsg = "WARNING Benchmark Regression - " + record.stage + " at " + str(record.scale) + "x - " + str(record.baselineRatio) + " x baseline"
+            print(scriptMsg)
+            log_Message(scriptMsg, logging.WARNING, stage=record.stage, duration=record.bestSeconds)
+
+        if len(regressionDF) > 0:
+            return "Failed function - 'benchmark_Pipeline' - regression against " + baselineCSV
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on benchmark_Pipeline Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'benchmark_Pipeline'"
+
+
+#######################################
+# Command Line Interface
+#######################################
+#Parameters which may be set in a TOML config file ('--config') - keys are the parameter names in the set up section, e.g. confidence = [0.90, 0.95]
+settingNames = ['inDB', 'dataSourceType', 'snapshotDir', 'refreshSnapshot', 'confidence', 'bootstrapCI', 'bootstrapSamples', 'outputDir', 'workspace', 'monitoringYear',
+                'regionList', 'batchYears', 'maxWorkers', 'profileRun', 'benchmarkDataset', 'benchmarkScales', 'benchmarkRepeats', 'benchmarkBaseline', 'benchmarkTolerance',
+                'cacheDir', 'cacheMaxMB', 'buildDir', 'streamingQueries', 'queryChunkSize', 'pushdownAggregation', 'streamingExcel', 'overlappedPipeline', 'pipelineQueueSize',
+                'validateData', 'qaMaxErrors', 'trendAnalysis', 'trendMinYears', 'trendChangePointYears', 'serviceHost', 'servicePort', 'serviceSocket', 'serviceCacheSize',
+                'serviceCheckSeconds', 'logFormat', 'logFlushSeconds']
+
+#Settings applied over the parameter defaults in this run - passed to the batch worker processes
+runSettings = {}
+
+#Apply the config file/command line settings to the parameters and redefine the output and log file names
+def apply_Settings(settings):
+    globals().update(settings)
+    runSettings.update(settings)
+    define_RunNames()
+
+#Read the parameter settings in a TOML config file - tomllib (Python 3.11+) or tomli
+def read_ConfigFile(configFile):
+    try:
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+
+        with open(configFile, 'rb') as configToml:
+            settings = tomllib.load(configToml)
+
+        unknownNames = [name for name in settings if name not in settingNames]
+        if unknownNames:
+            print("WARNING - Config file " + configFile + " - unknown parameters: " + ", ".join(unknownNames))
+            return "Failed function - 'read_ConfigFile'"
+
+        return "success function", settings
+
+    except:
+        messageTime = timeFun()
+        print("Error on read_ConfigFile Function - " + configFile + " - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'read_ConfigFile'"
+
+#Command line argument parser - subcommands 'tables' (workbook), 'figures' (pdf), 'all' (default when no subcommand is given), 'benchmark', 'serve' (Report Service)
+#and 'query' (request a product from the Report Service).
+#Options not given keep the config file/parameter value
+def define_ArgumentParser():
+    import argparse
+
+    commonParser = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    commonParser.add_argument('--config', help="TOML config file of parameter settings - applied before the command line options")
+    commonParser.add_argument('--in-db', dest='inDB', help="Mangrove Marsh database")
+    commonParser.add_argument('--source-type', dest='dataSourceType', choices=['access', 'sqlite', 'duckdb'], help="Data Source Type of the database")
+    commonParser.add_argument('--snapshot-dir', dest='snapshotDir', help="Parquet Snapshot Directory")
+    commonParser.add_argument('--output-dir', dest='outputDir', help="Output Directory")
+    commonParser.add_argument('--workspace', dest='workspace', help="Workspace Folder - log file")
+    commonParser.add_argument('--year', dest='yearList', type=int, nargs='+', help="Monitoring Year(s) - more than one year runs batch mode")
+    commonParser.add_argument('--region', dest='regionList', action='append', help="Region processed - repeat for each region (default every Region in tbl_Locations)")
+    commonParser.add_argument('--confidence', dest='confidence', type=float, action='append', help="Confidence Interval level - repeat for each level")
+    commonParser.add_argument('--workers', dest='maxWorkers', type=int, help="Worker processes for batch mode and page rendering")
+    commonParser.add_argument('--profile', dest='profileRun', action='store_true', help="Profile the run stages - run report exported to the Output Directory")
+    commonParser.add_argument('--trends', dest='trendAnalysis', action='store_true', help="Trend Analysis over all Monitoring Years - sheet 'Trend' and trend pdf")
+    commonParser.add_argument('--host', dest='serviceHost', help="Report Service host")
+    commonParser.add_argument('--port', dest='servicePort', type=int, help="Report Service port")
+    commonParser.add_argument('--socket', dest='serviceSocket', help="Report Service Unix socket - used instead of the host/port")
+
+    parser = argparse.ArgumentParser(description="SFCN Mangrove Marsh Ecotone annual report Tables (SOP8-1, SOP8-2) and Figures (SOP8-3)", parents=[commonParser])
+    subParsers = parser.add_subparsers(dest='command')
+    subParsers.add_parser('tables', parents=[commonParser], help="Workbook with Tables SOP8-1 and SOP8-2")
+    subParsers.add_parser('figures', parents=[commonParser], help="pdf with Figures SOP8-3")
+    subParsers.add_parser('all', parents=[commonParser], help="Tables and Figures (default)")
+    subParsers.add_parser('benchmark', parents=[commonParser], help="Benchmark the report stages on synthetic databases")
+    subParsers.add_parser('serve', parents=[commonParser], help="Report Service - hold the dataset in memory and serve single products over HTTP")
+    queryParser = subParsers.add_parser('query', parents=[commonParser], help="Request a product from a running Report Service (--region/--confidence are request parameters)")
+    queryParser.add_argument('product', choices=list(serviceProducts), help="Product requested")
+    queryParser.add_argument('--location', help="Marker Point (Location Name) of the SOP8-2 cover")
+    queryParser.add_argument('--level', choices=['Segment', 'Location'], help="Trend level")
+    queryParser.add_argument('--response', help="Trend response e.g. Distance")
+    queryParser.add_argument('--format', dest='outFormat', help="Output format - csv, json, xlsx (tables), png, pdf (figures)")
+    queryParser.add_argument('--out', dest='outFile', help="Output file - written to stdout when not given")
+
+    return parser
+
+#Entry Point - apply the config file and command line settings, check the directories/log file and run the selected products. Returns the exit code
+def cli_Main(argv):
+
+    parser = define_ArgumentParser()
+    arguments = vars(parser.parse_args(argv))
+    command = arguments.pop('command', None) or 'all'
+
+    #Request parameters of the 'query' command
+    if command == 'query':
+        product = arguments.pop('product')
+        outFile = arguments.pop('outFile', None)
+        params = {name: arguments.pop(argument, None) for name, argument in (('region', 'regionList'), ('confidence', 'confidence'), ('location', 'location'),
+                  ('level', 'level'), ('response', 'response'), ('format', 'outFormat'))}
+        params = {name: value for name, value in params.items() if value is not None}
+
+    settings = {}
+    if 'config' in arguments:
+        outVal = read_ConfigFile(arguments.pop('config'))
+        if outVal[0].lower() != "success function":
+            print("WARNING - Function read_ConfigFile - Failed - Exiting Script")
+            return 1
+        settings.update(outVal[1])
+
+    yearList = arguments.pop('yearList', None)
+    if yearList is not None:
+        if len(yearList) == 1:
+            settings.update({'monitoringYear': yearList[0], 'batchYears': []})
+        else:
+            settings['batchYears'] = yearList
+    if 'confidence' in arguments and len(arguments['confidence']) == 1:
+        arguments['confidence'] = arguments['confidence'][0]
+    settings.update(arguments)
+    apply_Settings(settings)
+
+    #Report Service client - no output directories or log file
+    if command == 'query':
+        outVal = query_Service(product, params, outFile)
+        return 0 if outVal.lower() == "success function" else 1
+
+    setup_Run()
+
+    try:
+        # Analyses routine ---------------------------------------------------------
+        if command == 'serve':
+            outVal = run_Service()
+            return 0 if outVal.lower() == "success function" else 1
+
+        if command == 'benchmark':
+            outVal = benchmark_Pipeline(benchmarkScales, benchmarkRepeats, benchmarkBaseline, benchmarkTolerance)
+            if outVal.lower() != "success function":
+                print("WARNING - Function benchmark_Pipeline - Failed")
+                return 1
+            return 0
+
+        productList = ('tables', 'figures') if command == 'all' else (command,)
+        #Exit code 1 when the run failed (including QA errors over 'qaMaxErrors')
+        outVal = batch_main(batchYears, productList) if batchYears else main(productList)
+        return 0 if outVal.lower() == "success function" else 1
+
+    finally:
+        #Write the queued log records and close the log file
+        stop_Logging()
+
+if __name__ == '__main__':
+
+    #e.g. python SFCN_MangroveMarsh_Tables_Figures_Script.py tables --year 2019 2020 --region "Shark Slough" --confidence 0.90 --confidence 0.95
+    sys.exit(cli_Main(sys.argv[1:]))
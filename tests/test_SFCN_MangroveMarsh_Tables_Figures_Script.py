@@ -0,0 +1,512 @@
+#Tests of the SFCN Mangrove Marsh Tables and Figures Script - run with 'python -m pytest' from the repository folder.
+#Each test builds a small synthetic sqlite database ('generate_SyntheticDatabase') in a temporary folder
+
+import os
+import sys
+import json
+import sqlite3
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import SFCN_MangroveMarsh_Tables_Figures_Script as mm
+
+
+#Synthetic database with one Region of two Segments over two Monitoring Years - the module settings point at it for the test
+@pytest.fixture
+def syntheticDB(tmp_path, monkeypatch):
+
+    inDB = str(tmp_path / "mm.sqlite")
+    outVal = mm.generate_SyntheticDatabase(inDB, regionCount=1, segmentsPerRegion=2, pointsPerSegment=3, yearList=[2019, 2020], speciesCount=10)
+    assert outVal[0] == "success function"
+    monkeypatch.setattr(mm, 'inDB', inDB)
+    monkeypatch.setattr(mm, 'dataSourceType', 'sqlite')
+
+    yield inDB
+    mm.close_DataSource()
+
+#Synthetic database of 'datasetConfig' (see 'generate_SyntheticDatabase') in 'tmp_path' - the module settings point at it for the test
+def open_SyntheticDatabase(tmp_path, monkeypatch, **datasetConfig):
+
+    inDB = str(tmp_path / "mm.sqlite")
+    assert mm.generate_SyntheticDatabase(inDB, **datasetConfig)[0] == "success function"
+    monkeypatch.setattr(mm, 'inDB', inDB)
+    monkeypatch.setattr(mm, 'dataSourceType', 'sqlite')
+
+    return inDB
+
+#Event Group of a Vegetation record in the synthetic database
+def vegetation_EventGroup(cnxn, vegetationID):
+
+    return cnxn.execute("SELECT tbl_Events.Event_Group_ID FROM tbl_MarkerData_Vegetation INNER JOIN tbl_MarkerData ON tbl_MarkerData_Vegetation.Point_ID = tbl_MarkerData.Point_ID"
+                        " INNER JOIN tbl_Events ON tbl_MarkerData.Event_ID = tbl_Events.Event_ID WHERE Vegetation_ID = ?;", (vegetationID,)).fetchone()[0]
+
+
+#A correction to a text field only (SpeciesCode of the same length, CommunityType) re-pulls its Event Group into the snapshot. The checksums are calculated
+#in the database - one row per Event Group is transferred
+def test_refresh_Snapshot_TextFieldChange(syntheticDB, tmp_path, monkeypatch):
+
+    snapshotDir = str(tmp_path / "snapshot")
+    assert mm.refresh_Snapshot(snapshotDir)[0] == "success function"
+
+    checksumRows = []
+    query_DataSource = mm.query_DataSource
+    def record_Query(query, inDB):
+        outVal = query_DataSource(query, inDB)
+        if "GROUP BY" in query:
+            checksumRows.append(len(outVal[1]))
+        return outVal
+    monkeypatch.setattr(mm, 'query_DataSource', record_Query)
+    assert mm.refresh_Snapshot(snapshotDir) == ("success function", [])
+    assert checksumRows == [2, 2, 2]
+
+    with sqlite3.connect(syntheticDB) as cnxn:
+        vegetationID, speciesCode = cnxn.execute("SELECT Vegetation_ID, SpeciesCode FROM tbl_MarkerData_Vegetation ORDER BY Vegetation_ID LIMIT 1;").fetchone()
+        newCode = cnxn.execute("SELECT SpeciesCode FROM tlu_Vegetation WHERE SpeciesCode <> ? LIMIT 1;", (speciesCode,)).fetchone()[0]
+        cnxn.execute("UPDATE tbl_MarkerData_Vegetation SET SpeciesCode = ? WHERE Vegetation_ID = ?;", (newCode, vegetationID))
+        eventGroup = vegetation_EventGroup(cnxn, vegetationID)
+
+    assert mm.refresh_Snapshot(snapshotDir) == ("success function", [eventGroup])
+    snapDF = pd.read_parquet(mm.snapshotFile(snapshotDir, 'tbl_MarkerData_Vegetation'))
+    assert snapDF.loc[snapDF['Vegetation_ID'] == vegetationID, 'SpeciesCode'].item() == newCode
+
+    with sqlite3.connect(syntheticDB) as cnxn:
+        vegetationID = cnxn.execute("SELECT Max(Vegetation_ID) FROM tbl_MarkerData_Vegetation;").fetchone()[0]
+        cnxn.execute("UPDATE tbl_MarkerData_Vegetation SET CommunityType = 'Corrected' WHERE Vegetation_ID = ?;", (vegetationID,))
+        eventGroup = vegetation_EventGroup(cnxn, vegetationID)
+
+    assert mm.refresh_Snapshot(snapshotDir) == ("success function", [eventGroup])
+
+
+#Vegetation and Marker Visit QA Rules are checked when the tables are read in chunks (streaming / pushdown) as when the Marker Visit Dataset is loaded
+def test_run_Validation_StreamedTables(syntheticDB, tmp_path, monkeypatch):
+
+    with sqlite3.connect(syntheticDB) as cnxn:
+        cnxn.execute("UPDATE tbl_MarkerData_Vegetation SET PercentCover = 150 WHERE Vegetation_ID = 1;")
+        cnxn.execute("UPDATE tbl_MarkerData_Vegetation SET CommunityType = 'Unknown' WHERE Vegetation_ID = 2;")
+        cnxn.execute("UPDATE tbl_MarkerData_Vegetation SET SpeciesCode = 'NOTINTLU' WHERE Vegetation_ID = 3;")
+        cnxn.execute("UPDATE tbl_MarkerData SET Distance = NULL WHERE Point_ID = 1;")
+    monkeypatch.setattr(mm, 'qaMaxErrors', None)
+    monkeypatch.setattr(mm, 'queryChunkSize', 5)
+
+    outVal = mm.defineRecords_MarkerVisitDataset(True)
+    assert outVal[0] == "success function"
+    loadedDF = mm.run_Validation(outVal[1], str(tmp_path / "loaded"))[1]
+    streamedDF = mm.run_Validation(mm.define_ValidationDataset(None, False), str(tmp_path / "streamed"))[1]
+
+    assert set(loadedDF['Rule']) == {'Distance is null', 'Percent Cover outside 0-100', 'Absolute Cover -999 - Community/Vegetation Type not matched',
+                                     'Scientific Name is null - Species Code not in tlu_Vegetation'}
+    sortFields = ['Table', 'Rule', 'Point_ID', 'Value']
+    assert loadedDF.astype(str).sort_values(sortFields).reset_index(drop=True).equals(streamedDF.astype(str).sort_values(sortFields).reset_index(drop=True))
+
+
+#Streamed SOP8-1 and SOP8-2 of a query without records are empty tables with the columns of the non streaming path
+def test_stream_ZeroRows(syntheticDB):
+
+    with sqlite3.connect(syntheticDB) as cnxn:
+        cnxn.execute("UPDATE tbl_Events SET Event_Type = 'Other';")
+    outVal = mm.define_PartitionIndex()
+    assert outVal[0] == "success function"
+    regionList = list(outVal[1])
+
+    markerDataset = mm.defineRecords_MarkerVisitDataset(True)[1]
+    outDF_8pt1 = mm.SummarizeFigure8_1(mm.defineRecords_MarkerData(markerDataset)[1])[1]
+    regionTables = mm.defineRecords_VegCoverByPointAbsolute(markerDataset, regionList)[1]
+
+    outVal = mm.stream_SummarizeFigure8_1()
+    assert outVal[0] == "success function"
+    assert len(outVal[1]) == 0 and list(outVal[1].columns) == list(outDF_8pt1.columns)
+
+    outVal = mm.stream_VegCoverByPointAbsolute(regionList)
+    assert outVal[0] == "success function"
+    for region in regionList:
+        assert len(outVal[1][region]) == 0 and list(outVal[1][region].columns) == list(regionTables[region].columns)
+
+
+#SOP8-2 Absolute Cover of the Access TRANSFORM query of the original script - the nested IIf as a CASE (Overall x Stratum/100 x Percent Cover/100, -999 when the
+#Community/Vegetation Type is not matched) summed by Taxon and Location Name in sqlite. '/ 100.0' as Access division is floating point
+baselineAbsCoverQuery = "SELECT tbl_Locations.Region, tbl_MarkerData_Vegetation.CommunityType, tbl_MarkerData_Vegetation.VegetationType, tlu_Vegetation.ScientificName, tbl_Locations.Location_Name,"\
+    " Sum(CASE WHEN VegetationType = 'Tree' AND CommunityType = 'Mangrove' THEN MangroveSide_Cover_Overall * (MangroveSide_Cover_Tree / 100.0) * (PercentCover / 100.0)"\
+    " WHEN VegetationType = 'Shrub' AND CommunityType = 'Mangrove' THEN MangroveSide_Cover_Overall * (MangroveSide_Cover_Shrub / 100.0) * (PercentCover / 100.0)"\
+    " WHEN VegetationType = 'Herb' AND CommunityType = 'Mangrove' THEN MangroveSide_Cover_Overall * (MangroveSide_Cover_Herb / 100.0) * (PercentCover / 100.0)"\
+    " WHEN VegetationType = 'Tree' AND CommunityType = 'Marsh' THEN MarshSide_Cover_Overall * (MarshSide_Cover_Tree / 100.0) * (PercentCover / 100.0)"\
+    " WHEN VegetationType = 'Shrub' AND CommunityType = 'Marsh' THEN MarshSide_Cover_Overall * (MarshSide_Cover_Shrub / 100.0) * (PercentCover / 100.0)"\
+    " WHEN VegetationType = 'Herb' AND CommunityType = 'Marsh' THEN MarshSide_Cover_Overall * (MarshSide_Cover_Herb / 100.0) * (PercentCover / 100.0) ELSE -999 END) AS AbsolutePercCover"\
+    " FROM tbl_Locations INNER JOIN tbl_Events ON tbl_Locations.Location_ID = tbl_Events.Location_ID INNER JOIN tbl_MarkerData ON tbl_Events.Event_ID = tbl_MarkerData.Event_ID"\
+    " INNER JOIN tbl_MarkerData_Vegetation ON tbl_MarkerData.Point_ID = tbl_MarkerData_Vegetation.Point_ID LEFT JOIN tlu_Vegetation ON tbl_MarkerData_Vegetation.SpeciesCode = tlu_Vegetation.SpeciesCode"\
+    " WHERE tbl_MarkerData_Vegetation.PercentCover IS NOT NULL AND tbl_Events.Event_Type = 'Marker Visit' AND tbl_Locations.Region = ?"\
+    " GROUP BY tbl_Locations.Region, CommunityType, VegetationType, ScientificName, Location_Name ORDER BY CommunityType, VegetationType, ScientificName;"
+
+#PIVOT of the baseline totals on Location Name - a row per Taxon in ORDER BY order (nulls first), the Location Names of the Region as sorted columns, null without records
+def baseline_RegionTable(cnxn, region):
+
+    keyFields = ['Region', 'CommunityType', 'VegetationType', 'ScientificName']
+    longDF = pd.read_sql_query(baselineAbsCoverQuery, cnxn, params=(region,))
+    taxaDF = longDF[keyFields].drop_duplicates().reset_index(drop=True)
+    locationNames = sorted(longDF['Location_Name'].unique())
+
+    cellDict = {(tuple(record[:4]), record[4]): record[5] for record in longDF.itertuples(index=False)}
+    coverArray = np.array([[cellDict.get((taxon, locationName), np.nan) for locationName in locationNames] for taxon in taxaDF.itertuples(index=False, name=None)], dtype='float64')
+
+    return pd.concat([taxaDF, pd.DataFrame(coverArray, columns=locationNames)], axis=1)
+
+
+#The vectorized SOP8-2 crosstab (in memory and streamed) is the TRANSFORM crosstab of the original script - -999 for an unmatched Community/Vegetation Type (summed per cell),
+#null Scientific Name for a Species Code not in tlu_Vegetation, null cover for a null Stratum Cover, null Percent Cover records and other Event Types excluded
+def test_VegCoverByPointAbsolute_TransformBaseline(tmp_path, monkeypatch):
+
+    inDB = open_SyntheticDatabase(tmp_path, monkeypatch, regionCount=2, segmentsPerRegion=2, pointsPerSegment=3, yearList=[2020], speciesCount=12)
+    monkeypatch.setattr(mm, 'queryChunkSize', 25)
+
+    with sqlite3.connect(inDB) as cnxn:
+        cnxn.execute("UPDATE tbl_MarkerData_Vegetation SET CommunityType = 'Unknown', PercentCover = 10 WHERE Vegetation_ID = 1;")
+        cnxn.execute("UPDATE tbl_MarkerData_Vegetation SET VegetationType = 'Vine', SpeciesCode = 'SP0001', PercentCover = 5 WHERE Vegetation_ID IN (2, 3);")
+        cnxn.execute("UPDATE tbl_MarkerData_Vegetation SET SpeciesCode = 'NOTINTLU', PercentCover = 25 WHERE Vegetation_ID IN (4, 16);")
+        cnxn.execute("UPDATE tbl_MarkerData_Vegetation SET PercentCover = 50 WHERE Vegetation_ID IN (5, 6);")
+        cnxn.execute("UPDATE tbl_MarkerData SET MangroveSide_Cover_Herb = NULL WHERE Point_ID = 1;")
+        cnxn.execute("UPDATE tbl_Events SET Event_Type = 'Other' WHERE Event_ID = 3;")
+        cnxn.commit()
+        regionList = [region for (region,) in cnxn.execute("SELECT DISTINCT Region FROM tbl_Locations ORDER BY Location_ID;")]
+        baselineTables = {region: baseline_RegionTable(cnxn, region) for region in regionList}
+
+    try:
+        markerDataset = mm.defineRecords_MarkerVisitDataset(True)[1]
+        outVal = mm.defineRecords_VegCoverByPointAbsolute(markerDataset, regionList)
+        assert outVal[0] == "success function"
+        streamVal = mm.stream_VegCoverByPointAbsolute(regionList)
+        assert streamVal[0] == "success function"
+    finally:
+        mm.close_DataSource()
+
+    firstRegion = baselineTables[regionList[0]]
+    assert (firstRegion.iloc[:, 4:] == -999).any().any() and (firstRegion.iloc[:, 4:] == -1998).any().any()
+    assert firstRegion['ScientificName'].isna().any() and firstRegion.iloc[:, 4:].isna().any().any()
+    for region in regionList:
+        for regionDF in (outVal[1][region], streamVal[1][region]):
+            pd.testing.assert_frame_equal(regionDF.reset_index(drop=True), baselineTables[region], check_dtype=False)
+
+
+#SOP8-1 of the original script - mean by Event Group/Region/Segment, Standard Error, Count, Min and Max by Event Group/Segment joined in turn, a t.ppf call per row
+#for the Confidence Interval (Mean -/+ Standard Error * t_crit / sqrt(n)), sorted on the Segment number. The Excel export is left out
+def baseline_SummarizeFigure8_1(inDF, confidence):
+
+    from scipy.stats import t
+    inDF = inDF.astype({'Region': str, 'Segment': str})
+    outDF = inDF.groupby(['Event_Group_ID', 'Region', 'Segment'])['Distance'].mean().reset_index().rename(columns={'Distance': 'AverageDist_M'})
+    for field, aggName in (('StandardError', 'sem'), ('RecCount', 'count')):
+        aggDF = inDF.groupby(['Event_Group_ID', 'Segment'])['Distance'].agg(aggName).reset_index().rename(columns={'Distance': field})
+        outDF = pd.merge(outDF, aggDF, how='inner', on=['Event_Group_ID', 'Segment'])
+    outDF['DOF'] = outDF['RecCount'] - 1
+
+    outDF['t_crit'] = outDF.apply(lambda x: np.abs(t.ppf((1 - confidence) / 2, x['DOF'])), axis=1)
+    outDF['LowerCI_' + str(confidence)] = outDF['AverageDist_M'] - outDF['StandardError'] * outDF['t_crit'] / np.sqrt(outDF['RecCount'])
+    outDF['UpperCI_' + str(confidence)] = outDF['AverageDist_M'] + outDF['StandardError'] * outDF['t_crit'] / np.sqrt(outDF['RecCount'])
+
+    for field, aggName in (('MinDifference', 'min'), ('MaxDifference', 'max')):
+        aggDF = inDF.groupby(['Event_Group_ID', 'Segment'])['Distance'].agg(aggName).reset_index().rename(columns={'Distance': field})
+        outDF = pd.merge(outDF, aggDF, how='inner', on=['Event_Group_ID', 'Segment'])
+
+    outDF['SortField'] = pd.to_numeric(outDF['Segment'].str.replace('Segment_', ''), errors='coerce', downcast='integer')
+    outDF.sort_values(by=['SortField'], inplace=True)
+    outDF.set_index('SortField', inplace=True)
+
+    return outDF.drop(columns=['DOF', 't_crit'])
+
+
+#The single pass named aggregation SOP8-1 is the SOP8-1 of the original script - includes a Segment with one Distance (null Standard Error and Confidence Interval),
+#null Distances (not counted) and Segment numbers past 9 (numeric sort)
+def test_SummarizeFigure8_1_Baseline(tmp_path, monkeypatch):
+
+    inDB = open_SyntheticDatabase(tmp_path, monkeypatch, regionCount=2, segmentsPerRegion=6, pointsPerSegment=4, yearList=[2019, 2020], speciesCount=10)
+    with sqlite3.connect(inDB) as cnxn:
+        cnxn.execute("UPDATE tbl_MarkerData SET Distance = NULL WHERE Point_ID IN (1, 2, 3, 50);")
+    monkeypatch.setattr(mm, 'bootstrapCI', False)
+
+    try:
+        markerDF = mm.defineRecords_MarkerData(mm.defineRecords_MarkerVisitDataset(False)[1])[1]
+    finally:
+        mm.close_DataSource()
+    outVal = mm.SummarizeFigure8_1(markerDF)
+    assert outVal[0] == "success function"
+
+    baselineDF = baseline_SummarizeFigure8_1(markerDF, mm.confidence)
+    assert baselineDF['StandardError'].isna().sum() == 1 and baselineDF.index.max() == 12
+
+    #Rows of the same Segment (one per Event Group) are in arbitrary order in the baseline sort
+    sortFields = ['SortField', 'Event_Group_ID']
+    outDF = outVal[1].astype({'Region': str, 'Segment': str}).reset_index().sort_values(by=sortFields).reset_index(drop=True)
+    baselineDF = baselineDF.reset_index().sort_values(by=sortFields).reset_index(drop=True)
+    assert list(outVal[1].columns) == list(baselineDF.columns.drop('SortField'))
+    assert outVal[1].index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(outDF, baselineDF, check_dtype=False)
+
+
+#Student T critical values are the per row t.ppf values of the original script - t.ppf is called once per confidence level for the DOF values not yet cached, a null DOF
+#gives a null value. calc_CI adds the Lower/Upper CI fields of each level of a confidence list
+def test_defineStudentT_Cache(monkeypatch):
+
+    from scipy.stats import t
+    ppfCalls = []
+    studentT_ppf = t.ppf
+    def record_ppf(q, dof):
+        ppfCalls.append(list(dof))
+        return studentT_ppf(q, dof)
+    monkeypatch.setattr(t, 'ppf', record_ppf)
+    monkeypatch.setattr(mm, 'studentTCache', {})
+
+    dofArray = np.array([4, 9, 4, 0, np.nan, 9, 29, 4], dtype='float64')
+    baselineT = np.array([np.abs(studentT_ppf((1 - 0.95) / 2, dof)) for dof in dofArray])
+    np.testing.assert_allclose(mm.defineStudentT(dofArray, 0.95), baselineT, equal_nan=True)
+    assert ppfCalls == [[0, 4, 9, 29]]
+
+    np.testing.assert_allclose(mm.defineStudentT(dofArray[::-1], 0.95), baselineT[::-1], equal_nan=True)
+    assert mm.defineStudentT(9, 0.95) == baselineT[1]
+    assert ppfCalls == [[0, 4, 9, 29]]
+
+    confidenceList = [0.90, 0.95, 0.99]
+    ciDF = pd.DataFrame({'AverageDist_M': [1.5, -0.25, 2.0, 0.75], 'StandardError': [0.4, 1.1, np.nan, 0.2], 'RecCount': [5, 10, 1, 30]})
+    ciDF['DOF'] = ciDF['RecCount'] - 1
+    outVal = mm.calc_CI(ciDF.copy(), confidenceList)
+    assert outVal[0] == "success function"
+    assert len(ppfCalls) == 3
+    for confidenceLevel in confidenceList:
+        marginCI = ciDF['StandardError'] * ciDF['DOF'].apply(lambda dof: np.abs(studentT_ppf((1 - confidenceLevel) / 2, dof))) / np.sqrt(ciDF['RecCount'])
+        np.testing.assert_allclose(outVal[1]['LowerCI_' + str(confidenceLevel)], ciDF['AverageDist_M'] - marginCI, equal_nan=True)
+        np.testing.assert_allclose(outVal[1]['UpperCI_' + str(confidenceLevel)], ciDF['AverageDist_M'] + marginCI, equal_nan=True)
+
+
+#Result Cache - a repeated Marker Visit Dataset pull is served from the cache until the database changes, SOP8-1 is recomputed for a new 'confidence' only
+#and the stored SOP8-1 of the earlier confidence is served again
+def test_ResultCache_HitMiss(syntheticDB, tmp_path, monkeypatch):
+
+    monkeypatch.setattr(mm, 'cacheDir', str(tmp_path / "cache"))
+    stageCalls = {'query_DataSource': 0, 'calc_CI': 0}
+    def record_Stage(stageName):
+        stageFunction = getattr(mm, stageName)
+        def record_Call(*args):
+            stageCalls[stageName] += 1
+            return stageFunction(*args)
+        monkeypatch.setattr(mm, stageName, record_Call)
+    record_Stage('query_DataSource')
+    record_Stage('calc_CI')
+
+    markerDataset = mm.defineRecords_MarkerVisitDataset(True)[1]
+    mm.close_DataSource()
+    queryCount = stageCalls['query_DataSource']
+    assert queryCount > 0
+    cachedDataset = mm.defineRecords_MarkerVisitDataset(True)[1]
+    mm.close_DataSource()
+    assert stageCalls['query_DataSource'] == queryCount
+    pd.testing.assert_frame_equal(cachedDataset['vegetation'], markerDataset['vegetation'])
+
+    markerDF = mm.defineRecords_MarkerData(markerDataset)[1]
+    outDF_95 = mm.SummarizeFigure8_1(markerDF)[1]
+    assert mm.SummarizeFigure8_1(markerDF)[1].equals(outDF_95) and stageCalls['calc_CI'] == 1
+
+    monkeypatch.setattr(mm, 'confidence', 0.90)
+    outDF_90 = mm.SummarizeFigure8_1(markerDF)[1]
+    assert stageCalls['calc_CI'] == 2
+    assert 'LowerCI_0.9' in outDF_90 and 'LowerCI_0.95' not in outDF_90
+
+    monkeypatch.setattr(mm, 'confidence', 0.95)
+    assert mm.SummarizeFigure8_1(markerDF)[1].equals(outDF_95) and stageCalls['calc_CI'] == 2
+
+    #A change to the database is a new Data Source fingerprint - the dataset is queried again
+    with sqlite3.connect(syntheticDB) as cnxn:
+        cnxn.execute("UPDATE tbl_MarkerData SET Distance = Distance + 1 WHERE Point_ID = 1;")
+    os.utime(syntheticDB, ns=(os.stat(syntheticDB).st_atime_ns, os.stat(syntheticDB).st_mtime_ns + 1000000000))
+    changedDataset = mm.defineRecords_MarkerVisitDataset(True)[1]
+    assert stageCalls['query_DataSource'] == 2 * queryCount
+    assert changedDataset['markerVisits'].loc[1, 'Distance'] == markerDataset['markerVisits'].loc[1, 'Distance'] + 1
+
+
+#SOP8-1 from the aggregates calculated in the database (pushdown) and from the running aggregates of the streamed query chunks is the SOP8-1 of the marker records,
+#the SOP8-3 Stratum Cover calculated in the database is the Stratum Cover of the Marker Visit Dataset - null Distance and Stratum Cover included
+def test_AggregationPushdown_RawPull(tmp_path, monkeypatch):
+
+    inDB = open_SyntheticDatabase(tmp_path, monkeypatch, regionCount=2, segmentsPerRegion=3, pointsPerSegment=4, yearList=[2019, 2020], speciesCount=10)
+    with sqlite3.connect(inDB) as cnxn:
+        cnxn.execute("UPDATE tbl_MarkerData SET Distance = NULL WHERE Point_ID IN (1, 2, 3, 30);")
+        cnxn.execute("UPDATE tbl_MarkerData SET MarshSide_Cover_Shrub = NULL WHERE Point_ID = 5;")
+    monkeypatch.setattr(mm, 'queryChunkSize', 7)
+    monkeypatch.setattr(mm, 'bootstrapCI', False)
+
+    try:
+        markerDataset = mm.defineRecords_MarkerVisitDataset(False)[1]
+        rawDF_8pt1 = mm.SummarizeFigure8_1(mm.defineRecords_MarkerData(markerDataset)[1])[1]
+        rawStratumDF = mm.defineRecords_CoverByStratum(markerDataset)[1]
+        outVal_8pt1 = {'pushdown': mm.aggregate_Figure8_1(), 'streamed': mm.stream_SummarizeFigure8_1()}
+        stratumVal = mm.aggregate_CoverByStratum()
+    finally:
+        mm.close_DataSource()
+
+    sortFields = ['Event_Group_ID', 'Segment']
+    rawDF_8pt1 = rawDF_8pt1.astype({'Region': str, 'Segment': str}).sort_values(by=sortFields).reset_index(drop=True)
+    for outVal in outVal_8pt1.values():
+        assert outVal[0] == "success function"
+        assert list(outVal[1].columns) == list(rawDF_8pt1.columns)
+        outDF = outVal[1].astype({'Region': str, 'Segment': str}).sort_values(by=sortFields).reset_index(drop=True)
+        pd.testing.assert_frame_equal(outDF, rawDF_8pt1, check_dtype=False)
+
+    assert stratumVal[0] == "success function"
+    assert rawStratumDF['AbsCover_Marsh_Shrub'].isna().sum() == 1
+    pd.testing.assert_frame_equal(stratumVal[1].astype({'Region': str, 'Location_Name': str}), rawStratumDF.astype({'Region': str, 'Location_Name': str}), check_dtype=False)
+
+
+#Run 'pythonCode' in a new interpreter from 'cwd' with the script module imported as 'mm' - prints the JSON of the value 'result'
+def run_ScriptProcess(pythonCode, cwd):
+
+    processCode = "import sys, json\nsys.path.insert(0, " + repr(os.path.dirname(os.path.abspath(mm.__file__))) + ")\nimport SFCN_MangroveMarsh_Tables_Figures_Script as mm\n" +\
+                  pythonCode + "\nprint(json.dumps(result))"
+    completed = subprocess.run([sys.executable, "-c", processCode], cwd=cwd, capture_output=True, text=True, timeout=300)
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+#Importing the script has no side effects (directories, log file) and does not load matplotlib, scipy or pyodbc. A 'tables' run from a TOML config and
+#command line options writes the workbook without loading matplotlib - the config confidence list and '--year' are applied
+def test_cli_Main_LazyImports(syntheticDB, tmp_path):
+
+    importDir = tmp_path / "import"
+    importDir.mkdir()
+    heavyModules = ['matplotlib', 'scipy', 'pyodbc']
+    result = run_ScriptProcess("result = [name for name in " + repr(heavyModules) + " if name in sys.modules]", str(importDir))
+    assert result == [] and os.listdir(str(importDir)) == []
+
+    outputDir = tmp_path / "output"
+    configFile = tmp_path / "run.toml"
+    configFile.write_text("inDB = " + json.dumps(syntheticDB) + "\ndataSourceType = 'sqlite'\nconfidence = [0.90, 0.95]\nworkspace = " + json.dumps(str(tmp_path / "workspace")) + "\n")
+    result = run_ScriptProcess("exitCode = mm.cli_Main(['tables', '--config', " + repr(str(configFile)) + ", '--output-dir', " + repr(str(outputDir)) + ", '--year', '2019'])\n"
+                               "result = [exitCode, mm.monitoringYear, 'matplotlib' in sys.modules]", str(importDir))
+    assert result == [0, 2019, False]
+
+    outList = os.listdir(str(outputDir))
+    outXLSX = [fileName for fileName in outList if fileName.startswith("MangroveMarsh_Export_")]
+    assert len(outXLSX) == 1 and not any(fileName.endswith(".pdf") for fileName in outList)
+    outDF_8pt1 = pd.read_excel(str(outputDir / outXLSX[0]), sheet_name='SOP8-1')
+    assert {'LowerCI_0.9', 'UpperCI_0.9', 'LowerCI_0.95', 'UpperCI_0.95'} <= set(outDF_8pt1.columns)
+    assert set(outDF_8pt1['Event_Group_ID']) == {1}
+
+
+#Line fit of one group - slope, Standard Error of the slope and the error sum of squares (scipy linregress)
+def baseline_LineFit(xArray, yArray):
+
+    from scipy.stats import linregress
+    lineFit = linregress(xArray, yArray)
+    sse = float(np.sum((yArray - lineFit.intercept - lineFit.slope * xArray) ** 2))
+
+    return lineFit.slope, lineFit.stderr, sse
+
+#Trend of one group fitted from its records - slope, Standard Error and slope CI (t.ppf, N - 2 DOF) when there are 'trendMinYears' years, and the Chow F change point
+#of largest F over the splits leaving 'trendChangePointYears' years on each side (Bonferroni adjusted p value)
+def baseline_GroupTrend(recordDF, confidence):
+
+    from scipy.stats import t, f
+    recordDF = recordDF.dropna(subset=['y'])
+    xArray, yArray = recordDF['x'].to_numpy(), recordDF['y'].to_numpy()
+    yearList = sorted(recordDF['Year'].unique())
+    trend = {'Years': len(yearList), 'N': len(recordDF), 'Slope_PerYear': np.nan, 'StandardError': np.nan, 'ChangePoint_Year': None}
+    if len(yearList) < mm.trendMinYears or len(recordDF) <= 2:
+        return trend
+
+    trend['Slope_PerYear'], trend['StandardError'], sseGroup = baseline_LineFit(xArray, yArray)
+    tCrit = np.abs(t.ppf((1 - confidence) / 2, len(recordDF) - 2))
+    trend['SlopeLowerCI'] = trend['Slope_PerYear'] - trend['StandardError'] * tCrit
+    trend['SlopeUpperCI'] = trend['Slope_PerYear'] + trend['StandardError'] * tCrit
+
+    splitList = []
+    for split in range(mm.trendChangePointYears, len(yearList) - mm.trendChangePointYears + 1):
+        before = recordDF['Year'].to_numpy() < yearList[split]
+        sseSides = baseline_LineFit(xArray[before], yArray[before])[2] + baseline_LineFit(xArray[~before], yArray[~before])[2]
+        splitList.append((max(sseGroup - sseSides, 0) / 2 / (sseSides / (len(recordDF) - 4)), yearList[split]))
+    if splitList:
+        changeF, trend['ChangePoint_Year'] = max(splitList)
+        trend['ChangePoint_P'] = min(f.sf(changeF, 2, len(recordDF) - 4) * len(splitList), 1.0)
+
+    return trend
+
+
+#Trends fitted from the Monitoring Year sums in arrays are the per group least squares fits of the records, by Segment and by Location - a Location with a step in
+#Distance is flagged as a change point at the step year, a Location with too few years with a Distance is not fitted
+def test_define_Trends_GroupFits(tmp_path, monkeypatch):
+
+    yearList = list(range(2011, 2021))
+    inDB = open_SyntheticDatabase(tmp_path, monkeypatch, regionCount=1, segmentsPerRegion=2, pointsPerSegment=3, yearList=yearList, speciesCount=10)
+    with sqlite3.connect(inDB) as cnxn:
+        cnxn.execute("UPDATE tbl_MarkerData SET Distance = CASE WHEN Event_ID > 24 THEN 8 ELSE 0 END + (Event_ID % 5) * 0.1 WHERE (Event_ID - 1) % 6 = 0;")
+        cnxn.execute("UPDATE tbl_MarkerData SET Distance = NULL WHERE (Event_ID - 2) % 6 = 0 AND Event_ID > 12;")
+    monkeypatch.setattr(mm, 'confidence', 0.95)
+
+    try:
+        markerDF = mm.defineRecords_MarkerVisitDataset(False)[1]['markerVisits']
+    finally:
+        mm.close_DataSource()
+    outVal = mm.define_Trends(markerDF)
+    assert outVal[0] == "success function"
+    trendDF = outVal[1]['trends'].set_index(['Level', 'Segment', 'Location_Name', 'Response'])
+
+    recordDF = markerDF.reset_index().astype({'Segment': str, 'Location_Name': str})
+    recordDF['x'] = recordDF['Start_Date'].dt.year + (recordDF['Start_Date'].dt.dayofyear - 1) / (365.0 + recordDF['Start_Date'].dt.is_leap_year)
+    recordDF['y'] = recordDF['Distance']
+    for response in ('Distance', 'AbsCover_Marsh_Herb'):
+        if response != 'Distance':
+            recordDF['y'] = recordDF['MarshSide_Cover_Overall'] * (recordDF['MarshSide_Cover_Herb'] / 100)
+        groupList = [('Segment', segment, '', segmentDF) for segment, segmentDF in recordDF.groupby('Segment')] +\
+                    [('Location', segment, locationName, locationDF) for (segment, locationName), locationDF in recordDF.groupby(['Segment', 'Location_Name'])]
+        for level, segment, locationName, groupDF in groupList:
+            baselineTrend = baseline_GroupTrend(groupDF, 0.95)
+            trendRow = trendDF.loc[(level, segment, locationName, response)]
+            assert (trendRow['Years'], trendRow['N']) == (baselineTrend['Years'], baselineTrend['N'])
+            if np.isnan(baselineTrend['Slope_PerYear']):
+                assert np.isnan(trendRow['Slope_PerYear']) and trendRow['Trend'] == 'Too Few Years'
+                continue
+            for field, trendField in (('Slope_PerYear', 'Slope_PerYear'), ('StandardError', 'StandardError'), ('SlopeLowerCI', 'SlopeLowerCI_0.95'), ('SlopeUpperCI', 'SlopeUpperCI_0.95')):
+                assert trendRow[trendField] == pytest.approx(baselineTrend[field], rel=1e-6, abs=1e-9)
+            assert trendRow['ChangePoint_Year'] == baselineTrend['ChangePoint_Year']
+            assert trendRow['ChangePoint_P'] == pytest.approx(baselineTrend['ChangePoint_P'], rel=1e-6, abs=1e-12)
+
+    assert trendDF.loc[('Location', 'Segment_1', 'S001_P001', 'Distance'), ['ChangePoint', 'ChangePoint_Year']].tolist() == [True, 2015]
+    assert trendDF.loc[('Location', 'Segment_1', 'S001_P002', 'Distance'), 'Trend'] == 'Too Few Years'
+
+
+#Overlapped pipeline - the workbook is only written when the table stages succeed, a failed SOP8-2 stage leaves no workbook (or temporary workbook) behind
+def test_run_OverlappedPipeline_FailedStage(syntheticDB, tmp_path, monkeypatch):
+
+    import asyncio
+    monkeypatch.setattr(mm, 'streamingQueries', True)
+    monkeypatch.setattr(mm, 'validateData', False)
+    regionList = list(mm.define_PartitionIndex()[1])
+    outPrefix = str(tmp_path / "MangroveMarsh")
+
+    outVal = asyncio.run(mm.run_OverlappedPipeline(('tables',), outPrefix + ".xlsx", outPrefix + ".pdf", outPrefix + "_QA", outPrefix + "_Trend.pdf", regionList))
+    assert outVal == "success function"
+    assert sorted(os.listdir(str(tmp_path))) == ["MangroveMarsh.xlsx", "mm.sqlite"]
+    assert list(pd.read_excel(outPrefix + ".xlsx", sheet_name=None)) == ['SOP8-1'] + ['SOP8-2-AbsCov-' + region for region in regionList]
+
+    os.remove(outPrefix + ".xlsx")
+    monkeypatch.setattr(mm, 'stream_VegCoverByPointAbsolute', lambda regionList: "Failed function - 'stream_VegCoverByPointAbsolute'")
+    outVal = asyncio.run(mm.run_OverlappedPipeline(('tables',), outPrefix + ".xlsx", outPrefix + ".pdf", outPrefix + "_QA", outPrefix + "_Trend.pdf", regionList))
+    assert outVal == "Failed function - 'run_OverlappedPipeline'"
+    assert os.listdir(str(tmp_path)) == ["mm.sqlite"]
+
+
+#Region names too long for an Excel sheet name (31 characters) or matching another Region's once truncated/ignoring case get unique SOP8-2 sheet names -
+#in the single writer export and the overlapped pipeline
+@pytest.mark.parametrize('overlappedPipeline', [False, True])
+def test_main_RegionSheetNames(tmp_path, monkeypatch, overlappedPipeline):
+
+    regionList = ['Ten Thousand Islands North', 'Ten Thousand Islands Northeast', 'Shark Slough', 'SHARK SLOUGH']
+    monkeypatch.setattr(mm, 'regionList', regionList)
+    open_SyntheticDatabase(tmp_path, monkeypatch, regionCount=4, segmentsPerRegion=1, pointsPerSegment=3, yearList=[2020], speciesCount=10)
+    for name, value in (('outputDir', str(tmp_path / "output")), ('workspace', str(tmp_path / "workspace")), ('monitoringYear', 2020), ('overlappedPipeline', overlappedPipeline)):
+        monkeypatch.setattr(mm, name, value)
+    os.makedirs(mm.outputDir)
+
+    assert mm.main(('tables',)) == "success function"
+    outXLSX = os.path.join(mm.outputDir, "MangroveMarsh_Export_" + mm.dateString + ".xlsx")
+    sheetNames = list(pd.read_excel(outXLSX, sheet_name=None))
+    assert sheetNames == ['SOP8-1', 'SOP8-2-AbsCov-Ten Thousand Isla', 'SOP8-2-AbsCov-Ten Thousand Is~2', 'SOP8-2-AbsCov-Shark Slough', 'SOP8-2-AbsCov-SHARK SLOUGH~2']
@@ -0,0 +1,75 @@
+#Benchmark tests of the report stages - run with 'python -m pytest' from the repository folder. The stages of 'benchmark_Pipeline' are timed with the
+#pytest-benchmark 'benchmark' fixture on synthetic sqlite databases ('generate_SyntheticDatabase'), the tests are skipped when pytest-benchmark is not installed.
+#The 'benchmark' command line option of the script remains the scaling/regression report
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import SFCN_MangroveMarsh_Tables_Figures_Script as mm
+
+#Minimum throughput (input rows per second) of each stage - an order of magnitude below the 1x timings, catches a stage falling back to row by row processing
+minRowsPerSecond = {'SummarizeFigure8_1': 1500, 'calc_CI': 2000, 'defineRecords_VegCoverByPointAbsolute': 5000, 'export_Workbook': 300, 'figure_CoverByStratum': 5}
+
+
+#pytest-benchmark 'benchmark' fixture - the test is skipped when the plugin is not installed (or disabled with '-p no:benchmark')
+@pytest.fixture
+def stageBenchmark(request):
+
+    try:
+        return request.getfixturevalue('benchmark')
+    except pytest.FixtureLookupError:
+        pytest.skip("pytest-benchmark is not installed")
+
+
+#Stages of the 1x benchmark dataset (about one annual SFCN dataset) - built once for the module
+@pytest.fixture(scope='module')
+def benchmarkStages(tmp_path_factory):
+
+    benchmarkDir = str(tmp_path_factory.mktemp("benchmark"))
+    syntheticDB = os.path.join(benchmarkDir, "MangroveMarsh_Synthetic_1x.sqlite")
+    assert mm.generate_SyntheticDatabase(syntheticDB, **mm.benchmarkDataset)[0] == "success function"
+    outVal = mm.define_BenchmarkStages(syntheticDB, benchmarkDir, "1x")
+    assert outVal[0] == "success function"
+
+    return {stageName: (rowsIn, stageFunction) for stageName, rowsIn, stageFunction in outVal[1]}
+
+
+@pytest.mark.parametrize('stageName', list(minRowsPerSecond))
+def test_BenchmarkStage(stageBenchmark, benchmarkStages, stageName):
+
+    benchmark = stageBenchmark
+    rowsIn, stageFunction = benchmarkStages[stageName]
+    benchmark.group = 'report stages 1x'
+    benchmark.extra_info['rowsIn'] = rowsIn
+    outVal = benchmark.pedantic(stageFunction, rounds=mm.benchmarkRepeats, iterations=1, warmup_rounds=1)
+
+    status = outVal[0] if isinstance(outVal, tuple) else outVal
+    assert status == "success function"
+    if benchmark.disabled:
+        return
+    rowsPerSecond = rowsIn / benchmark.stats.stats.min
+    benchmark.extra_info['rowsPerSecond'] = rowsPerSecond
+    assert rowsPerSecond >= minRowsPerSecond[stageName]
+
+
+#The benchmark command exports a timing record per scale and stage with the scaling exponent, and fails against a baseline the stages are slower than
+def test_benchmark_Pipeline(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(mm, 'workspace', str(tmp_path / "workspace"))
+    monkeypatch.setattr(mm, 'outputDir', str(tmp_path))
+    monkeypatch.setattr(mm, 'benchmarkDataset', {'regionCount': 2, 'segmentsPerRegion': 2, 'pointsPerSegment': 3, 'yearList': [2020], 'speciesCount': 10})
+
+    assert mm.benchmark_Pipeline([1, 2], 1) == "success function"
+    benchCSV = str(tmp_path / ("MangroveMarsh_Benchmark_" + mm.dateString + ".csv"))
+    benchDF = pd.read_csv(benchCSV)
+    assert len(benchDF) == 2 * len(minRowsPerSecond) and set(benchDF['stage']) == set(minRowsPerSecond)
+    assert (benchDF.groupby('stage')['rowsIn'].agg(lambda rows: rows.iloc[1] > rows.iloc[0])).all()
+    assert benchDF['scalingExponent'].notna().all()
+
+    baselineDF = benchDF.assign(bestSeconds=benchDF['bestSeconds'] / 1000)
+    baselineDF.to_csv(str(tmp_path / "baseline.csv"), index=False)
+    assert mm.benchmark_Pipeline([1, 2], 1, str(tmp_path / "baseline.csv"), 1.5).startswith("Failed function - 'benchmark_Pipeline' - regression")